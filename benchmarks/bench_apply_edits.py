@@ -0,0 +1,90 @@
+"""
+Benchmark applying byte-range edits to multi-megabyte synthetic sources.
+
+Compares `remusing_cpp.edits.apply_edits` with the previous strategy of
+growing an immutable `bytes` object with `+=` and decoding/encoding every
+unchanged span. Run with:
+
+    python benchmarks/bench_apply_edits.py
+"""
+import argparse
+import time
+from typing import Callable, List
+
+from remusing_cpp.edits import Edit, apply_edits
+
+LINE = b"string s; vector<int> v; map<string, int> m;\n"
+
+
+def make_input(size: int) -> bytes:
+    """
+    Build a synthetic source of roughly `size` bytes.
+    """
+    return LINE * max(1, size // len(LINE))
+
+
+def make_edits(src: bytes) -> List[Edit]:
+    """
+    Insert a `std::` qualification before every `string`, `vector` and `map`.
+    """
+    edits = []
+    for line_start in range(0, len(src), len(LINE)):
+        for offset in (0, 10, 35):
+            edits.append(Edit(line_start + offset, line_start + offset, b"std::"))
+    return edits
+
+
+def concat_edits(src: bytes, edits: List[Edit]) -> bytes:
+    """
+    The previous output assembly strategy in `RemUsing.fix`.
+    """
+    output = b""
+    pos = 0
+    for start, end, replacement, _ in edits:
+        start_txt = src[pos:start].decode("utf8")
+        output += f"{start_txt}{replacement.decode('utf8')}".encode()
+        pos = end
+    output += src[pos:]
+    return output
+
+
+def best_of(func: Callable[[], bytes], repeat: int) -> float:
+    """
+    Best wall time of `repeat` runs of `func`.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    """
+    Run the benchmark and print a table of timings.
+    """
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 2, 4, 8])
+    argparser.add_argument("--repeat", type=int, default=3)
+    argparser.add_argument(
+        "--concat-max-mb", type=int, default=2, help="Largest size to run the slow baseline on"
+    )
+    args = argparser.parse_args()
+
+    print(f"{'size (MB)':>10} {'edits':>10} {'apply_edits (s)':>16} {'ns/byte':>8} {'+= (s)':>10}")
+    for size_mb in args.sizes_mb:
+        src = make_input(size_mb << 20)
+        edits = make_edits(src)
+        expected = apply_edits(src, edits)
+        fast = best_of(lambda: apply_edits(src, edits), args.repeat)
+        slow = "-"
+        if size_mb <= args.concat_max_mb:
+            assert concat_edits(src, edits) == expected
+            slow = f"{best_of(lambda: concat_edits(src, edits), 1):.3f}"
+        ns_per_byte = fast * 1e9 / len(src)
+        print(f"{size_mb:>10} {len(edits):>10} {fast:>16.4f} {ns_per_byte:>8.2f} {slow:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark collecting tree-sitter captures and computing the fixup spans on
+large synthetic headers.
+
+Compares the columnar `remusing_cpp.captures.CaptureStore` with the previous
+strategy of wrapping every capture in a `HashableTreeNode`, keeping per-name
+sets and sorting the unions by tree-sitter points. The query itself is run
+once up-front over the whole source and excluded from the timings. Run with:
+
+    python benchmarks/bench_captures.py
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from tree_sitter import Node
+
+from remusing_cpp.captures import CaptureStore, difference, union
+from remusing_cpp.core import RemUsing
+from remusing_cpp.ts_model import HashableTreeNode
+from remusing_cpp.util import build_cpp_parser
+
+TS_SOURCE = os.path.join(
+    Path(__file__).resolve().parent.parent, "remusing_cpp", "vendor", "tree-sitter-cpp"
+)
+
+LINES = b"""using std::vector;
+using namespace std;
+string s; vector<int> v; map<string, int> m;
+std::map<string, keep::vector<int>> t;
+int f() { cout << hex << 3; return min(1, 2); }
+"""
+
+
+def make_input(size: int) -> bytes:
+    """
+    Build a synthetic header of roughly `size` bytes.
+    """
+    return LINES * max(1, size // len(LINES))
+
+
+def sets_path(remusing: RemUsing, captures: List[Tuple[Node, str]]) -> List[Any]:
+    """
+    The previous capture processing in `RemUsing.process_captures` and
+    `RemUsing.edits`.
+    """
+    lookup: Dict[str, Set[HashableTreeNode]] = {}
+    for node, name in captures:
+        lookup.setdefault(name, set()).add(HashableTreeNode(node))
+    types, symbols, using = remusing.types_query, remusing.symbols_query, remusing.using_query
+    unqualified = sorted(
+        set.union(
+            lookup.get(types.TYPE_ALL_CAPTURE, set()).difference(
+                set.union(
+                    lookup.get(types.TYPE_QUAL_CAPTURE, set()),
+                    lookup.get(types.TYPE_QUAL_TEMPLATE_CAPTURE, set()),
+                )
+            ),
+            lookup.get(symbols.SYMBOL_CAPTURE, set()),
+            lookup.get(symbols.SYMBOL_FUNC_CAPTURE, set()),
+        )
+    )
+    return sorted(
+        set.union(
+            set(unqualified),
+            lookup.get(using.USING_DECL_CAPTURE, set()),
+            lookup.get(using.USING_NS_DECL_CAPTURE, set()),
+        )
+    )
+
+
+def store_path(remusing: RemUsing, captures: List[Tuple[Node, str]]) -> Any:
+    """
+    The columnar capture processing.
+    """
+    store = CaptureStore()
+    store.extend(captures)
+    types, symbols, using = remusing.types_query, remusing.symbols_query, remusing.using_query
+    unqualified = union(
+        difference(
+            store.spans(types.TYPE_ALL_CAPTURE),
+            union(
+                store.spans(types.TYPE_QUAL_CAPTURE),
+                store.spans(types.TYPE_QUAL_TEMPLATE_CAPTURE),
+            ),
+        ),
+        store.spans(symbols.SYMBOL_CAPTURE),
+        store.spans(symbols.SYMBOL_FUNC_CAPTURE),
+    )
+    return union(
+        unqualified,
+        store.spans(using.USING_DECL_CAPTURE),
+        store.spans(using.USING_NS_DECL_CAPTURE),
+    )
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Tuple[float, int, Any]:
+    """
+    Best wall time of `repeat` runs of `func`, and the peak memory allocated
+    while running it once.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+def main() -> None:
+    """
+    Run the benchmark and print a table of timings and peak memory.
+    """
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--sizes-kb", type=int, nargs="+", default=[64, 256, 1024])
+    argparser.add_argument("--repeat", type=int, default=3)
+    argparser.add_argument("-t", "--ts-source", default=TS_SOURCE)
+    argparser.add_argument("-s", "--ts-out", default="/tmp/ts_cpp_language")
+    args = argparser.parse_args()
+
+    parser, language = build_cpp_parser(args.ts_source, args.ts_out)
+    print(
+        f"{'size (KB)':>10} {'captures':>10} {'sets (s)':>10} {'sets (MB)':>10} "
+        f"{'store (s)':>10} {'store (MB)':>10}"
+    )
+    for size_kb in args.sizes_kb:
+        remusing = RemUsing(make_input(size_kb << 10), parser, language)
+        remusing.query()
+        assert remusing.compiled_query is not None and remusing._tree is not None
+        captures = remusing.compiled_query.captures(remusing._tree.root_node)
+
+        sets_time, sets_peak, sets_result = measure(
+            lambda: sets_path(remusing, captures), args.repeat
+        )
+        store_time, store_peak, store_result = measure(
+            lambda: store_path(remusing, captures), args.repeat
+        )
+        assert [node.node.start_byte << 32 | node.node.end_byte for node in sets_result] == list(
+            store_result
+        )
+        print(
+            f"{size_kb:>10} {len(captures):>10} {sets_time:>10.3f} {sets_peak / 2**20:>10.1f} "
+            f"{store_time:>10.3f} {store_peak / 2**20:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
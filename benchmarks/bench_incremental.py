@@ -0,0 +1,97 @@
+"""
+Benchmark `RemUsing.apply_text_edit` on multi-megabyte synthetic headers.
+
+Compares the full analysis of a source with an edit in its middle. Apart
+from the reparse by tree-sitter, whose cost depends on the grammar, the
+update should take about the same time whatever the size of the source. The
+edits are listed anew after each change, which takes time linear in their
+number. Run with:
+
+    python benchmarks/bench_incremental.py
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from tree_sitter import Parser
+
+from remusing_cpp.core import RemUsing
+from remusing_cpp.stats import RemUsingStats
+from remusing_cpp.util import build_cpp_language
+
+HEADER = b"#pragma once\nusing std::string;\nusing namespace std;\nnamespace project {\n"
+LINE = b"string s; vector<int> v; map<string, int> m; void f() { cout << endl; }\n"
+FOOTER = b"}  // namespace project\n"
+CPP_TREE_SITTER_PATH = os.path.join(
+    Path(__file__).resolve().parent.parent, "remusing_cpp", "vendor", "tree-sitter-cpp"
+)
+
+
+def make_input(size: int) -> bytes:
+    """
+    Build a synthetic header of roughly `size` bytes, wrapped in a namespace.
+    """
+    return HEADER + LINE * max(1, size // len(LINE)) + FOOTER
+
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    """
+    Best wall time of `repeat` runs of `func`.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    """
+    Run the benchmark and print a table of timings.
+    """
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 2, 4, 8])
+    argparser.add_argument("--repeat", type=int, default=5)
+    args = argparser.parse_args()
+
+    language = build_cpp_language(
+        CPP_TREE_SITTER_PATH, os.path.join(tempfile.gettempdir(), "ts_cpp_language")
+    )
+    parser = Parser()
+    parser.set_language(language)
+
+    print(
+        f"{'size (MB)':>10} {'full (s)':>10} {'reparse (ms)':>13} {'update (ms)':>12}"
+        f" {'edits() (ms)':>13}"
+    )
+    for size_mb in args.sizes_mb:
+        src = make_input(size_mb << 20)
+        remusing = RemUsing(src, parser, language)
+        start = time.perf_counter()
+        remusing.edits()
+        full = time.perf_counter() - start
+
+        # Type into a line in the middle of the file and undo it. The stats
+        # split the tree-sitter reparse from the update of the analysis.
+        middle = src.index(LINE, len(src) // 2)
+        text = b"list<int> l; "
+        remusing.apply_text_edit(middle, middle, text)
+        remusing.apply_text_edit(middle, middle + len(text), b"")
+        stats = remusing.stats = RemUsingStats()
+        for _ in range(args.repeat):
+            remusing.apply_text_edit(middle, middle, text)
+            remusing.apply_text_edit(middle, middle + len(text), b"")
+        seconds = stats.stage_seconds
+        per_edit = 1e3 / (2 * args.repeat)
+        reparse = seconds["parse"] * per_edit
+        update = (seconds["query"] + seconds["edits"]) * per_edit
+        edits = best_of(remusing.edits, 1) * 1e3
+        print(f"{size_mb:>10} {full:>10.3f} {reparse:>13.2f} {update:>12.2f} {edits:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
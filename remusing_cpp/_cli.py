@@ -1,17 +1,195 @@
 """
 The `remusing_cpp` entrypoint.
+
+Only the modules that the argument parsers need are imported up-front. The
+tree-sitter parts are imported once a command needs them, so that `--help`,
+`--init` and the git modes without changes start quickly.
 """
 
 import argparse
+import json
 import locale
 import os
 import sys
 import tempfile
+from contextlib import ExitStack, nullcontext
+from itertools import chain, islice
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from remusing_cpp.cache import DEFAULT_MAX_BYTES
+from remusing_cpp.discover import DEFAULT_EXCLUDES, EXTENSION_SETS, parse_extensions
+from remusing_cpp.edits import SourceBytes, apply_edits, write_edits
+from remusing_cpp.executor import BACKENDS, PROCESS_BACKEND, ProgressReporter
+from remusing_cpp.stats import RemUsingStats
+from remusing_cpp.util import (
+    PREBUILT_GRAMMAR,
+    atomic_open,
+    build_cpp_parser,
+    ensure_cpp_language,
+    open_source,
+    prebuilt_grammar_available,
+)
+
+if TYPE_CHECKING:
+    from remusing_cpp.batch import BatchReport, FileResult
+    from remusing_cpp.server import FixClient
+
+T = TypeVar("T")
+
+SERVER_CHUNK = 32
+"""
+Files to send to a server per `fix_files` request, so that every response
+arrives well within the client timeout
+"""
+
+
+def line_range(text: str) -> Tuple[int, int]:
+    """
+    Parse a line range argument.
+
+    Arguments:
+        text: `FIRST:LAST` or a single line, starting at 1
+
+    Returns:
+        The first and the last line (inclusive)
+    """
+    first, _, last = text.partition(":")
+    try:
+        lines = int(first), int(last or first)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Not a line range: {text}") from None
+    if not 1 <= lines[0] <= lines[1]:
+        raise argparse.ArgumentTypeError(f"Not a line range: {text}")
+    return lines
+
+
+def positive_int(text: str) -> int:
+    """
+    Parse a count argument that must be at least 1.
+
+    Arguments:
+        text: The number
+
+    Returns:
+        The number
+    """
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Not a number: {text}") from None
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"Must be at least 1: {text}")
+    return value
+
+
+def add_discover_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the options that select the files of the directories to process.
+
+    Arguments:
+        parser: The parser to extend
+    """
+    parser.add_argument(
+        "--extensions",
+        type=parse_extensions,
+        default=EXTENSION_SETS["default"],
+        metavar="EXT[,EXT...]",
+        help=(
+            "Comma-separated file extensions to select in directories, or the sets "
+            f"{', '.join(repr(name) for name in EXTENSION_SETS)} (default: 'default')"
+        ),
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help=(
+            "Skip the files and directories matching this .gitignore-style pattern when "
+            "walking directories, may be repeated"
+        ),
+    )
+    parser.add_argument(
+        "--no-ignore",
+        dest="ignore",
+        action="store_false",
+        help=(
+            "Walk directories without the .gitignore files and without skipping hidden and "
+            f"vendored directories ({', '.join(DEFAULT_EXCLUDES)})"
+        ),
+    )
+    parser.add_argument(
+        "--order",
+        choices=["size", "walk"],
+        default="size",
+        help=(
+            "Process the largest files first, for a better balance between the workers, or "
+            "in the order in which they are found (default: %(default)s)"
+        ),
+    )
+
+
+def add_symbol_map_argument(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the option that loads symbol map files.
+
+    Arguments:
+        parser: The parser to extend
+    """
+    parser.add_argument(
+        "--symbol-map",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help=(
+            "Symbol map file with a qualified name per line, e.g. 'boost::asio::io_context', "
+            "or compiled with '--compile-symbol-map'. May be repeated, earlier maps take "
+            "precedence, and all of them over the builtin std map"
+        ),
+    )
+
+
+def load_symbol_maps(args: argparse.Namespace) -> bool:
+    """
+    Load the symbol map files up-front, so that errors are reported before
+    any work starts. They stay cached for the rest of the process.
+
+    Arguments:
+        args: The CLI arguments, see `add_symbol_map_argument`
+
+    Returns:
+        Whether all maps could be loaded
+    """
+    from remusing_cpp.symbols import SymbolMapError, layered_namespace_map
+
+    try:
+        layered_namespace_map(args.symbol_map)
+    except SymbolMapError as e:
+        print(f"symbol map: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def discover_inputs(args: argparse.Namespace) -> Iterator[str]:
+    """
+    Lazily expand the path arguments into the files to process.
 
-from remusing_cpp.core import RemUsing
-from remusing_cpp.util import build_cpp_parser
+    Arguments:
+        args: The CLI arguments, see `add_discover_arguments`
+
+    Returns:
+        An iterator over the files
+    """
+    from remusing_cpp.discover import DEFAULT_SORT_WINDOW, discover_paths
+
+    return discover_paths(
+        args.paths,
+        args.extensions,
+        [*DEFAULT_EXCLUDES, *args.exclude] if args.ignore else args.exclude,
+        ignore_files=args.ignore,
+        sort_window=DEFAULT_SORT_WINDOW if args.order == "size" else 0,
+    )
 
 
 def build_argparser() -> argparse.ArgumentParser:
@@ -25,40 +203,649 @@ def build_argparser() -> argparse.ArgumentParser:
         description="Remove and refactor 'using' declarations in C++ files",
     )
     parser.add_argument(
-        "infile",
-        help="C++ file input (default: stdin)",
-        nargs="?",
-        type=argparse.FileType("rb"),
-        default=(None if sys.stdin.isatty() else sys.stdin),
+        "paths",
+        help=(
+            "C++ file input (default: stdin) and optional refactored C++ file output "
+            "(default: stdout), '-' stands for stdin or stdout. With '--in-place', any "
+            "number of files, directories and glob patterns to fix"
+        ),
+        nargs="*",
+        metavar="path",
+    )
+    parser.add_argument(
+        "-i", "--in-place", action="store_true", help="Overwrite input file(s) with changes"
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help=(
+            "Print a line for each file and a summary in in-place mode also when fixing a "
+            "single file, which is silent otherwise"
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        help="Number of workers for in-place batch mode (default: %(default)s)",
+        default=os.cpu_count() or 1,
     )
     parser.add_argument(
-        "outfile",
-        help="Refactored C++ file output (default: stdout)",
-        nargs="?",
-        type=argparse.FileType("wb"),
-        default=sys.stdout,
+        "--backend",
+        choices=BACKENDS,
+        default=PROCESS_BACKEND,
+        help=(
+            "Run the batch mode workers as processes or as threads with their own "
+            "parser (default: %(default)s)"
+        ),
     )
     parser.add_argument(
-        "-i", "--in-place", action="store_true", help="Overwrite input file with changes"
+        "-f",
+        "--format",
+        choices=["source", "json", "diff"],
+        default="source",
+        help=(
+            "Output the refactored source, the list of edits as JSON or a unified diff "
+            "(default: %(default)s)"
+        ),
     )
     parser.add_argument(
         "-t",
         "--ts-source",
         type=str,
-        help="Tree-sitter C++ source code repo directory (default: %(default)s)",
-        default=os.path.join(Path(__file__).resolve().parent, "vendor", "tree-sitter-cpp"),
+        help=(
+            f"Tree-sitter C++ source code repo directory to build the grammar from, or "
+            f"'{PREBUILT_GRAMMAR}' for the grammar of the installed tree_sitter_cpp "
+            f"package (default: %(default)s)"
+        ),
+        default=(
+            PREBUILT_GRAMMAR
+            if prebuilt_grammar_available()
+            else os.path.join(Path(__file__).resolve().parent, "vendor", "tree-sitter-cpp")
+        ),
     )
     parser.add_argument(
         "-s",
         "--ts-out",
         type=str,
-        help="Tree-sitter language output file (default: %(default)s)",
+        help=(
+            "Tree-sitter language output base path. The built library is cached "
+            "next to it under the grammar's source hash (default: %(default)s)"
+        ),
         default=os.path.join(tempfile.gettempdir(), "ts_cpp_language"),
     )
+    parser.add_argument(
+        "--server",
+        type=str,
+        help=(
+            "Send the work to a 'remusing_cpp serve' process listening on this Unix "
+            "socket, falling back to local processing if it is not reachable. A single "
+            "file that is not fixed in-place is also processed locally if the server fails. "
+            "'--index', '--cache-dir', '--no-prefilter' and '--stats' cannot be used with a "
+            "server, and '--lines', '--symbol-map' and '--staged' always process locally "
+            "(default: $REMUSING_CPP_SERVER)"
+        ),
+        default=os.environ.get("REMUSING_CPP_SERVER"),
+    )
+    parser.add_argument(
+        "--index",
+        type=str,
+        help=(
+            "SQLite symbol index of the project. It is updated with the input files and "
+            "resolves names declared in other project files (not with a server)"
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help=(
+            "Directory of a persistent result cache for in-place mode. Unchanged files "
+            "are not parsed again"
+        ),
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help="Size limit of the result cache in MiB (default: %(default)s)",
+        default=DEFAULT_MAX_BYTES >> 20,
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        dest="prefilter",
+        action="store_false",
+        help=(
+            "Parse every file in batch mode, even if it contains neither 'using' nor a "
+            "known symbol name"
+        ),
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help=(
+            "Print stage timings and counters as JSON to stderr, aggregated across all "
+            "files (not with a server)"
+        ),
+    )
+    parser.add_argument(
+        "--changed-since",
+        type=str,
+        metavar="REV",
+        help=(
+            "Fix in-place only the C/C++ files that were added or modified since this git "
+            "revision, and untracked ones. The paths restrict the files as git pathspecs"
+        ),
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help=(
+            "Fix the staged contents of the C/C++ files that are staged for commit and "
+            "stage the result. The paths restrict the files as git pathspecs"
+        ),
+    )
+    parser.add_argument(
+        "--unordered",
+        dest="ordered",
+        action="store_false",
+        help="Report the files of a batch run as they are done instead of in input order",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print the progress and throughput of a batch run to stderr",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        help="Write the counters and failures of a batch run as JSON to this file",
+    )
+    parser.add_argument(
+        "--lines",
+        type=line_range,
+        action="append",
+        metavar="FIRST:LAST",
+        help=(
+            "Only fix within these lines of a single file, e.g. a diff hunk, may be repeated. "
+            "The 'using' declarations outside of them still resolve names, but are kept "
+            "(only for local processing)"
+        ),
+    )
     parser.add_argument("--init", action="store_true", help="Initialize tree-sitter library only")
+    add_symbol_map_argument(parser)
+    parser.add_argument(
+        "--compile-symbol-map",
+        type=str,
+        metavar="OUT",
+        help=(
+            "Merge the '--symbol-map' files into a compiled map that loads without parsing, "
+            "write it to this file and exit. Compiled maps are pickles, only load trusted ones"
+        ),
+    )
+    add_discover_arguments(parser)
+    return parser
+
+
+def build_serve_argparser() -> argparse.ArgumentParser:
+    """
+    Build a CLI argument parser for the `serve` subcommand.
+
+    Returns:
+        A parser that can handle the `serve` arguments.
+    """
+    defaults = build_argparser()
+    parser = argparse.ArgumentParser(
+        prog="remusing_cpp serve",
+        description=(
+            "Answer JSON-RPC fix requests (one JSON message per line) with a warm "
+            "tree-sitter parser"
+        ),
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help=(
+            "Listen on this Unix socket instead of stdin/stdout. A socket left behind by a "
+            "server that did not shut down is replaced"
+        ),
+    )
+    parser.add_argument(
+        "-t",
+        "--ts-source",
+        type=str,
+        help="Tree-sitter C++ source code repo directory (default: %(default)s)",
+        default=defaults.get_default("ts_source"),
+    )
+    parser.add_argument(
+        "-s",
+        "--ts-out",
+        type=str,
+        help="Tree-sitter language output base path (default: %(default)s)",
+        default=defaults.get_default("ts_out"),
+    )
+    add_symbol_map_argument(parser)
+    return parser
+
+
+def serve(argv: List[str]) -> int:
+    """
+    Entry-point for the `serve` subcommand.
+
+    Arguments:
+        argv: Argument list to process
+
+    Returns:
+        Exit code
+    """
+    from remusing_cpp.server import FixServer
+
+    args = build_serve_argparser().parse_args(argv)
+    if not load_symbol_maps(args):
+        return 1
+    server = FixServer(ensure_cpp_language(args.ts_source, args.ts_out), args.symbol_map)
+    if args.socket is None:
+        server.serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+    else:
+        try:
+            server.serve_unix(args.socket)
+        except FileExistsError as e:
+            print(f"Cannot listen on {args.socket}: {e.strerror}", file=sys.stderr)
+            return 1
+    return 0
+
+
+def build_scan_argparser() -> argparse.ArgumentParser:
+    """
+    Build a CLI argument parser for the `scan` subcommand.
+
+    Returns:
+        A parser that can handle the `scan` arguments.
+    """
+    defaults = build_argparser()
+    parser = argparse.ArgumentParser(
+        prog="remusing_cpp scan",
+        description=(
+            "Count the 'using' declarations and the unqualified symbols that a fix would "
+            "qualify, without changing any file"
+        ),
+    )
+    parser.add_argument(
+        "paths",
+        help="Files, directories and glob patterns to scan",
+        nargs="+",
+        metavar="path",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["json", "csv"],
+        default="json",
+        help=(
+            "Output the totals and the files with findings as JSON, or the files with "
+            "findings as CSV (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--locations",
+        action="store_true",
+        help="List every finding with its line and column, a CSV row each",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="Write the report to this file (default: stdout)"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        help="Number of workers (default: %(default)s)",
+        default=defaults.get_default("jobs"),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=PROCESS_BACKEND,
+        help="Run the workers as processes or as threads (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--index",
+        type=str,
+        help=(
+            "SQLite symbol index of the project. It is updated with the scanned files and "
+            "resolves names declared in other project files"
+        ),
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        dest="prefilter",
+        action="store_false",
+        help="Parse every file, even if it contains neither 'using' nor a known symbol name",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print the progress and throughput of the scan to stderr",
+    )
+    parser.add_argument(
+        "-t",
+        "--ts-source",
+        type=str,
+        help="Tree-sitter C++ source code repo directory (default: %(default)s)",
+        default=defaults.get_default("ts_source"),
+    )
+    parser.add_argument(
+        "-s",
+        "--ts-out",
+        type=str,
+        help="Tree-sitter language output base path (default: %(default)s)",
+        default=defaults.get_default("ts_out"),
+    )
+    add_symbol_map_argument(parser)
+    add_discover_arguments(parser)
     return parser
 
 
+def scan(argv: List[str]) -> int:
+    """
+    Entry-point for the `scan` subcommand.
+
+    Arguments:
+        argv: Argument list to process
+
+    Returns:
+        Exit code
+    """
+    from remusing_cpp.batch import ScanReport, iter_scan
+
+    args = build_scan_argparser().parse_args(argv)
+    if not load_symbol_maps(args):
+        return 1
+    paths: Iterable[str] = discover_inputs(args)
+    index_map = None
+    if args.index is not None:
+        # The index needs all files up-front, otherwise the scan starts right away
+        files = list(paths)
+        index_map = load_index(args, files)
+        paths = files
+    results = iter_scan(
+        paths,
+        args.ts_source,
+        args.ts_out,
+        args.locations,
+        jobs=args.jobs,
+        index_namespace_map=index_map,
+        prefilter=args.prefilter,
+        backend=args.backend,
+        on_progress=ProgressReporter() if args.progress else None,
+        symbol_maps=args.symbol_map,
+    )
+    report = ScanReport()
+    for result in results:
+        report.add(result)
+    with ExitStack() as stack:
+        if args.output is None:
+            out = sys.stdout
+        else:
+            out = stack.enter_context(open(args.output, "w", encoding="utf8", newline=""))
+        if args.format == "csv":
+            report.write_csv(out, args.locations)
+        else:
+            out.write(json.dumps(report.as_json(), indent=2) + "\n")
+    for path, error in report.failures:
+        print(f"error: {path}: {error}", file=sys.stderr)
+    return 1 if report.failures else 0
+
+
+def build_bench_argparser() -> argparse.ArgumentParser:
+    """
+    Build a CLI argument parser for the `bench` subcommand.
+
+    Returns:
+        A parser that can handle the `bench` arguments.
+    """
+    from remusing_cpp.core import ENGINES, QUERY_ENGINE
+
+    defaults = build_argparser()
+    parser = argparse.ArgumentParser(
+        prog="remusing_cpp bench",
+        description=(
+            "Time the parse, query, process_captures and fix stages on generated or "
+            "given C++ sources"
+        ),
+    )
+    parser.add_argument(
+        "paths",
+        help="Files, directories and glob patterns to benchmark instead of a generated corpus",
+        nargs="*",
+        metavar="path",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        help="Number of generated sources (default: %(default)s)",
+        default=20,
+    )
+    parser.add_argument(
+        "--size-kb",
+        type=int,
+        help="Size of each generated source in KiB (default: %(default)s)",
+        default=64,
+    )
+    parser.add_argument(
+        "--density",
+        type=float,
+        help="Share of generated lines that need fixups, 0 to 1 (default: %(default)s)",
+        default=0.5,
+    )
+    parser.add_argument(
+        "--seed", type=int, help="Seed of the generated corpus (default: %(default)s)", default=0
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        help="Runs per source, the fastest run of each stage counts (default: %(default)s)",
+        default=3,
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=QUERY_ENGINE,
+        help="How to collect the captures (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--scaling",
+        type=str,
+        metavar="JOBS",
+        help=(
+            "Instead of the stages, time whole batch runs with each backend and each "
+            "of these comma-separated worker counts, e.g. '1,2,4,8'"
+        ),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        action="append",
+        help="Backend to time with '--scaling', may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help=(
+            "Instead of the stages, time the imports of the CLI with 'python -X importtime', "
+            "the fastest of '--repeat' fresh interpreters counts"
+        ),
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument(
+        "-t",
+        "--ts-source",
+        type=str,
+        help="Tree-sitter C++ source code repo directory (default: %(default)s)",
+        default=defaults.get_default("ts_source"),
+    )
+    parser.add_argument(
+        "-s",
+        "--ts-out",
+        type=str,
+        help="Tree-sitter language output base path (default: %(default)s)",
+        default=defaults.get_default("ts_out"),
+    )
+    return parser
+
+
+def bench(argv: List[str]) -> int:
+    """
+    Entry-point for the `bench` subcommand.
+
+    Arguments:
+        argv: Argument list to process
+
+    Returns:
+        Exit code
+    """
+    from remusing_cpp.batch import expand_paths
+    from remusing_cpp.bench import (
+        STARTUP_MODULE,
+        format_result,
+        format_scaling,
+        format_startup,
+        generate_corpus,
+        run_bench,
+        time_scaling,
+        time_startup,
+    )
+
+    args = build_bench_argparser().parse_args(argv)
+    if args.startup:
+        times = time_startup(STARTUP_MODULE, args.repeat)
+        if args.json:
+            rows = {name: {"self_us": s, "cumulative_us": c} for name, (s, c) in times.items()}
+            print(json.dumps(rows, indent=2))
+        else:
+            sys.stdout.write(format_startup(times, STARTUP_MODULE))
+        return 0
+    if args.paths:
+        sources: List[bytes] = []
+        for path in expand_paths(args.paths):
+            with open(path, "rb") as f:
+                sources.append(f.read())
+    else:
+        corpus = generate_corpus(args.files, args.size_kb << 10, args.density, args.seed)
+        sources = list(corpus.values())
+    if args.scaling:
+        jobs = [int(n) for n in args.scaling.split(",")]
+        named = {f"src_{i:05d}.cpp": src for i, src in enumerate(sources)}
+        timings = time_scaling(named, args.ts_source, args.ts_out, args.backend or BACKENDS, jobs)
+        if args.json:
+            rows = [{"backend": b, "jobs": n, "seconds": t} for b, n, t in timings]
+            print(json.dumps(rows, indent=2))
+        else:
+            sys.stdout.write(format_scaling(timings, len(sources)))
+        return 0
+    parser, language = build_cpp_parser(args.ts_source, args.ts_out)
+    result = run_bench(sources, parser, language, args.repeat, args.engine)
+    if args.json:
+        print(json.dumps(result.as_json(), indent=2))
+    else:
+        sys.stdout.write(format_result(result))
+    return 0
+
+
+def connect(socket_path: Optional[str]) -> Optional["FixClient"]:
+    """
+    Connect to a running server, if there is one.
+
+    Arguments:
+        socket_path: Path of the server's Unix socket
+
+    Returns:
+        A connected client, or `None` to process locally
+    """
+    if not socket_path:
+        return None
+    from remusing_cpp.server import FixClient
+
+    try:
+        return FixClient(socket_path)
+    except OSError as e:
+        print(f"Server not reachable, processing locally: {e}", file=sys.stderr)
+        return None
+
+
+def call_server(client: "FixClient", call: Callable[[], T]) -> Optional[T]:
+    """
+    Send the work to the server and close the connection.
+
+    Arguments:
+        client: The connected client
+        call: Sends the request and returns its result
+
+    Returns:
+        The result, or `None` if the server failed or did not answer in time
+        and the work has to be done locally
+    """
+    from remusing_cpp.server import RpcError
+
+    try:
+        with client:
+            return call()
+    except (OSError, RpcError) as e:
+        print(f"Server failed, processing locally: {e}", file=sys.stderr)
+        return None
+
+
+def fix_remote(client: "FixClient", paths: Iterable[str]) -> Iterator["FileResult"]:
+    """
+    Fix files in-place on the server, a chunk of `SERVER_CHUNK` files per
+    request, and close the connection.
+
+    Once a request was sent, the server may still be rewriting its files, so a
+    failure is reported for the files without a result instead of fixing them
+    locally.
+
+    Arguments:
+        client: The connected client
+        paths: Files to fix
+
+    Returns:
+        The per-file results, as they are answered
+    """
+    from remusing_cpp.batch import FileResult
+    from remusing_cpp.server import RpcError
+
+    pending = iter(paths)
+    with client:
+        for chunk in iter(lambda: list(islice(pending, SERVER_CHUNK)), []):
+            try:
+                results = client.fix_files(list(map(os.path.abspath, chunk)))
+            except (OSError, RpcError) as e:
+                error = f"Server failed: {e}"
+                yield from (FileResult(path, error=error) for path in chain(chunk, pending))
+                return
+            for result, path in zip(results, chunk):
+                result.path = path
+                yield result
+
+
+def unsupported_server_options(args: argparse.Namespace) -> List[str]:
+    """
+    List the given options that a server cannot apply, since it processes
+    the files with its own configuration.
+
+    Arguments:
+        args: The validated CLI arguments
+
+    Returns:
+        The names of the options
+    """
+    options = {
+        "--index": args.index is not None,
+        "--cache-dir": args.cache_dir is not None,
+        "--no-prefilter": not args.prefilter,
+        "--stats": args.stats,
+    }
+    return [name for name, given in options.items() if given]
+
+
 def validate_args(args: argparse.Namespace) -> bool:
     """
     Validate the arguments from the CLI. Sometimes there are incompatible
@@ -71,18 +858,116 @@ def validate_args(args: argparse.Namespace) -> bool:
     Returns:
         Whether the arguments are compatible or not.
     """
-    if args.in_place and args.outfile != sys.stdout:
-        print("Cannot have both 'in-place' option and outfile argument", file=sys.stderr)
-        return False
-    if args.in_place and args.infile == sys.stdin:
+    args.infile = None
+    args.outfile = None
+    if args.changed_since is not None or args.staged:
+        if args.changed_since is not None and args.staged:
+            print("Cannot use '--changed-since' together with '--staged'", file=sys.stderr)
+            return False
+        # Git modes fix the changed files in-place, the paths are pathspecs
+        args.in_place = True
+        if args.format != "source":
+            print("Cannot use the git options with a non-source format", file=sys.stderr)
+            return False
+        if args.lines:
+            print("Cannot use the 'lines' option with the git options", file=sys.stderr)
+            return False
+        return True
+    if args.in_place and not args.paths:
         # Cannot write in-place to stdin but this is silent
         args.in_place = False
+    if args.in_place:
+        if args.format != "source":
+            print("Cannot use the 'in-place' option with a non-source format", file=sys.stderr)
+            return False
+        if args.lines:
+            print("Cannot use the 'lines' option with the 'in-place' option", file=sys.stderr)
+            return False
+        # Batch mode: every path is an input
+        return True
+    if len(args.paths) > 2:
+        print("Multiple input files require the 'in-place' option", file=sys.stderr)
+        return False
+    if args.paths and args.paths[0] != "-":
+        args.infile = args.paths[0]
+        if not os.path.isfile(args.infile):
+            print(f"Input is not a file (did you mean '--in-place'?): {args.infile}")
+            return False
+    elif args.paths or not sys.stdin.isatty():
+        args.infile = sys.stdin
     if args.infile is None:
         print("Input file not specified!")
         return False
+    if len(args.paths) > 1 and args.paths[1] != "-":
+        args.outfile = args.paths[1]
     return True
 
 
+def load_index(args: argparse.Namespace, paths: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Update the symbol index with the input files and load its namespace map.
+
+    Arguments:
+        args: The validated CLI arguments
+        paths: The input files
+
+    Returns:
+        The namespace map of the index, or `None` if no index is used
+    """
+    if args.index is None:
+        return None
+    from remusing_cpp.index import SymbolIndex
+
+    with SymbolIndex(args.index) as index:
+        stats = index.update(paths, args.ts_source, args.ts_out, args.jobs)
+        print(
+            f"index: {stats.scanned} scanned, {stats.unchanged} unchanged, "
+            f"{stats.removed} removed, {stats.errors} error(s)",
+            file=sys.stderr,
+        )
+        return index.namespace_map()
+
+
+def print_stats(stats: RemUsingStats) -> None:
+    """
+    Print stats as JSON to stderr.
+
+    Arguments:
+        stats: The stats to print
+    """
+    print(json.dumps(stats.as_json(), indent=2), file=sys.stderr)
+
+
+def print_summary(results: Iterable["FileResult"], verbose: bool = True) -> "BatchReport":
+    """
+    Print a line for each file of a batch run as it is done, followed by a
+    summary. The failures are collected and printed to stderr at the end.
+
+    Arguments:
+        results: The per-file results of the batch run
+        verbose: Whether to print the lines and the summary, otherwise only
+            the failures are printed
+
+    Returns:
+        The report of the batch run
+    """
+    from remusing_cpp.batch import BatchReport
+
+    report = BatchReport()
+    for result in results:
+        report.add(result)
+        if verbose and result.error is None:
+            print(f"{'fixed' if result.changed else 'unchanged'}: {result.path}", flush=True)
+    if verbose:
+        print(
+            f"{report.files} file(s) processed: {report.changed} fixed, "
+            f"{report.unchanged} unchanged, {len(report.failures)} error(s)"
+        )
+    for path, error in report.failures:
+        print(f"error: {path}: {error}", file=sys.stderr)
+    return report
+
+
 def main(argv: List[str] = sys.argv[1:]) -> int:
     """
     Entry-point for the CLI entry-point.
@@ -93,39 +978,246 @@ def main(argv: List[str] = sys.argv[1:]) -> int:
     Returns:
         Exit code
     """
+    if argv[:1] == ["serve"]:
+        return serve(argv[1:])
+    if argv[:1] == ["bench"]:
+        return bench(argv[1:])
+    if argv[:1] == ["scan"]:
+        return scan(argv[1:])
+
     # --- Arg parsing
     argparser = build_argparser()
     args = argparser.parse_args(argv)
     if args.init:
+        if args.ts_source == PREBUILT_GRAMMAR:
+            print("Using the prebuilt tree-sitter library, nothing to build")
+            return 0
         print("Initializing tree-sitter library...")
         print(f"\tsource: {args.ts_source}")
-        print(f"\toutput: {args.ts_out}")
-        build_cpp_parser(args.ts_source, args.ts_out)
+        lib_path = ensure_cpp_language(args.ts_source, args.ts_out)
+        print(f"\toutput: {lib_path}")
         print("Built!")
         return 0
+    if args.compile_symbol_map is not None:
+        return compile_symbol_maps(args)
     if not validate_args(args):
         argparser.print_help(sys.stdout)
         return 1
+    if not load_symbol_maps(args):
+        return 1
+
+    # The server can neither restrict the fixes to lines nor load other maps,
+    # and the staged blobs are always fixed locally
+    client = None if args.lines or args.symbol_map or args.staged else connect(args.server)
+    if client is not None and unsupported_server_options(args):
+        client.close()
+        print(
+            f"Cannot use {', '.join(unsupported_server_options(args))} with a server, which "
+            "processes the files with its own configuration (pass --server '' to process "
+            "locally)",
+            file=sys.stderr,
+        )
+        return 1
+
+    if args.in_place:
+        from remusing_cpp.git import GitError
+
+        try:
+            return fix_batch(args, client)
+        except GitError as e:
+            print(f"git: {e}", file=sys.stderr)
+            return 1
+
+    with ExitStack() as stack:
+        if args.infile == sys.stdin:
+            src: SourceBytes = sys.stdin.read().encode(locale.getpreferredencoding())
+            name = "<stdin>"
+        else:
+            src = stack.enter_context(open_source(args.infile))
+            name = args.infile
+        return fix_single(args, src, name, client)
 
-    if args.infile == sys.stdin:
-        src = args.infile.read().encode(locale.getpreferredencoding())
+
+def compile_symbol_maps(args: argparse.Namespace) -> int:
+    """
+    Compile the symbol map files of the arguments into a single map.
+
+    Arguments:
+        args: The CLI arguments
+
+    Returns:
+        Exit code
+    """
+    from remusing_cpp.symbols import SymbolMapError, compile_symbol_map
+
+    if not args.symbol_map:
+        print("No '--symbol-map' files to compile", file=sys.stderr)
+        return 1
+    try:
+        count = compile_symbol_map(args.symbol_map, args.compile_symbol_map)
+    except SymbolMapError as e:
+        print(f"symbol map: {e}", file=sys.stderr)
+        return 1
+    print(f"Compiled {count} symbol(s) into {args.compile_symbol_map}")
+    return 0
+
+
+def fix_batch(args: argparse.Namespace, client: Optional["FixClient"]) -> int:
+    """
+    Fix many files in-place and print a report.
+
+    Arguments:
+        args: The validated CLI arguments
+        client: Client to send the work to, or `None` to process locally
+
+    Returns:
+        Exit code
+    """
+    from remusing_cpp.batch import iter_batch
+    from remusing_cpp.git import changed_files, fix_staged
+
+    options = {
+        "cache_dir": args.cache_dir,
+        "cache_max_bytes": args.cache_size << 20,
+        "collect_stats": args.stats,
+        "prefilter": args.prefilter,
+        "backend": args.backend,
+        "ordered": args.ordered,
+        "on_progress": ProgressReporter() if args.progress else None,
+        "symbol_maps": args.symbol_map,
+    }
+    results: Iterable["FileResult"]
+    if args.staged:
+        # The staged blobs are always fixed locally, a server only reads files
+        results = fix_staged(
+            args.paths,
+            args.ts_source,
+            args.ts_out,
+            args.extensions,
+            jobs=args.jobs,
+            index_namespace_map=load_index(args, []),
+            **options,
+        )
     else:
-        src = args.infile.read()
-    args.infile.close()
+        paths: Iterable[str]
+        if args.changed_since is not None:
+            paths = changed_files(args.changed_since, args.paths, args.extensions)
+        else:
+            # Streamed, so that the workers start while the tree is walked
+            paths = discover_inputs(args)
+        if client is not None:
+            results = fix_remote(client, paths)
+        else:
+            index_map = None
+            if args.index is not None:
+                paths = list(paths)
+                index_map = load_index(args, paths)
+            results = iter_batch(
+                paths, args.ts_source, args.ts_out, args.jobs, index_map, **options
+            )
+    # Fixing a single file in-place stays as silent as it always was
+    single_file = (
+        not args.staged
+        and args.changed_since is None
+        and len(args.paths) == 1
+        and os.path.isfile(args.paths[0])
+    )
+    verbose = args.verbose or not single_file
+    report = print_summary(results, verbose)
+    if report.stats is not None:
+        print_stats(report.stats)
+    elif report.skipped and verbose:
+        print(f"prefilter: {report.skipped} file(s) skipped without parsing", file=sys.stderr)
+    if args.report is not None:
+        with atomic_open(args.report) as f:
+            f.write(json.dumps(report.as_json(), indent=2).encode("utf8"))
+    return 1 if report.failures else 0
+
+
+def fix_single(
+    args: argparse.Namespace, src: SourceBytes, name: str, client: Optional["FixClient"]
+) -> int:
+    """
+    Fix a single source and write the output in the requested format.
+
+    In the source format, the unchanged spans of the input are streamed
+    straight to the output, and an output file is replaced atomically.
 
+    Arguments:
+        args: The validated CLI arguments
+        src: The source code to fix
+        name: Name of the input for diff headers
+        client: Client to send the work to, or `None` to process locally
+
+    Returns:
+        Exit code
+    """
     # --- App logic
-    parser, language = build_cpp_parser(args.ts_source, args.ts_out)
-    output = RemUsing(src, parser, language).fix()
+    stats = None
+    remote = None
+    if client is not None:
+        remote = call_server(client, lambda: client.fix(src[:], args.format, name))
+    if remote is not None:
+        text = remote
+        if args.format == "source":
+            src, edits = text.encode("utf8", errors="surrogateescape"), []
+    else:
+        from remusing_cpp.core import RemUsing
+        from remusing_cpp.report import LineIndex
+        from remusing_cpp.server import render_edits
+        from remusing_cpp.symbols import layered_namespace_map
+
+        index_map = load_index(args, [] if args.infile == sys.stdin else [args.infile])
+        parser, language = build_cpp_parser(args.ts_source, args.ts_out)
+        remusing = RemUsing(src, parser, language)
+        if args.stats:
+            stats = remusing.stats = RemUsingStats()
+        remusing.hardcoded_namespace_map = layered_namespace_map(args.symbol_map)
+        if index_map is not None:
+            remusing.index_namespace_map = index_map
+        if args.lines:
+            lines = LineIndex(src)
+            remusing.ranges = [lines.byte_range(first, last) for first, last in args.lines]
+        edits = remusing.edits()
+        if args.format != "source":
+            text = render_edits(src, edits, args.format, name)
 
     # --- Output
-    if args.in_place:
-        with open(args.infile.name, "wb") as o:
-            o.write(output)
-    else:
-        if args.outfile == sys.stdout:
-            args.outfile.write(output.decode(locale.getpreferredencoding()))
+    with nullcontext() if stats is None else stats.time("fix"):
+        if args.format != "source":
+            write_text(args.outfile, text)
+        elif args.outfile is not None:
+            with atomic_open(args.outfile) as o:
+                write_edits(src, edits, o)
+        elif hasattr(sys.stdout, "buffer"):
+            sys.stdout.flush()
+            write_edits(src, edits, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
         else:
-            args.outfile.write(output)
-        args.outfile.flush()
+            sys.stdout.write(apply_edits(src, edits).decode(locale.getpreferredencoding()))
+            sys.stdout.flush()
 
+    if stats is not None:
+        print_stats(stats)
     return 0
+
+
+def write_text(outfile: Optional[str], text: str) -> None:
+    """
+    Write text to the output file or stdout.
+
+    Arguments:
+        outfile: Output file path, or `None` for stdout
+        text: Text to write
+    """
+    # Bytes of the source that are not UTF-8 are surrogates in the text
+    if outfile is not None:
+        with open(outfile, "w", encoding="utf8", errors="surrogateescape") as o:
+            o.write(text)
+    elif hasattr(sys.stdout, "buffer"):
+        sys.stdout.flush()
+        sys.stdout.buffer.write(text.encode("utf8", errors="surrogateescape"))
+        sys.stdout.buffer.flush()
+    else:
+        sys.stdout.write(text)
+        sys.stdout.flush()
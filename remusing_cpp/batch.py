@@ -0,0 +1,840 @@
+"""
+This module contains functionality for fixing many files at once across a pool
+of worker processes.
+"""
+import csv
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    TypeVar,
+)
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp.cache import DEFAULT_MAX_BYTES, ResultCache, config_digest
+from remusing_cpp.core import RemUsing
+from remusing_cpp.discover import DEFAULT_EXTENSIONS, discover_paths
+from remusing_cpp.edits import Edit, SourceBytes, apply_edits, write_edits
+from remusing_cpp.executor import (
+    PROCESS_BACKEND,
+    THREAD_BACKEND,
+    Progress,
+    create_executor,
+    imap,
+)
+from remusing_cpp.prefilter import Prefilter
+from remusing_cpp.queries import QueryCache
+from remusing_cpp.report import CATEGORIES, SourceReport
+from remusing_cpp.resolve import NamespaceTable
+from remusing_cpp.stats import RemUsingStats, merge_stats
+from remusing_cpp.symbols import layered_namespace_map
+from remusing_cpp.util import (
+    atomic_open,
+    cached_grammar_digest,
+    ensure_cpp_language,
+    load_cpp_language,
+    open_source,
+)
+
+T = TypeVar("T")
+
+# Upper bound of the number of files sent to a worker process at once
+_MAX_CHUNKSIZE = 16
+
+
+@dataclass
+class FileResult:
+    """
+    The outcome of fixing a single file in a batch run.
+    """
+
+    path: str
+    """Path of the processed file"""
+    changed: bool = False
+    """Whether the file contents were changed"""
+    error: Optional[str] = None
+    """Error message if the file could not be processed"""
+    cached: bool = False
+    """Whether the edits came from the result cache"""
+    skipped: bool = False
+    """Whether the prefilter ruled out any changes, so that it was not parsed"""
+    stats: Optional[RemUsingStats] = None
+    """
+    Timings and counters, if requested. For cached results, only the sizes
+    and the fixups are known.
+    """
+    fixed: Optional[bytes] = None
+    """The fixed source of a changed blob, see `fix_blob`"""
+    report: Optional[SourceReport] = None
+    """The findings of a scanned file, see `scan_file`"""
+
+
+@dataclass
+class BatchReport:
+    """
+    The summary of a batch run, with the failures collected separately from
+    the per-file output.
+    """
+
+    files: int = 0
+    """Number of processed files"""
+    changed: int = 0
+    """Number of changed files"""
+    cached: int = 0
+    """Number of files whose edits came from the result cache"""
+    skipped: int = 0
+    """Number of files that the prefilter ruled out"""
+    failures: List[Tuple[str, str]] = field(default_factory=list)
+    """Path and error message of each file that could not be processed"""
+    stats: Optional[RemUsingStats] = None
+    """The merged stats of all files, if any were recorded"""
+
+    @property
+    def unchanged(self) -> int:
+        """
+        Number of files that were processed successfully without changes.
+        """
+        return self.files - self.changed - len(self.failures)
+
+    def add(self, result: FileResult) -> None:
+        """
+        Count the result of a file.
+
+        Args:
+            result: The result to add
+        """
+        self.files += 1
+        self.changed += result.changed
+        self.cached += result.cached
+        self.skipped += result.skipped
+        if result.error is not None:
+            self.failures.append((result.path, result.error))
+        if result.stats is not None:
+            self.stats = merge_stats([self.stats, result.stats])
+
+    def as_json(self) -> Dict[str, Any]:
+        """
+        Convert the report into a JSON-serializable dictionary.
+
+        Returns:
+            The counters and the failures
+        """
+        report: Dict[str, Any] = {
+            "files": self.files,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "cached": self.cached,
+            "skipped": self.skipped,
+            "failures": [{"path": path, "error": error} for path, error in self.failures],
+        }
+        if self.stats is not None:
+            report["stats"] = self.stats.as_json()
+        return report
+
+
+@dataclass
+class ScanReport:
+    """
+    The aggregated findings of a scan of many files.
+    """
+
+    files: int = 0
+    """Number of scanned files"""
+    skipped: int = 0
+    """Number of files that the prefilter ruled out"""
+    totals: SourceReport = field(default_factory=SourceReport)
+    """The counts of all files"""
+    sources: List[Tuple[str, SourceReport]] = field(default_factory=list)
+    """Path and findings of each file with findings, in the order they were added"""
+    failures: List[Tuple[str, str]] = field(default_factory=list)
+    """Path and error message of each file that could not be scanned"""
+
+    def add(self, result: FileResult) -> None:
+        """
+        Count the result of a file.
+
+        Args:
+            result: The result to add
+        """
+        self.files += 1
+        self.skipped += result.skipped
+        if result.error is not None:
+            self.failures.append((result.path, result.error))
+        if result.report is not None and result.report.total:
+            self.totals.merge(result.report)
+            self.sources.append((result.path, result.report))
+
+    def as_json(self) -> Dict[str, Any]:
+        """
+        Convert the report into a JSON-serializable dictionary.
+
+        Returns:
+            The totals, the findings of each file with findings and the
+            failures
+        """
+        totals = self.totals.as_json()
+        return {
+            "files": self.files,
+            "files_with_findings": len(self.sources),
+            "skipped": self.skipped,
+            "counts": totals["counts"],
+            "namespaces": totals["namespaces"],
+            "sources": [{"path": path, **report.as_json()} for path, report in self.sources],
+            "failures": [{"path": path, "error": error} for path, error in self.failures],
+        }
+
+    def write_csv(self, stream: TextIO, locations: bool = False) -> None:
+        """
+        Write the files with findings as CSV.
+
+        Args:
+            stream: The text stream to write to
+            locations: Write a row per finding instead of the counts per file
+        """
+        writer = csv.writer(stream)
+        if locations:
+            writer.writerow(["path", "category", "line", "column", "namespace", "text"])
+            for path, report in self.sources:
+                for finding in report.findings:
+                    writer.writerow(
+                        [
+                            path,
+                            finding.category.value,
+                            finding.line,
+                            finding.column,
+                            finding.namespace,
+                            finding.text,
+                        ]
+                    )
+        else:
+            writer.writerow(["path", *(category.value for category in CATEGORIES)])
+            for path, report in self.sources:
+                writer.writerow([path, *(report.counts[category] for category in CATEGORIES)])
+
+
+def expand_paths(
+    patterns: Iterable[str], extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS
+) -> List[str]:
+    """
+    Expand a list of files, directories and glob patterns into the list of
+    files to process.
+
+    Directories are searched recursively for files with one of the
+    `extensions`, without any ignore rules. Glob patterns support `**` for
+    recursive matching. Explicitly listed files are always included
+    regardless of their extension.
+
+    Args:
+        patterns: Files, directories or glob patterns
+        extensions: File extensions to select when searching directories
+
+    Returns:
+        Sorted, de-duplicated list of file paths
+    """
+    # Unlike `discover_paths`, the whole tree is searched
+    return sorted(discover_paths(patterns, extensions, (), ignore_files=False, sort_window=0))
+
+
+# Per-process worker state. Each worker process builds these once in
+# `_init_worker` and reuses them for every file that it is handed. The
+# language and the configuration are read-only and shared by all threads.
+_worker_language: Optional[Language] = None
+_worker_index_namespace_map: Optional[Dict[str, str]] = None
+_worker_cache: Optional[ResultCache] = None
+_worker_collect_stats = False
+_worker_prefilter: Optional[Prefilter] = None
+_worker_namespace_table: Optional[NamespaceTable] = None
+
+# Per-thread worker state: a tree-sitter parser and the compiled query must
+# not be used by two threads at once, so every thread gets its own
+_worker_local = threading.local()
+
+
+def _init_thread() -> None:
+    """
+    Create the parser and the query cache of the current thread for the
+    shared language of the process.
+    """
+    assert _worker_language is not None
+    _worker_local.parser = Parser()
+    _worker_local.parser.set_language(_worker_language)
+    _worker_local.query_cache = QueryCache()
+
+
+def _init_worker(
+    lib_path: str,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache: Optional[ResultCache] = None,
+    collect_stats: bool = False,
+    prefilter: bool = False,
+    symbol_maps: Sequence[str] = (),
+) -> None:
+    """
+    Initialize the tree-sitter state for a worker process and its current
+    thread.
+
+    Args:
+        lib_path: Path of the already built tree-sitter C++ language
+        index_namespace_map: Namespaces of project symbols from a symbol index
+        cache: Cache of previous results
+        collect_stats: Whether to record stats for every file
+        prefilter: Whether to skip files that cannot need changes. The
+            check is built from the maps once per process.
+        symbol_maps: Symbol map files, see
+            `remusing_cpp.symbols.layered_namespace_map`. They are loaded
+            once per process.
+    """
+    global _worker_language, _worker_index_namespace_map, _worker_cache
+    global _worker_collect_stats, _worker_prefilter, _worker_namespace_table
+    _worker_language = load_cpp_language(lib_path)
+    _worker_index_namespace_map = index_namespace_map
+    _worker_cache = cache
+    _worker_collect_stats = collect_stats
+    hardcoded_namespace_map = layered_namespace_map(symbol_maps)
+    _worker_prefilter = (
+        Prefilter.from_maps(hardcoded_namespace_map, index_namespace_map or {})
+        if prefilter
+        else None
+    )
+    # Shared by all files and threads of the worker, so that every
+    # identifier is only resolved against the maps once
+    _worker_namespace_table = NamespaceTable.from_maps(
+        hardcoded_namespace_map, index_namespace_map or {}
+    )
+    _init_thread()
+
+
+def source_edits(
+    src: SourceBytes,
+    parser: Parser,
+    language: Language,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache: Optional[ResultCache] = None,
+    stats: Optional[RemUsingStats] = None,
+    prefilter: Optional[Prefilter] = None,
+    query_cache: Optional[QueryCache] = None,
+    namespace_table: Optional[NamespaceTable] = None,
+) -> Optional[Tuple[List[Edit], bool]]:
+    """
+    Compute the edits for a source, from the result cache if possible. See
+    `fix_file` for the arguments.
+
+    Returns:
+        The edits and whether they came from the cache, or `None` if the
+        prefilter ruled out any changes
+    """
+    if prefilter is not None and not prefilter.might_change(src):
+        if stats is not None:
+            stats.record_edits(len(src), [])
+            stats.skipped += 1
+        return None
+    key = edits = None
+    if cache is not None:
+        key = cache.key(src)
+        edits = cache.get(key)
+    if edits is not None:
+        if stats is not None:
+            stats.record_edits(len(src), edits)
+        return edits, True
+    remusing = RemUsing(src, parser, language)
+    remusing.stats = stats
+    if query_cache is not None:
+        remusing.query_cache = query_cache
+    if index_namespace_map is not None:
+        remusing.index_namespace_map = index_namespace_map
+    remusing.namespace_table = namespace_table
+    edits = remusing.edits()
+    if cache is not None and key is not None:
+        cache.put(key, edits)
+    return edits, False
+
+
+def fix_file(
+    path: str,
+    parser: Parser,
+    language: Language,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache: Optional[ResultCache] = None,
+    collect_stats: bool = False,
+    prefilter: Optional[Prefilter] = None,
+    query_cache: Optional[QueryCache] = None,
+    namespace_table: Optional[NamespaceTable] = None,
+) -> FileResult:
+    """
+    Fix a single file in-place. The file is memory-mapped and the output is
+    streamed into a temporary file that atomically replaces the original.
+
+    Args:
+        path: File to fix
+        parser: The C++ tree-sitter parser
+        language: The C++ tree-sitter language
+        index_namespace_map: Namespaces of project symbols from a symbol index,
+            see `RemUsing.index_namespace_map`
+        cache: Cache of previous results. It must have been created for the
+            same configuration, see `remusing_cpp.cache.config_digest`.
+        collect_stats: Whether to record stats, see `RemUsing.stats`
+        prefilter: Check to skip the file without parsing it if it cannot
+            need changes. It must have been created for the same
+            configuration, see `remusing_cpp.prefilter.Prefilter.for_remusing`.
+        query_cache: Cache of compiled queries, see `RemUsing.query_cache`.
+            It must not be shared with other threads.
+        namespace_table: Resolution table of the namespace maps, see
+            `RemUsing.namespace_table`. It must have been created for the
+            same maps.
+
+    Returns:
+        The result of fixing the file
+    """
+    stats = RemUsingStats() if collect_stats else None
+    try:
+        with open_source(path) as src:
+            found = source_edits(
+                src,
+                parser,
+                language,
+                index_namespace_map,
+                cache,
+                stats,
+                prefilter,
+                query_cache,
+                namespace_table,
+            )
+            if found is None:
+                return FileResult(path, skipped=True, stats=stats)
+            edits, cached = found
+            if not edits:
+                return FileResult(path, cached=cached, stats=stats)
+            with nullcontext() if stats is None else stats.time("fix"), atomic_open(path) as f:
+                write_edits(src, edits, f)
+    except (OSError, UnicodeDecodeError) as e:
+        return FileResult(path, error=str(e), stats=stats)
+    return FileResult(path, changed=True, cached=cached, stats=stats)
+
+
+def fix_blob(
+    path: str,
+    src: bytes,
+    parser: Parser,
+    language: Language,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache: Optional[ResultCache] = None,
+    collect_stats: bool = False,
+    prefilter: Optional[Prefilter] = None,
+    query_cache: Optional[QueryCache] = None,
+    namespace_table: Optional[NamespaceTable] = None,
+) -> FileResult:
+    """
+    Fix a source that is not read from its file, e.g. a staged git blob. The
+    file itself is not touched. See `fix_file` for the other arguments.
+
+    Args:
+        path: Path of the source, only used for the result
+        src: The source code
+
+    Returns:
+        The result of fixing the source, with the `fixed` source if it changed
+    """
+    stats = RemUsingStats() if collect_stats else None
+    try:
+        found = source_edits(
+            src,
+            parser,
+            language,
+            index_namespace_map,
+            cache,
+            stats,
+            prefilter,
+            query_cache,
+            namespace_table,
+        )
+    except UnicodeDecodeError as e:
+        return FileResult(path, error=str(e), stats=stats)
+    if found is None:
+        return FileResult(path, skipped=True, stats=stats)
+    edits, cached = found
+    if not edits:
+        return FileResult(path, cached=cached, stats=stats)
+    with nullcontext() if stats is None else stats.time("fix"):
+        fixed = apply_edits(src, edits)
+    return FileResult(path, changed=True, cached=cached, stats=stats, fixed=fixed)
+
+
+def scan_file(
+    path: str,
+    parser: Parser,
+    language: Language,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    prefilter: Optional[Prefilter] = None,
+    query_cache: Optional[QueryCache] = None,
+    namespace_table: Optional[NamespaceTable] = None,
+    locations: bool = False,
+) -> FileResult:
+    """
+    Scan a single file for `using` declarations and unqualified symbols
+    without fixing it, see `RemUsing.report`. See `fix_file` for the other
+    arguments.
+
+    Args:
+        path: File to scan
+        locations: Whether to list every finding with its location
+
+    Returns:
+        The result of scanning the file, with its `report`
+    """
+    try:
+        with open_source(path) as src:
+            if prefilter is not None and not prefilter.might_change(src):
+                return FileResult(path, skipped=True, report=SourceReport())
+            remusing = RemUsing(src, parser, language)
+            if query_cache is not None:
+                remusing.query_cache = query_cache
+            if index_namespace_map is not None:
+                remusing.index_namespace_map = index_namespace_map
+            remusing.namespace_table = namespace_table
+            report = remusing.report(locations)
+    except (OSError, UnicodeDecodeError) as e:
+        return FileResult(path, error=str(e))
+    return FileResult(path, report=report)
+
+
+def _fix_file(path: str) -> FileResult:
+    """
+    Fix a single file in-place using the worker's tree-sitter state.
+
+    Args:
+        path: File to fix
+
+    Returns:
+        The result of fixing the file
+    """
+    assert _worker_language is not None
+    return fix_file(
+        path,
+        _worker_local.parser,
+        _worker_language,
+        _worker_index_namespace_map,
+        _worker_cache,
+        _worker_collect_stats,
+        _worker_prefilter,
+        _worker_local.query_cache,
+        _worker_namespace_table,
+    )
+
+
+def _fix_blob(blob: Tuple[str, bytes]) -> FileResult:
+    """
+    Fix a source given by its path and contents using the worker's
+    tree-sitter state.
+
+    Args:
+        blob: Path and contents of the source
+
+    Returns:
+        The result of fixing the source
+    """
+    assert _worker_language is not None
+    return fix_blob(
+        blob[0],
+        blob[1],
+        _worker_local.parser,
+        _worker_language,
+        _worker_index_namespace_map,
+        _worker_cache,
+        _worker_collect_stats,
+        _worker_prefilter,
+        _worker_local.query_cache,
+        _worker_namespace_table,
+    )
+
+
+def _scan_file(path: str, locations: bool = False) -> FileResult:
+    """
+    Scan a single file using the worker's tree-sitter state.
+
+    Args:
+        path: File to scan
+        locations: Whether to list every finding with its location
+
+    Returns:
+        The result of scanning the file
+    """
+    assert _worker_language is not None
+    return scan_file(
+        path,
+        _worker_local.parser,
+        _worker_language,
+        _worker_index_namespace_map,
+        _worker_prefilter,
+        _worker_local.query_cache,
+        _worker_namespace_table,
+        locations,
+    )
+
+
+def _error_result(path: str, error: BaseException) -> FileResult:
+    """
+    Turn an unexpected exception while fixing a file into its result.
+    """
+    return FileResult(path, error=f"{type(error).__name__}: {error}")
+
+
+def _blob_error_result(blob: Tuple[str, bytes], error: BaseException) -> FileResult:
+    """
+    Turn an unexpected exception while fixing a blob into its result.
+    """
+    return _error_result(blob[0], error)
+
+
+def _is_failure(result: FileResult) -> bool:
+    """
+    Check whether a file could not be processed.
+    """
+    return result.error is not None
+
+
+def iter_batch(
+    paths: Iterable[str],
+    ts_source: str,
+    ts_out: str,
+    jobs: int = 1,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    collect_stats: bool = False,
+    prefilter: bool = True,
+    backend: str = PROCESS_BACKEND,
+    ordered: bool = True,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+    symbol_maps: Sequence[str] = (),
+) -> Iterator[FileResult]:
+    """
+    Fix the given files in-place, spreading the work across `jobs` processes
+    or threads, and yield the result of each file as soon as it is available.
+
+    The tree-sitter language is built once up-front, and each worker process
+    then only loads it a single time. Every worker thread creates its own
+    parser and compiles its own query once. Only a bounded number of files
+    is in flight at any time, so `paths` may be a lazy iterable of any
+    length.
+
+    Args:
+        paths: Files to fix
+        ts_source: Tree-sitter C++ source code repo directory
+        ts_out: Tree-sitter language output file
+        jobs: Number of workers. A value of 1 processes the files in the
+            current thread.
+        index_namespace_map: Namespaces of project symbols from a symbol index,
+            see `RemUsing.index_namespace_map`
+        cache_dir: Directory of a persistent result cache. Files whose
+            contents and configuration match a cached result are not parsed.
+        cache_max_bytes: Size limit of the result cache
+        collect_stats: Whether to record stats for every file, see
+            `FileResult.stats`
+        prefilter: Skip files that cannot need changes without parsing them,
+            see `remusing_cpp.prefilter.Prefilter`
+        backend: Whether the workers are processes or threads of the current
+            process, see `remusing_cpp.executor.BACKENDS`. Threads share the
+            language and the configuration and need no pickling of results,
+            but only run in parallel where tree-sitter releases the GIL.
+        ordered: Yield the results in the order of `paths`. Otherwise, they
+            are yielded in the order in which the files are done.
+        on_progress: Called with the progress after files are done, see
+            `remusing_cpp.executor.ProgressReporter`
+        symbol_maps: Symbol map files that take precedence over the
+            hardcoded namespace map, see
+            `remusing_cpp.symbols.layered_namespace_map`. Every worker
+            process loads them once.
+
+    Returns:
+        An iterator over the result of each file. Unexpected exceptions are
+        reported as errors of their file.
+    """
+    return _iter_work(
+        _fix_file,
+        _error_result,
+        paths,
+        ts_source,
+        ts_out,
+        jobs,
+        index_namespace_map,
+        cache_dir,
+        cache_max_bytes,
+        collect_stats,
+        prefilter,
+        backend,
+        ordered,
+        on_progress,
+        symbol_maps,
+    )
+
+
+def iter_batch_blobs(
+    blobs: Iterable[Tuple[str, bytes]], ts_source: str, ts_out: str, **options: Any
+) -> Iterator[FileResult]:
+    """
+    Fix sources that are given by their path and contents, e.g. staged git
+    blobs, without touching the files. The fixed sources are returned in
+    `FileResult.fixed`.
+
+    Args:
+        blobs: Path and contents of the sources
+        ts_source: Tree-sitter C++ source code repo directory
+        ts_out: Tree-sitter language output file
+        options: Further arguments of `iter_batch`
+
+    Returns:
+        An iterator over the result of each source
+    """
+    return _iter_work(_fix_blob, _blob_error_result, blobs, ts_source, ts_out, **options)
+
+
+def iter_scan(
+    paths: Iterable[str],
+    ts_source: str,
+    ts_out: str,
+    locations: bool = False,
+    **options: Any,
+) -> Iterator[FileResult]:
+    """
+    Scan the given files for `using` declarations and unqualified symbols
+    without changing them, see `scan_file`. The files are spread across
+    workers like in `iter_batch`.
+
+    Args:
+        paths: Files to scan
+        ts_source: Tree-sitter C++ source code repo directory
+        ts_out: Tree-sitter language output file
+        locations: Whether to list every finding with its location
+        options: Further arguments of `iter_batch`. The result cache does not
+            apply to scans.
+
+    Returns:
+        An iterator over the result of each file, with its `report`
+    """
+    work = partial(_scan_file, locations=locations)
+    return _iter_work(work, _error_result, paths, ts_source, ts_out, **options)
+
+
+def _iter_work(
+    work: Callable[[T], FileResult],
+    on_error: Callable[[T, BaseException], FileResult],
+    items: Iterable[T],
+    ts_source: str,
+    ts_out: str,
+    jobs: int = 1,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    collect_stats: bool = False,
+    prefilter: bool = True,
+    backend: str = PROCESS_BACKEND,
+    ordered: bool = True,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+    symbol_maps: Sequence[str] = (),
+) -> Iterator[FileResult]:
+    """
+    Run the work for every item on the workers, see `iter_batch`.
+    """
+    # Build the language once so the workers only need to load it
+    lib_path = ensure_cpp_language(ts_source, ts_out)
+    _init_worker(
+        lib_path,
+        index_namespace_map,
+        collect_stats=collect_stats,
+        prefilter=prefilter,
+        symbol_maps=symbol_maps,
+    )
+    # The configuration that every file is fixed with
+    assert _worker_language is not None
+    remusing = RemUsing(b"", _worker_local.parser, _worker_language)
+    remusing.hardcoded_namespace_map = layered_namespace_map(symbol_maps)
+    if index_namespace_map is not None:
+        remusing.index_namespace_map = index_namespace_map
+
+    global _worker_cache
+    cache = None
+    if cache_dir is not None:
+        config = config_digest(remusing, cached_grammar_digest(ts_source, ts_out))
+        cache = ResultCache(cache_dir, config, cache_max_bytes)
+    _worker_cache = cache
+
+    total = len(items) if isinstance(items, Sequence) else None
+    run = partial(
+        imap,
+        work,
+        items,
+        ordered=ordered,
+        on_error=on_error,
+        on_progress=on_progress,
+        is_failure=_is_failure,
+    )
+    if jobs <= 1 or total == 1:
+        yield from run()
+    elif backend == THREAD_BACKEND:
+        # Threads share the process state and there is no transfer overhead
+        # to amortize, so each file is a chunk of its own
+        with create_executor(THREAD_BACKEND, jobs, _init_thread) as executor:
+            yield from run(executor=executor, max_in_flight=jobs * 4)
+    else:
+        # Small chunks keep the workers balanced and the ordered output
+        # flowing, while amortizing the inter-process overhead
+        chunksize = min(_MAX_CHUNKSIZE, max(1, (total or 0) // (jobs * 8)))
+        with create_executor(
+            backend,
+            jobs,
+            _init_worker,
+            # The workers load the symbol maps and build the prefilter
+            # themselves rather than receiving them pickled
+            (lib_path, index_namespace_map, cache, collect_stats, prefilter, symbol_maps),
+        ) as executor:
+            yield from run(executor=executor, max_in_flight=jobs * 4, chunksize=chunksize)
+
+    if cache is not None:
+        cache.prune()
+
+
+def run_batch(
+    paths: List[str],
+    ts_source: str,
+    ts_out: str,
+    jobs: int = 1,
+    index_namespace_map: Optional[Dict[str, str]] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    collect_stats: bool = False,
+    prefilter: bool = True,
+    backend: str = PROCESS_BACKEND,
+) -> List[FileResult]:
+    """
+    Fix the given files in-place and collect the results, see `iter_batch`
+    for the arguments.
+
+    Returns:
+        A result for each file, in the same order as `paths`
+    """
+    return list(
+        iter_batch(
+            paths,
+            ts_source,
+            ts_out,
+            jobs,
+            index_namespace_map,
+            cache_dir,
+            cache_max_bytes,
+            collect_stats,
+            prefilter,
+            backend,
+        )
+    )
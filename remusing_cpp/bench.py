@@ -0,0 +1,422 @@
+"""
+This module contains a benchmark harness for the stages of `RemUsing` and a
+generator of synthetic C++ inputs.
+
+The generated sources mix the constructs that dominate real code bases:
+`using` declarations, deeply nested templates like
+`map<string, vector<vector<string>>>` and stream-heavy functions. The fixup
+density controls the share of lines that refer to unqualified `std` names,
+the remaining lines use project types or qualified names that need no fix.
+
+Every stage is timed separately: `RemUsing.parse`, `query`,
+`process_captures` and `fix` are called in order on a fresh instance, so each
+call only does the work of its own stage. `time_scaling` measures the wall
+time of whole batch runs instead, to compare the worker backends and counts.
+`time_startup` measures the import time of the CLI in fresh interpreters with
+`python -X importtime`, which dominates short runs like `--help` or fixing a
+handful of cached files.
+"""
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp.batch import run_batch
+from remusing_cpp.core import QUERY_ENGINE, RemUsing
+from remusing_cpp.edits import SourceBytes
+
+STAGES = ("parse", "query", "process_captures", "fix")
+"""The timed `RemUsing` stages, in the order they run"""
+
+STARTUP_MODULE = "remusing_cpp._cli"
+"""The module whose import time `time_startup` measures by default"""
+
+# A line of `python -X importtime`: "import time: <self> | <cumulative> |
+# <indented name>". The header line with the column names does not match.
+_IMPORT_TIME = re.compile(r"^import time:\s*(\d+) \|\s*(\d+) \| +(\S+)$", re.MULTILINE)
+
+_HEADER = b"""#include <iostream>
+#include <map>
+#include <sstream>
+#include <string>
+#include <vector>
+using namespace std;
+using std::map;
+using std::vector;
+using std::string;
+using std::cout;
+using std::endl;
+"""
+
+_STD_TYPES = ("string", "vector<int>", "map<string, int>", "pair<int, string>", "list<string>")
+_PROJECT_TYPES = ("Widget", "Handle<Widget>", "Registry<int, Widget>", "Buffer")
+
+
+def _nested_template(rng: random.Random, depth: int, names: Sequence[str]) -> str:
+    """
+    Build a template type like `map<string, vector<vector<string>>>`.
+    """
+    if depth == 0:
+        return rng.choice(("string", "int", "Widget"))
+    inner = _nested_template(rng, depth - 1, names)
+    name = rng.choice(names)
+    if name == "map":
+        return f"map<string, {inner}>"
+    return f"{name}<{inner}>"
+
+
+def _fixup_line(rng: random.Random, n: int) -> str:
+    """
+    Build a line that refers to unqualified `std` names.
+    """
+    kind = n % 4
+    if kind == 0:
+        return f"{rng.choice(_STD_TYPES)} value_{n};"
+    if kind == 1:
+        return f"{_nested_template(rng, rng.randint(2, 5), ('map', 'vector'))} nested_{n};"
+    if kind == 2:
+        return (
+            f"void print_{n}(ostream &os, const vector<string> &v) "
+            f'{{ for (const string &s : v) {{ os << hex << s.size() << ": " << s << endl; }} '
+            f"cout << min({n}, {n + 1}) << endl; }}"
+        )
+    return (
+        f"string format_{n}(int x) {{ ostringstream ss; ss << fixed << x; "
+        f"cerr << ss.str() << endl; return ss.str(); }}"
+    )
+
+
+def _plain_line(rng: random.Random, n: int) -> str:
+    """
+    Build a line that needs no fixups.
+    """
+    kind = n % 3
+    if kind == 0:
+        return f"{rng.choice(_PROJECT_TYPES)} widget_{n};"
+    if kind == 1:
+        return f"std::map<std::string, std::vector<Widget>> registry_{n};"
+    return f"int compute_{n}(int a, int b) {{ return a * {n} + b; }}"
+
+
+def generate_source(size: int, density: float = 0.5, seed: int = 0) -> bytes:
+    """
+    Generate a synthetic C++ source.
+
+    Args:
+        size: Approximate size of the source in bytes
+        density: Share of the lines, between 0 and 1, that need fixups
+        seed: Seed for the random choices, the same seed gives the same source
+
+    Returns:
+        The C++ source code
+    """
+    rng = random.Random(seed)
+    lines = [_HEADER if density > 0 else b"#include <string>\n"]
+    total = len(lines[0])
+    n = 0
+    while total < size:
+        line = _fixup_line(rng, n) if rng.random() < density else _plain_line(rng, n)
+        data = line.encode("utf8") + b"\n"
+        lines.append(data)
+        total += len(data)
+        n += 1
+    return b"".join(lines)
+
+
+def generate_corpus(files: int, size: int, density: float = 0.5, seed: int = 0) -> Dict[str, bytes]:
+    """
+    Generate a corpus of synthetic C++ sources.
+
+    Args:
+        files: Number of sources
+        size: Approximate size of each source in bytes
+        density: Share of the lines, between 0 and 1, that need fixups
+        seed: Seed of the first source, the others use the following seeds
+
+    Returns:
+        The sources by generated file name
+    """
+    return {f"gen_{i:05d}.cpp": generate_source(size, density, seed + i) for i in range(files)}
+
+
+def peak_rss() -> int:
+    """
+    Get the peak resident set size of the current process.
+
+    Returns:
+        Peak RSS in bytes, or 0 if the platform does not report it
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return int(maxrss if sys.platform == "darwin" else maxrss * 1024)
+
+
+@dataclass
+class BenchResult:
+    """
+    Timings of a benchmark run over a set of sources.
+    """
+
+    files: int = 0
+    """Number of processed sources"""
+    bytes: int = 0
+    """Total size of the processed sources"""
+    edits: int = 0
+    """Total number of edits"""
+    stage_seconds: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(STAGES, 0.0))
+    """Wall time spent in each stage, summed over all sources"""
+    peak_rss: int = 0
+    """Peak resident set size of the process in bytes"""
+
+    @property
+    def seconds(self) -> float:
+        """
+        Total wall time of all stages.
+        """
+        return sum(self.stage_seconds.values())
+
+    @property
+    def files_per_second(self) -> float:
+        """
+        Throughput in processed sources per second.
+        """
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        """
+        Throughput in processed megabytes (10^6 bytes) per second.
+        """
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def as_json(self) -> Dict[str, object]:
+        """
+        Convert the result into a JSON-serializable dictionary.
+
+        Returns:
+            The counters, stage timings and throughput
+        """
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "edits": self.edits,
+            "stage_seconds": self.stage_seconds,
+            "seconds": self.seconds,
+            "files_per_second": self.files_per_second,
+            "mb_per_second": self.mb_per_second,
+            "peak_rss": self.peak_rss,
+        }
+
+
+def time_stages(
+    src: SourceBytes, parser: Parser, language: Language, engine: str = QUERY_ENGINE
+) -> Tuple[Dict[str, float], int]:
+    """
+    Fix a single source and time each stage.
+
+    Args:
+        src: The C++ source code
+        parser: The C++ tree-sitter parser
+        language: The C++ tree-sitter language
+        engine: One of `remusing_cpp.core.ENGINES`
+
+    Returns:
+        Wall time of each stage in seconds, and the number of edits
+    """
+    remusing = RemUsing(src, parser, language)
+    remusing.engine = engine
+    timings: Dict[str, float] = {}
+    for stage in STAGES:
+        run = getattr(remusing, stage)
+        start = time.perf_counter()
+        run()
+        timings[stage] = time.perf_counter() - start
+    return timings, len(remusing.edits())
+
+
+def run_bench(
+    sources: Sequence[SourceBytes],
+    parser: Parser,
+    language: Language,
+    repeat: int = 1,
+    engine: str = QUERY_ENGINE,
+) -> BenchResult:
+    """
+    Time the stages over a set of sources.
+
+    Args:
+        sources: The C++ sources
+        parser: The C++ tree-sitter parser
+        language: The C++ tree-sitter language
+        repeat: Number of runs. Each stage reports its fastest run per source.
+        engine: One of `remusing_cpp.core.ENGINES`
+
+    Returns:
+        The summed timings of all sources
+    """
+    # Compile the query outside of the timings, like a warm process would
+    RemUsing(b"", parser, language).query()
+
+    result = BenchResult()
+    for src in sources:
+        runs = [time_stages(src, parser, language, engine) for _ in range(max(1, repeat))]
+        for stage in STAGES:
+            result.stage_seconds[stage] += min(timings[stage] for timings, _ in runs)
+        result.files += 1
+        result.bytes += len(src)
+        result.edits += runs[0][1]
+    result.peak_rss = peak_rss()
+    return result
+
+
+def format_result(result: BenchResult) -> str:
+    """
+    Format a benchmark result as a human-readable table.
+
+    Args:
+        result: The benchmark result
+
+    Returns:
+        The table text
+    """
+    lines = [f"{'stage':<18} {'seconds':>10} {'share':>7}"]
+    for stage, seconds in result.stage_seconds.items():
+        share = seconds / result.seconds if result.seconds else 0.0
+        lines.append(f"{stage:<18} {seconds:>10.4f} {share:>7.1%}")
+    lines += [
+        f"{'total':<18} {result.seconds:>10.4f}",
+        "",
+        f"{result.files} file(s), {result.bytes / 1e6:.2f} MB, {result.edits} edit(s)",
+        f"{result.files_per_second:.1f} files/s, {result.mb_per_second:.2f} MB/s, "
+        f"peak RSS {result.peak_rss / 2**20:.1f} MiB",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def time_scaling(
+    sources: Mapping[str, bytes],
+    ts_source: str,
+    ts_out: str,
+    backends: Sequence[str],
+    jobs: Sequence[int],
+) -> List[Tuple[str, int, float]]:
+    """
+    Time batch runs over a set of sources for every backend and job count.
+
+    Each run fixes a fresh copy of the sources in a temporary directory, with
+    the prefilter disabled so that every source is parsed.
+
+    Args:
+        sources: The C++ sources by file name
+        ts_source: Tree-sitter C++ source code repo directory
+        ts_out: Tree-sitter language output base path
+        backends: Worker backends, see `remusing_cpp.executor.BACKENDS`
+        jobs: Numbers of workers
+
+    Returns:
+        The backend, the number of workers and the wall time in seconds of
+        each run
+    """
+    timings: List[Tuple[str, int, float]] = []
+    with tempfile.TemporaryDirectory(prefix="remusing-bench-") as tmp:
+        paths = [os.path.join(tmp, name) for name in sources]
+        for backend in backends:
+            for n in jobs:
+                for path, src in zip(paths, sources.values()):
+                    with open(path, "wb") as f:
+                        f.write(src)
+                start = time.perf_counter()
+                run_batch(paths, ts_source, ts_out, n, prefilter=False, backend=backend)
+                timings.append((backend, n, time.perf_counter() - start))
+    return timings
+
+
+def format_scaling(timings: Sequence[Tuple[str, int, float]], files: int) -> str:
+    """
+    Format the timings of `time_scaling` as a human-readable table.
+
+    Args:
+        timings: The backend, the number of workers and the wall time of each
+            run
+        files: Number of sources in each run
+
+    Returns:
+        The table text, with the speedup over the fewest workers per backend
+    """
+    baseline: Dict[str, float] = {}
+    lines = [f"{'backend':<10} {'jobs':>5} {'seconds':>10} {'files/s':>10} {'speedup':>8}"]
+    for backend, n, seconds in timings:
+        base = baseline.setdefault(backend, seconds)
+        lines.append(
+            f"{backend:<10} {n:>5} {seconds:>10.3f} {files / seconds:>10.1f} "
+            f"{base / seconds:>7.2f}x"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def time_startup(module: str = STARTUP_MODULE, repeat: int = 3) -> Dict[str, Tuple[int, int]]:
+    """
+    Measure the import time of a module and of everything it imports, each
+    in a fresh interpreter with `python -X importtime`.
+
+    Args:
+        module: The module to import
+        repeat: Number of interpreters, the fastest import of each module
+            counts
+
+    Returns:
+        The self and the cumulative import time in microseconds of each
+        imported module, by module name
+    """
+    times: Dict[str, Tuple[int, int]] = {}
+    for _ in range(max(1, repeat)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for match in _IMPORT_TIME.finditer(proc.stderr):
+            self_us, cumulative_us = int(match[1]), int(match[2])
+            name = match[3]
+            best = times.get(name)
+            if best is None or cumulative_us < best[1]:
+                times[name] = (self_us, cumulative_us)
+    return times
+
+
+def format_startup(
+    times: Mapping[str, Tuple[int, int]], module: str = STARTUP_MODULE, top: int = 10
+) -> str:
+    """
+    Format the import times of `time_startup` as a human-readable report.
+
+    Args:
+        times: The self and the cumulative import time of each module
+        module: The imported module
+        top: Number of modules to list
+
+    Returns:
+        The report text, with the modules that take the most time of their
+        own
+    """
+    total = times[module][1] if module in times else 0
+    lines = [
+        f"import {module}: {total / 1000:.1f} ms, {len(times)} module(s)",
+        f"{'self ms':>10} {'cumul. ms':>10}  module",
+    ]
+    slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for name, (self_us, cumulative_us) in slowest:
+        lines.append(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}  {name}")
+    return "\n".join(lines) + "\n"
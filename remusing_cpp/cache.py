@@ -0,0 +1,222 @@
+"""
+This module contains a persistent cache of `RemUsing` results, so that files
+that did not change since a previous run are not parsed again.
+
+Each entry holds the edits for one source and is keyed on the hash of the
+source bytes and a digest of everything else that affects the result: the
+symbol maps, the query text and the tree-sitter C++ grammar revision. Entries
+are stored as individual JSON files, so concurrent worker processes can share
+the cache, and the least recently used entries are evicted once the cache
+grows beyond its size limit. An entry that does not decode is a miss and is
+removed.
+"""
+import contextlib
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from remusing_cpp.edits import Edit, EditReason, SourceBytes
+from remusing_cpp.util import atomic_open
+
+if TYPE_CHECKING:
+    from remusing_cpp.core import RemUsing
+
+DEFAULT_MAX_BYTES = 256 << 20
+"""Default size limit of a result cache"""
+
+_FORMAT_VERSION = 2
+
+
+def config_digest(remusing: "RemUsing", grammar_digest: str) -> str:
+    """
+    Hash the configuration of a `RemUsing` instance that affects its result.
+
+    Args:
+        remusing: A configured instance. Its source is not used.
+        grammar_digest: The tree-sitter C++ grammar revision, see
+            `remusing_cpp.util.grammar_digest`
+
+    Returns:
+        Hex digest of the configuration
+    """
+    config = [
+        _FORMAT_VERSION,
+        grammar_digest,
+        remusing.engine,
+        remusing.build_query(),
+        sorted(remusing.find_symbols),
+        sorted(remusing.hardcoded_namespace_map.items()),
+        sorted(remusing.index_namespace_map.items()),
+    ]
+    return hashlib.sha256(json.dumps(config).encode()).hexdigest()
+
+
+@dataclass
+class ResultCacheStats:
+    """
+    Counters for a `ResultCache`.
+    """
+
+    hits: int = 0
+    """Number of lookups that found cached edits"""
+    misses: int = 0
+    """Number of lookups that found nothing"""
+    evicted: int = 0
+    """Number of entries removed to stay within the size limit"""
+
+
+class ResultCache:
+    """
+    An on-disk, size-bounded LRU cache of edit lists.
+    """
+
+    def __init__(self, cache_dir: str, config: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache, creating the directory if needed.
+
+        Args:
+            cache_dir: Directory to store the entries in
+            config: Digest of the configuration, see `config_digest`
+            max_bytes: Size limit that `prune` enforces
+        """
+        self.cache_dir = cache_dir
+        self.config = config
+        self.max_bytes = max_bytes
+        self.stats = ResultCacheStats()
+        """Hit, miss and eviction counters for this cache"""
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, src: SourceBytes) -> str:
+        """
+        Compute the cache key of a source.
+
+        Args:
+            src: The source code
+
+        Returns:
+            Hex digest of the source and the configuration
+        """
+        h = hashlib.sha256(self.config.encode())
+        h.update(src)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        """
+        Get the file that stores an entry.
+        """
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[List[Edit]]:
+        """
+        Look up the edits for a key and mark the entry as recently used.
+
+        Args:
+            key: The cache key, see `key`
+
+        Returns:
+            The cached edits, or `None` if there is no (readable) entry
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            edits = _decode_edits(data)
+        except OSError:
+            self.stats.misses += 1
+            return None
+        except Exception:  # noqa: BLE001 - a corrupt entry is only a miss
+            self.stats.misses += 1
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        self.stats.hits += 1
+        return edits
+
+    def put(self, key: str, edits: List[Edit]) -> None:
+        """
+        Store the edits for a key.
+
+        Args:
+            key: The cache key, see `key`
+            edits: The edits to store
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_open(path) as f:
+            f.write(_encode_edits(edits))
+
+    def prune(self) -> int:
+        """
+        Evict the least recently used entries until the cache is within its
+        size limit.
+
+        Returns:
+            The number of evicted entries
+        """
+        entries: List[Tuple[int, int, str]] = []
+        total = 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+
+        evicted = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            total -= size
+            evicted += 1
+        self.stats.evicted += evicted
+        return evicted
+
+
+def _encode_edits(edits: List[Edit]) -> bytes:
+    """
+    Serialize edits as a JSON list of `[start, end, replacement, reason]`.
+    Replacements that are not UTF-8 round-trip as escaped surrogates.
+    """
+    rows = [
+        [
+            edit.start_byte,
+            edit.end_byte,
+            edit.replacement.decode("utf8", errors="surrogateescape"),
+            None if edit.reason is None else edit.reason.value,
+        ]
+        for edit in edits
+    ]
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+
+def _decode_edits(data: bytes) -> List[Edit]:
+    """
+    Deserialize the edits of `_encode_edits`.
+
+    Raises:
+        ValueError: If the data is not a valid list of edits
+    """
+    rows: Any = json.loads(data)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a list of edits")
+    edits = []
+    for start, end, replacement, reason in rows:
+        if not (type(start) is int and type(end) is int and isinstance(replacement, str)):
+            raise ValueError(f"Invalid edit: {[start, end, replacement, reason]!r}")
+        edits.append(
+            Edit(
+                start,
+                end,
+                replacement.encode("utf8", errors="surrogateescape"),
+                None if reason is None else EditReason(reason),
+            )
+        )
+    return edits
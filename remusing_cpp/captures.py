@@ -0,0 +1,571 @@
+"""
+This module contains a compact, array-backed store for tree-sitter captures and
+sorted-merge set operations on capture spans.
+
+A span is the `(start_byte, end_byte)` range of a captured node, packed into a
+single integer as `start_byte << 32 | end_byte` so that sorting packed spans
+orders them by start and then by end. Sets of spans are kept as sorted,
+de-duplicated `array('Q')` objects instead of sets of node wrappers.
+
+A `SpanColumn` keeps sorted spans up to date while the text they refer to is
+edited, see `remusing_cpp.core.RemUsing.apply_text_edit`.
+"""
+from array import array
+from bisect import bisect_left
+from itertools import repeat
+from operator import add, and_, itemgetter, rshift, sub
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from tree_sitter import Node
+
+_END_MASK = (1 << 32) - 1
+# Adding a multiple of this to a packed span moves both its start and its end
+_BYTE = (1 << 32) | 1
+# Offset of the moved spans of a `SpanColumn` when they are first moved, so
+# that the stored values stay positive when the text before them shrinks
+_BIAS = 1 << 31
+
+
+def pack_span(start_byte: int, end_byte: int) -> int:
+    """
+    Pack a byte range into a single sortable integer.
+
+    Args:
+        start_byte: Start of the range
+        end_byte: End of the range
+
+    Returns:
+        The packed span
+    """
+    return start_byte << 32 | end_byte
+
+
+def unpack_span(span: int) -> Tuple[int, int]:
+    """
+    Unpack a span created by `pack_span`.
+
+    Args:
+        span: The packed span
+
+    Returns:
+        The `(start_byte, end_byte)` range
+    """
+    return span >> 32, span & _END_MASK
+
+
+def iter_spans(spans: Iterable[int]) -> Iterator[Tuple[int, int]]:
+    """
+    Unpack a sequence of spans.
+
+    Args:
+        spans: Packed spans
+
+    Returns:
+        The `(start_byte, end_byte)` range of each span
+    """
+    for span in spans:
+        yield span >> 32, span & _END_MASK
+
+
+def union(*spans: "array[int]") -> "array[int]":
+    """
+    Merge sorted, de-duplicated span arrays into one.
+
+    Args:
+        spans: Sorted, de-duplicated span arrays
+
+    Returns:
+        The sorted, de-duplicated union of the spans
+    """
+    merged = array("Q")
+    for other in spans:
+        if not other:
+            continue
+        if not merged:
+            merged = array("Q", other)
+            continue
+        out = array("Q")
+        i = j = 0
+        n, m = len(merged), len(other)
+        while i < n and j < m:
+            a, b = merged[i], other[j]
+            if a < b:
+                out.append(a)
+                i += 1
+            elif b < a:
+                out.append(b)
+                j += 1
+            else:
+                out.append(a)
+                i += 1
+                j += 1
+        out.extend(merged[i:])
+        out.extend(other[j:])
+        merged = out
+    return merged
+
+
+def difference(spans: "array[int]", remove: "array[int]") -> "array[int]":
+    """
+    Remove spans from a sorted, de-duplicated span array.
+
+    Args:
+        spans: Sorted, de-duplicated spans
+        remove: Sorted, de-duplicated spans to remove
+
+    Returns:
+        The sorted spans of `spans` that are not in `remove`
+    """
+    if not remove:
+        return spans
+    out = array("Q")
+    j, m = 0, len(remove)
+    for span in spans:
+        while j < m and remove[j] < span:
+            j += 1
+        if j == m or remove[j] != span:
+            out.append(span)
+    return out
+
+
+def touching(spans: "array[int]", start: int, end: int) -> "array[int]":
+    """
+    Select the spans that overlap or touch a byte range.
+
+    Args:
+        spans: Sorted spans
+        start: Start of the range
+        end: End of the range (inclusive)
+
+    Returns:
+        The sorted spans that overlap `[start, end]`
+    """
+    first = bisect_left(spans, start << 32) if start else 0
+    # Only spans that start before the range can end in it, so look at those
+    # one by one and slice the rest
+    out = array("Q", (span for span in spans[:first] if span & _END_MASK >= start))
+    out.extend(spans[first : bisect_left(spans, (end + 1) << 32)])
+    return out
+
+
+def _moved(spans: "array[int]", delta: int) -> "array[int]":
+    """
+    Move spans by `delta` bytes in bulk, without a Python loop.
+    """
+    return array("Q", map(add, spans, repeat(delta * _BYTE)))
+
+
+def _max_length(spans: "array[int]") -> int:
+    """
+    Get the length of the longest span in bulk, without a Python loop.
+    """
+    ends = map(and_, spans, repeat(_END_MASK))
+    return max(map(sub, ends, map(rshift, spans, repeat(32))), default=0)
+
+
+class SpanColumn:
+    """
+    Sorted, de-duplicated spans, optionally with a value for each span, that
+    are kept up to date while the text they refer to is edited.
+
+    An edit moves all the spans after it. Instead of rewriting each of them,
+    the spans from an index on are stored with a common offset, so the edit
+    only changes the offset. Like the gap of a text editor's gap buffer, the
+    index follows the edits, and only the spans between two consecutive edit
+    positions are converted, in bulk on array slices.
+    """
+
+    def __init__(self, spans: "array[int]", values: Optional[List[Any]] = None):
+        """
+        Initialize the column. It takes ownership of the arguments.
+
+        Args:
+            spans: Sorted, de-duplicated spans
+            values: A value for each span
+        """
+        self._spans = spans
+        self._values = values
+        # The spans from `_split` on are stored `_offset` bytes after their
+        # positions
+        self._split = len(spans)
+        self._offset = 0
+        self._max_length: Optional[int] = None
+
+    def __len__(self) -> int:
+        """
+        Get the number of spans.
+        """
+        return len(self._spans)
+
+    def spans(self) -> "array[int]":
+        """
+        Get the spans. Converting the moved spans takes time linear in their
+        number, so this is meant for processing all of them.
+
+        Returns:
+            The sorted spans. The array is updated in place by later edits.
+        """
+        self._move_split(len(self._spans))
+        return self._spans
+
+    def values(self) -> List[Any]:
+        """
+        Get the values of the spans, in the order of `spans`.
+
+        Returns:
+            The values. The list is updated in place by later edits.
+        """
+        assert self._values is not None
+        return self._values
+
+    def max_length(self) -> int:
+        """
+        Get an upper bound of the length of the spans, the longest span that
+        was ever stored.
+
+        Returns:
+            The bound in bytes
+        """
+        if self._max_length is None:
+            self._max_length = _max_length(self.spans())
+        return self._max_length
+
+    def _move_split(self, index: int) -> None:
+        """
+        Store the spans before `index` at their positions and the spans from
+        `index` on with the offset.
+        """
+        spans, split = self._spans, self._split
+        if index > split:
+            spans[split:index] = _moved(spans[split:index], -self._offset)
+        elif index < split:
+            if split == len(spans):
+                self._offset = _BIAS
+            spans[index:split] = _moved(spans[index:split], self._offset)
+        self._split = index
+
+    def _find(self, start: int) -> int:
+        """
+        Find the index of the first span that starts at or after `start`.
+        """
+        split = self._split
+        index = bisect_left(self._spans, start << 32, 0, split)
+        if index < split:
+            return index
+        return bisect_left(self._spans, (start + self._offset) << 32, split)
+
+    def starting_in(self, first: int, last: int) -> Tuple["array[int]", List[Any]]:
+        """
+        Select the spans that start in a byte range.
+
+        Args:
+            first: First start byte to select
+            last: Last start byte to select
+
+        Returns:
+            The sorted spans, and their values if the column has values
+        """
+        lo, hi = self._find(first), self._find(last + 1)
+        self._move_split(max(hi, self._split))
+        return self._spans[lo:hi], [] if self._values is None else self._values[lo:hi]
+
+    def edit(self, start_byte: int, old_end_byte: int, new_end_byte: int) -> None:
+        """
+        Update the spans for the replacement of the text in `[start_byte,
+        old_end_byte)` with text that ends at `new_end_byte`. The spans that
+        start in the replaced text are dropped, and the spans after it are
+        moved. The spans before it are kept as they are, even if they reach
+        into it, so `remove` has to be called with a range that covers the new
+        text.
+
+        Args:
+            start_byte: Start of the replaced text
+            old_end_byte: End of the replaced text
+            new_end_byte: End of the new text
+        """
+        first, last = self._find(start_byte), self._find(old_end_byte)
+        self._move_split(first)
+        del self._spans[first:last]
+        if self._values is not None:
+            del self._values[first:last]
+        self._offset -= new_end_byte - old_end_byte
+
+    def remove(self, start: int, end: int) -> Tuple["array[int]", List[Any]]:
+        """
+        Remove the spans that overlap or touch a byte range.
+
+        Args:
+            start: Start of the range
+            end: End of the range (inclusive)
+
+        Returns:
+            The removed spans, and their values if the column has values
+        """
+        # Only the spans that start at most `max_length` bytes before the
+        # range can reach into it
+        lo = self._find(max(0, start - self.max_length()))
+        hi = self._find(end + 1)
+        self._move_split(hi)
+        window = self._spans[lo:hi]
+        keep = [i for i, span in enumerate(window) if span & _END_MASK < start]
+        removed = array("Q", (span for span in window if span & _END_MASK >= start))
+        self._spans[lo:hi] = array("Q", [window[i] for i in keep])
+        removed_values: List[Any] = []
+        if self._values is not None:
+            values = self._values[lo:hi]
+            removed_values = [
+                value for span, value in zip(window, values) if span & _END_MASK >= start
+            ]
+            self._values[lo:hi] = [values[i] for i in keep]
+        self._split = lo + len(keep)
+        return removed, removed_values
+
+    def insert(self, spans: "array[int]", values: Optional[List[Any]] = None) -> None:
+        """
+        Add spans that are not in the column yet.
+
+        Args:
+            spans: Sorted, de-duplicated spans
+            values: A value for each span, if the column has values
+        """
+        if not spans:
+            return
+        self._max_length = max(self.max_length(), _max_length(spans))
+        lo, hi = self._find(spans[0] >> 32), self._find((spans[-1] >> 32) + 1)
+        self._move_split(hi)
+        if self._values is None:
+            merged = union(self._spans[lo:hi], spans)
+        else:
+            assert values is not None
+            pairs = sorted(
+                [*zip(self._spans[lo:hi], self._values[lo:hi]), *zip(spans, values)],
+                key=itemgetter(0),
+            )
+            merged = array("Q", map(itemgetter(0), pairs))
+            self._values[lo:hi] = list(map(itemgetter(1), pairs))
+        self._spans[lo:hi] = merged
+        self._split = lo + len(merged)
+
+
+class CaptureStore:
+    """
+    Columnar storage of tree-sitter captures.
+
+    Each capture is a row of three parallel arrays: the start byte, the end
+    byte and the id of the capture name. No per-capture Python objects are
+    kept.
+
+    After `edit`, the spans of each capture name are kept in a `SpanColumn`,
+    and the rows are rebuilt from them when they are needed.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty store.
+        """
+        self.start_bytes = array("I")
+        """Start byte of each capture"""
+        self.end_bytes = array("I")
+        """End byte of each capture"""
+        self.capture_ids = array("I")
+        """Capture name id of each capture, an index into `names`"""
+        self.names: List[str] = []
+        """Capture names by id"""
+        self._ids: Dict[str, int] = {}
+        self._spans: Dict[int, "array[int]"] = {}
+        self._columns: Optional[Dict[int, SpanColumn]] = None
+        self._rows_stale = False
+
+    def __len__(self) -> int:
+        """
+        Get the number of stored captures.
+        """
+        self._sync_rows()
+        return len(self.capture_ids)
+
+    def capture_id(self, name: str) -> int:
+        """
+        Get the id of a capture name, assigning a new one on first use.
+
+        Args:
+            name: The capture name
+
+        Returns:
+            The capture name id
+        """
+        capture_id = self._ids.get(name)
+        if capture_id is None:
+            capture_id = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return capture_id
+
+    def append(self, start_byte: int, end_byte: int, name: str) -> None:
+        """
+        Add a capture.
+
+        Args:
+            start_byte: Start of the captured node
+            end_byte: End of the captured node
+            name: The capture name
+        """
+        self._drop_columns()
+        self.start_bytes.append(start_byte)
+        self.end_bytes.append(end_byte)
+        self.capture_ids.append(self.capture_id(name))
+        self._spans.clear()
+
+    def extend(self, captures: Iterable[Tuple[Node, str]]) -> None:
+        """
+        Add the captures returned by a tree-sitter query.
+
+        Args:
+            captures: `(node, capture name)` pairs
+        """
+        self._drop_columns()
+        ids = self._ids
+        start_bytes, end_bytes, capture_ids = self.start_bytes, self.end_bytes, self.capture_ids
+        for node, name in captures:
+            capture_id = ids.get(name)
+            if capture_id is None:
+                capture_id = self.capture_id(name)
+            start_bytes.append(node.start_byte)
+            end_bytes.append(node.end_byte)
+            capture_ids.append(capture_id)
+        self._spans.clear()
+
+    def rows(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        Iterate over the stored captures.
+
+        Returns:
+            `(start_byte, end_byte, capture id)` for each capture
+        """
+        self._sync_rows()
+        return zip(self.start_bytes, self.end_bytes, self.capture_ids)
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count the stored captures by name.
+
+        Returns:
+            The number of captures per capture name
+        """
+        self._sync_rows()
+        totals = [0] * len(self.names)
+        for capture_id in self.capture_ids:
+            totals[capture_id] += 1
+        return dict(zip(self.names, totals))
+
+    def spans(self, name: str) -> "array[int]":
+        """
+        Get the spans captured under a name.
+
+        Args:
+            name: The capture name
+
+        Returns:
+            Sorted, de-duplicated packed spans. Empty if nothing was captured.
+        """
+        capture_id: Optional[int] = self._ids.get(name)
+        if capture_id is None:
+            return array("Q")
+        if self._columns is not None:
+            return self._columns[capture_id].spans()
+        if not self._spans:
+            groups: List[Set[int]] = [set() for _ in self.names]
+            for start, end, cid in self.rows():
+                groups[cid].add(start << 32 | end)
+            self._spans = {cid: array("Q", sorted(group)) for cid, group in enumerate(groups)}
+        return self._spans[capture_id]
+
+    def column(self, name: str) -> SpanColumn:
+        """
+        Get the spans captured under a name as a column that `edit` keeps up
+        to date.
+
+        Args:
+            name: The capture name
+
+        Returns:
+            The column of the spans
+        """
+        capture_id = self.capture_id(name)
+        return self._to_columns()[capture_id]
+
+    def edit(
+        self,
+        start_byte: int,
+        old_end_byte: int,
+        new_end_byte: int,
+        ranges: List[Tuple[int, int]],
+        captures: Iterable[Tuple[Node, str]],
+    ) -> "CaptureStore":
+        """
+        Update the captures for an edit of the source, see `SpanColumn.edit`.
+        The captures that overlap or touch the changed byte ranges are replaced
+        with the new ones there. The other captures are kept, and those after
+        the edit are moved in bulk.
+
+        Args:
+            start_byte: Start of the replaced text
+            old_end_byte: End of the replaced text
+            new_end_byte: End of the new text
+            ranges: Sorted, disjoint byte ranges of the new source whose
+                captures changed, as `(start, end)` with an inclusive end. One
+                of them must cover `[start_byte, new_end_byte]`.
+            captures: The captures in the ranges, `(node, capture name)` pairs
+
+        Returns:
+            The new captures
+        """
+        added = CaptureStore()
+        added.extend(captures)
+        columns = self._to_columns()
+        for column in columns.values():
+            column.edit(start_byte, old_end_byte, new_end_byte)
+        for name in added.names:
+            self.column(name)
+        # Range by range, so that a capture that touches two ranges is first
+        # removed with the first one and then added back with the second one
+        for start, end in ranges:
+            for name, capture_id in self._ids.items():
+                column = columns[capture_id]
+                column.remove(start, end)
+                column.insert(touching(added.spans(name), start, end))
+        self._rows_stale = True
+        return added
+
+    def _to_columns(self) -> Dict[int, SpanColumn]:
+        """
+        Move the spans into columns, see `edit`.
+        """
+        if self._columns is None:
+            spans = {capture_id: self.spans(name) for name, capture_id in self._ids.items()}
+            self._columns = {capture_id: SpanColumn(spans[capture_id]) for capture_id in spans}
+            self._spans = {}
+        for capture_id in range(len(self._columns), len(self.names)):
+            self._columns[capture_id] = SpanColumn(array("Q"))
+        return self._columns
+
+    def _sync_rows(self) -> None:
+        """
+        Rebuild the rows from the columns after an `edit`.
+        """
+        if not self._rows_stale:
+            return
+        assert self._columns is not None
+        self.start_bytes, self.end_bytes, self.capture_ids = array("I"), array("I"), array("I")
+        for capture_id, column in self._columns.items():
+            spans = column.spans()
+            self.start_bytes.extend(map(rshift, spans, repeat(32)))
+            self.end_bytes.extend(map(and_, spans, repeat(_END_MASK)))
+            self.capture_ids.extend(repeat(capture_id, len(spans)))
+        self._rows_stale = False
+
+    def _drop_columns(self) -> None:
+        """
+        Go back to the rows before adding captures to them.
+        """
+        if self._columns is not None:
+            self._sync_rows()
+            self._columns = None
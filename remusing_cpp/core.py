@@ -1,16 +1,81 @@
 """
 This module is the core of functionality for the library.
 """
-from typing import Dict, List, Optional, Set, Tuple
+from array import array
+from bisect import bisect_right
+from contextlib import nullcontext
+from itertools import chain, repeat
+from operator import rshift
+from typing import TYPE_CHECKING, Any, ContextManager, Dict, List, Mapping, Optional, Tuple, Union
 
 from tree_sitter import Language, Node, Parser, Tree
 
-from remusing_cpp.queries import SymbolQuery, TypeQuery, UsingQuery
-from remusing_cpp.symbols import (
-    get_default_std_symbols,
-    get_default_symb_namespace_map,
+from remusing_cpp.captures import (
+    CaptureStore,
+    SpanColumn,
+    difference,
+    iter_spans,
+    touching,
+    union,
+)
+from remusing_cpp.edits import Edit, EditReason, SourceBytes, apply_edits
+from remusing_cpp.queries import DEFAULT_QUERY_CACHE, SymbolQuery, TypeQuery, UsingQuery
+from remusing_cpp.report import Category, Finding, LineIndex, SourceReport
+from remusing_cpp.resolve import NamespaceTable, Resolution, resolution
+from remusing_cpp.stats import RemUsingStats
+from remusing_cpp.symbols import default_namespace_map, get_default_std_symbols
+from remusing_cpp.walker import TreeWalker
+
+if TYPE_CHECKING:
+    # `tree_sitter` exports `Query` since 0.21, but the stubs only declare it
+    # in `tree_sitter.binding`, where it lived before
+    from tree_sitter.binding import Query
+
+QUERY_ENGINE = "query"
+"""Collect the captures with the combined tree-sitter query"""
+WALKER_ENGINE = "walker"
+"""Collect the captures in a single scope-aware traversal of the tree"""
+ENGINES = (QUERY_ENGINE, WALKER_ENGINE)
+"""Engines supported by `RemUsing.engine`"""
+
+
+# Marker for identifiers that were not resolved yet
+_UNKNOWN: Any = object()
+
+# Nodes whose direct children are at namespace scope
+_NAMESPACE_SCOPES = frozenset(
+    [
+        "translation_unit",
+        "namespace_definition",
+        "declaration_list",
+        "linkage_specification",
+        "preproc_if",
+        "preproc_ifdef",
+        "preproc_else",
+        "preproc_elif",
+    ]
+)
+
+# Nodes whose direct children are at namespace scope, except for the name of
+# a namespace, see `_declaration_range`
+_SCOPE_BODIES = _NAMESPACE_SCOPES - {"namespace_definition"}
+
+# Nodes whose direct children are declarations
+_DECLARATION_SCOPES = _NAMESPACE_SCOPES | {"field_declaration_list", "template_declaration"}
+
+# Nodes that declare the type named by their `name` field
+_TYPE_SPECIFIERS = frozenset(
+    ["class_specifier", "struct_specifier", "union_specifier", "enum_specifier"]
+)
+
+# Template parameters that declare a type name
+_TYPE_PARAMETERS = frozenset(
+    [
+        "type_parameter_declaration",
+        "optional_type_parameter_declaration",
+        "variadic_type_parameter_declaration",
+    ]
 )
-from remusing_cpp.ts_model import HashableTreeNode
 
 
 class RemUsing:
@@ -18,12 +83,13 @@ class RemUsing:
     Class to remove `using` declarations and refactor symbol names.
     """
 
-    def __init__(self, src: bytes, parser: Parser, language: Language):
+    def __init__(self, src: SourceBytes, parser: Parser, language: Language):
         """
         Initialize the class.
 
         Arguments:
-            src: The starting C++ source code
+            src: The starting C++ source code. This may be a memory-mapped
+                file, see `remusing_cpp.util.open_source`.
             parser: The C++ tree-sitter parser
             language: The C++ tree-sitter language
         """
@@ -36,14 +102,68 @@ class RemUsing:
         self.using_query = UsingQuery()
 
         self.find_symbols = get_default_std_symbols()
-        self.hardcoded_namespace_map = get_default_symb_namespace_map()
+        self.hardcoded_namespace_map: Mapping[str, str] = default_namespace_map()
+        """
+        Namespaces of known symbols, the shared read-only default map unless
+        it is replaced, e.g. with the symbol map files of
+        `remusing_cpp.symbols.layered_namespace_map`
+        """
+        self.index_namespace_map: Dict[str, str] = {}
+        """
+        Namespaces of project symbols, e.g. from
+        `remusing_cpp.index.SymbolIndex.namespace_map`. Used for names that
+        neither a `using` declaration nor the hardcoded map resolves.
+        """
+        self.namespace_table: Optional[NamespaceTable] = None
+        """
+        The compiled hardcoded and index namespace maps, see
+        `remusing_cpp.resolve.NamespaceTable.from_maps`. Set it to share a
+        table across instances with the same maps, otherwise it is built from
+        the maps when the edits are computed.
+        """
+
+        self.query_cache = DEFAULT_QUERY_CACHE
+        """Cache of compiled queries, shared across instances by default"""
+        self.compiled_query: Optional[Query] = None
+        """The compiled tree-sitter query, available after running `query`"""
+        self.engine = QUERY_ENGINE
+        """
+        How to collect the captures, one of `ENGINES`. The `walker` engine
+        (see `remusing_cpp.walker.TreeWalker`) walks the tree once and does
+        not qualify names that are declared in an enclosing scope.
+        """
+        self.query_window_bytes = 1 << 20
+        """
+        Run the query over windows of about this many bytes, so that the
+        captured nodes of only one window are alive at a time
+        """
+        self.ranges: Optional[List[Tuple[int, int]]] = None
+        """
+        Only fix within these byte ranges `[start, end)` of the source, e.g.
+        a diff hunk or a selection, see `remusing_cpp.report.LineIndex` for
+        line ranges. The query only runs over the ranges, plus the `using`
+        declarations at namespace scope and in the blocks that enclose a
+        range, which still resolve the names in the ranges. A `using`
+        declaration is only removed if it lies completely inside a range.
+        The `walker` engine still walks the whole tree.
+        """
+
+        self.stats: Optional[RemUsingStats] = None
+        """
+        Set to record stage timings and counters, see
+        `remusing_cpp.stats.RemUsingStats`
+        """
 
         self._tree: Optional[Tree] = None
         self._query_str: Optional[str] = None
-        self._captures: Optional[List[Tuple[Node, str]]] = None
-        self._lookup_captures: Optional[Dict[str, Set[HashableTreeNode]]] = None
-        self._unqualified_types: Optional[List[HashableTreeNode]] = None
-        self._decl_ns_map: Optional[Dict[str, str]] = None
+        self._capture_store: Optional[CaptureStore] = None
+        self._unqualified_types: Optional[SpanColumn] = None
+        self._decl_ns_map: Optional[Dict[bytes, bytes]] = None
+        self._edits: Optional[List[Edit]] = None
+        # The fixup spans of the `_edits` and the unresolved spans, to key the
+        # `_edit_columns` on
+        self._edit_spans: Optional[Tuple["array[int]", "array[int]"]] = None
+        self._edit_columns: Optional[_EditColumns] = None
 
         # API State tracking
         self._did_parse = False
@@ -58,10 +178,27 @@ class RemUsing:
         if self._did_parse:
             return
 
-        self._tree = self.parser.parse(self.src)
+        with self._timed("parse"):
+            # tree-sitter accepts any buffer, including memory-mapped files
+            self._tree = self.parser.parse(self.src)  # type: ignore[arg-type]
 
         self._did_parse = True
 
+    def build_query(self) -> str:
+        """
+        Build the combined query text from the configured query builders.
+
+        Returns:
+            The query string to pass to tree-sitter
+        """
+        return "\n".join(
+            [
+                self.types_query.build_all_queries(),
+                self.symbols_query.build_all_queries(),
+                self.using_query.build_all_queries(),
+            ]
+        )
+
     def query(self) -> None:
         """
         Run tree-sitter queries on the parsed source code to gather necessary
@@ -72,19 +209,55 @@ class RemUsing:
         else:
             self.parse()
 
-        self._query_str = "\n".join(
-            [
-                self.types_query.build_all_queries(),
-                self.symbols_query.build_all_queries(),
-                self.using_query.build_all_queries(),
-            ]
-        )
-        query = self.language.query(self._query_str)
-        assert self._tree is not None
-        self._captures = query.captures(self._tree.root_node)
+        with self._timed("query"):
+            assert self._tree is not None
+            if self.engine == WALKER_ENGINE:
+                store = self._walker().walk(self._tree, self.src)
+            else:
+                store = self._query_captures()
+        self._capture_store = store
+        if self.stats is not None:
+            self.stats.record_captures(store.counts())
 
         self._did_query = True
 
+    def _query_captures(self) -> CaptureStore:
+        """
+        Collect the captures with the compiled tree-sitter query.
+        """
+        assert self._tree is not None
+        self._query_str = self.build_query()
+        self.compiled_query = self.query_cache.get(self.language, self._query_str)
+        root = self._tree.root_node
+        # Collect all captures into a compact columnar representation
+        store = CaptureStore()
+        if self.ranges is not None:
+            ranges = _merge_ranges(list(self.ranges))
+            using_query = self.query_cache.get(self.language, self.using_query.build_all_queries())
+            for start_byte, end_byte in _using_declarations(root, ranges):
+                # The stubs lack the byte range arguments that 0.21 accepts
+                store.extend(
+                    using_query.captures(  # type: ignore[call-arg]
+                        root, start_byte=start_byte, end_byte=end_byte
+                    )
+                )
+        else:
+            ranges = _query_windows(root, self.query_window_bytes)
+        for start_byte, end_byte in ranges:
+            # The stubs lack the byte range arguments that 0.21 accepts
+            store.extend(
+                self.compiled_query.captures(  # type: ignore[call-arg]
+                    root, start_byte=start_byte, end_byte=end_byte
+                )
+            )
+        return store
+
+    def _walker(self) -> TreeWalker:
+        """
+        Create a tree walker with the capture names of the query builders.
+        """
+        return TreeWalker(self.types_query, self.symbols_query, self.using_query)
+
     def process_captures(self) -> None:
         """
         Process the captured elements that we queried and enable our fixes.
@@ -94,110 +267,710 @@ class RemUsing:
         else:
             self.query()
 
-        # Collect all captures into a workable representation
-        self._lookup_captures = {}
-        assert self._captures is not None
-        for cap in self._captures:
-            cap_node: Node = cap[0]
-            cap_name: str = cap[1]
-            if cap_name not in self._lookup_captures:
-                self._lookup_captures[cap_name] = {HashableTreeNode(cap_node)}
-            else:
-                self._lookup_captures[cap_name].add(HashableTreeNode(cap_node))
-
-        # Gather unqualified identifiers
-        all_types = self._lookup_captures.get(self.types_query.TYPE_ALL_CAPTURE, set())
-        self._unqualified_types = sorted(
-            set.union(
-                # We collected _all_ type_identifiers, so we need to filter out the qualified ones
-                all_types.difference(
-                    set.union(
-                        self._lookup_captures.get(self.types_query.TYPE_QUAL_CAPTURE, set()),
-                        self._lookup_captures.get(
-                            self.types_query.TYPE_QUAL_TEMPLATE_CAPTURE, set()
-                        ),
-                    )
+        with self._timed("process_captures"):
+            self._derive_from_captures()
+
+        self._did_process_captures = True
+
+    def _derive_from_captures(self) -> None:
+        """
+        Compute the unqualified identifiers and the `using` declaration
+        namespace map from the collected captures.
+        """
+        assert self._capture_store is not None
+        self._unqualified_types = SpanColumn(self._unqualified(self._capture_store))
+        self._decl_ns_map = self._using_namespaces()
+
+    def _unqualified(self, store: CaptureStore) -> "array[int]":
+        """
+        Select the unqualified identifiers among the captures of a store.
+        """
+        unqualified = union(
+            # We collected _all_ type_identifiers, so we need to filter out the qualified ones
+            difference(
+                store.spans(self.types_query.TYPE_ALL_CAPTURE),
+                union(
+                    store.spans(self.types_query.TYPE_QUAL_CAPTURE),
+                    store.spans(self.types_query.TYPE_QUAL_TEMPLATE_CAPTURE),
                 ),
-                self._lookup_captures.get(self.symbols_query.SYMBOL_CAPTURE, set()),
-                self._lookup_captures.get(self.symbols_query.SYMBOL_FUNC_CAPTURE, set()),
-            )
+            ),
+            store.spans(self.symbols_query.SYMBOL_CAPTURE),
+            store.spans(self.symbols_query.SYMBOL_FUNC_CAPTURE),
         )
+        return self._in_ranges(unqualified)
 
-        # Map of `using` qualified-type declarations from type to namespace
-        self._decl_ns_map = {}
-        for decl in self._lookup_captures.get(self.using_query.USING_QUAL_TYPE_CAPTURE, []):
-            node = decl.node
+    def _using_namespaces(self) -> Dict[bytes, bytes]:
+        """
+        Map the types of the `using` qualified-type declarations to their
+        namespaces.
+        """
+        assert self._capture_store is not None
+        assert self._tree is not None
+        decl_ns_map = {}
+        root = self._tree.root_node
+        spans = self._capture_store.spans(self.using_query.USING_QUAL_TYPE_CAPTURE)
+        for start, end in iter_spans(spans):
+            # The smallest node that spans the capture is the captured one.
+            # The stubs lack `descendant_for_byte_range`, which 0.21 has
+            node = root.descendant_for_byte_range(start, end)  # type: ignore[attr-defined]
+            assert node is not None and node.type == "qualified_identifier"
             name_node = node.child_by_field_name("name")
             scope_node = node.child_by_field_name("scope")
-            name = ""
+            name = b""
             scope = []
 
             # Handle nested scope namespace
             while scope_node and name_node:
-                name = name_node.text.decode("utf8")
-                scope.append(scope_node.text.decode("utf8"))
+                name = name_node.text
+                scope.append(scope_node.text)
 
                 scope_node = name_node.child_by_field_name("scope")
                 name_node = name_node.child_by_field_name("name")
 
-            scope_text = "::".join(scope)
-            self._decl_ns_map[name] = scope_text
+            decl_ns_map[name] = b"::".join(scope)
+        return decl_ns_map
 
-        self._did_process_captures = True
+    def apply_text_edit(self, start_byte: int, old_end_byte: int, new_text: bytes) -> None:
+        """
+        Replace `src[start_byte:old_end_byte]` with `new_text` and update the
+        analysis incrementally.
+
+        The existing syntax tree is edited and reparsed by tree-sitter, and the
+        queries are only run over the declarations whose syntax changed. The
+        captures, the unqualified identifiers and the edits are only replaced
+        in those ranges. Those after the change are moved in bulk, see
+        `remusing_cpp.captures.SpanColumn`, so apart from the reparse, the
+        cost of an edit does not grow with the size of the source. A change
+        of the `using` declarations of types recomputes all the edits, since
+        these apply everywhere.
+        With the `walker` engine, the new tree is walked in full, since the
+        scopes around a change depend on everything before it.
+        Call `edits` or `fix` afterwards to get the fixes for the new source.
 
-    def fix(self) -> bytes:
+        Arguments:
+            start_byte: Start of the replaced range
+            old_end_byte: End of the replaced range in the current source
+            new_text: The replacement text
         """
-        Fix the source code to remove `using` declarations and add namespace
-        qualifications to the unqualified symbols.
+        self.process_captures()
+        assert self._tree is not None
+        assert self._capture_store is not None
+
+        old_src = self.src if isinstance(self.src, bytes) else self.src[:]
+        new_end_byte = start_byte + len(new_text)
+        new_src = b"".join([old_src[:start_byte], new_text, old_src[old_end_byte:]])
+
+        old_tree = self._tree
+        with self._timed("parse"):
+            old_tree.edit(
+                start_byte=start_byte,
+                old_end_byte=old_end_byte,
+                new_end_byte=new_end_byte,
+                start_point=_byte_to_point(old_src, start_byte),
+                old_end_point=_byte_to_point(old_src, old_end_byte),
+                new_end_point=_byte_to_point(new_src, new_end_byte),
+            )
+            self._tree = self.parser.parse(new_src, old_tree)
+            root = self._tree.root_node
+            # Error recovery can reinterpret code far away from the edit, so
+            # trees with syntax errors are queried in full
+            changed = [(0, len(new_src))]
+            if not root.has_error:
+                # The stubs only know `get_changed_ranges`, its name before 0.21
+                changed_ranges = old_tree.changed_ranges(self._tree)  # type: ignore[attr-defined]
+                changed = [(r.start_byte, r.end_byte) for r in changed_ranges]
+                changed.append((start_byte, new_end_byte))
+        self.src = new_src
+        columns = self._edit_columns
+        if columns is None and self._edits is not None and self._edit_spans is not None:
+            columns = _EditColumns(self._edits, *self._edit_spans)
+        self._edits = self._edit_spans = self._edit_columns = None
+        self._did_fix = False
+
+        if self.engine == WALKER_ENGINE:
+            with self._timed("query"):
+                self._capture_store = self._walker().walk(self._tree, new_src)
+                self._derive_from_captures()
+            return
+        assert self.compiled_query is not None
+        assert self._unqualified_types is not None
+
+        with self._timed("query"):
+            # Widen every changed range to the declarations around it, so that
+            # patterns depending on the surrounding syntax are re-run too
+            ranges = _merge_ranges([_declaration_range(root, *r) for r in changed])
+
+            # Query ranges are half-open, so widen them by a byte on each side
+            # to also re-capture the nodes that merely touch a changed range
+            compiled_query = self.compiled_query
+            captures = chain.from_iterable(
+                # The stubs lack the byte range arguments that 0.21 accepts
+                compiled_query.captures(  # type: ignore[call-arg]
+                    root, start_byte=max(0, range_start - 1), end_byte=range_end + 1
+                )
+                for range_start, range_end in ranges
+            )
+            store = self._capture_store
+            added = store.edit(start_byte, old_end_byte, new_end_byte, ranges, captures)
+            unqualified = self._unqualified(added)
+            self._unqualified_types.edit(start_byte, old_end_byte, new_end_byte)
+            for range_start, range_end in ranges:
+                self._unqualified_types.remove(range_start, range_end)
+                self._unqualified_types.insert(touching(unqualified, range_start, range_end))
+            decl_ns_map = self._using_namespaces()
+
+        if columns is None or decl_ns_map != self._decl_ns_map:
+            self._decl_ns_map = decl_ns_map
+            return
+        with self._timed("edits"):
+            columns.edit(start_byte, old_end_byte, new_end_byte)
+            for range_start, range_end in ranges:
+                self._update_edits(columns, range_start, range_end)
+        self._edit_columns = columns
+
+    def _update_edits(self, columns: "_EditColumns", start: int, end: int) -> None:
+        """
+        Recompute the edits of the fixups that overlap or touch `[start, end]`.
+        """
+        assert self._capture_store is not None
+        assert self._unqualified_types is not None
+        removed = columns.remove(start, end)
+        # The removal of a `using` declaration also takes the newlines after
+        # it, so it can reach into the range from before it
+        first = min(start, removed[0] >> 32) if removed else start
+        store = self._capture_store
+        using_decls = self._in_ranges(
+            union(
+                _window(store.column(self.using_query.USING_DECL_CAPTURE), first, start, end),
+                _window(store.column(self.using_query.USING_NS_DECL_CAPTURE), first, start, end),
+            )
+        )
+        fixups = union(_window(self._unqualified_types, first, start, end), using_decls)
+        columns.add(*self._compute_edits(fixups, using_decls))
+
+    def edits(self) -> List[Edit]:
+        """
+        Compute the byte-range edits that remove `using` declarations and add
+        namespace qualifications to the unqualified symbols.
 
         Returns:
-            The new fixed source code.
+            Sorted, non-overlapping edits with the reason for each one
         """
+        if self._edits is not None:
+            return self._edits
         self.process_captures()
+        assert self._capture_store is not None
+        assert self._unqualified_types is not None
+        with self._timed("edits"):
+            if self._edit_columns is not None:
+                edits = self._edit_columns.to_list()
+                unresolved = len(self._edit_columns.unresolved)
+            else:
+                # Need to sort so that it makes creating the edits easier in one go
+                using_decls = self._in_ranges(
+                    union(
+                        self._capture_store.spans(self.using_query.USING_DECL_CAPTURE),
+                        self._capture_store.spans(self.using_query.USING_NS_DECL_CAPTURE),
+                    )
+                )
+                fixups = union(self._unqualified_types.spans(), using_decls)
+                edits, fixed, unresolved_spans = self._compute_edits(fixups, using_decls)
+                self._edit_spans = fixed, unresolved_spans
+                unresolved = len(unresolved_spans)
+        if self.stats is not None:
+            self.stats.record_edits(len(self.src), edits, unresolved)
+        self._edits = edits
+        return edits
+
+    def _compute_edits(
+        self, fixups: "array[int]", using_decls: "array[int]"
+    ) -> Tuple[List[Edit], "array[int]", "array[int]"]:
+        """
+        Create the edits for the unqualified identifiers and the `using`
+        declarations.
 
-        output = b""
-        out_idx = 0
+        Arguments:
+            fixups: Sorted spans of the unqualified identifiers and the
+                `using` declarations
+            using_decls: Sorted spans of the `using` declarations
 
+        Returns:
+            The edits, the span in `fixups` of each edit, and the spans of the
+            unqualified identifiers that no namespace map resolves
+        """
+        assert self._decl_ns_map is not None
         assert self._tree is not None
-        assert self._lookup_captures is not None
+
+        using_decl_set = set(using_decls)
+
+        src = self.src
+        edits: List[Edit] = []
+        # Resolution of each distinct identifier: the `using` declarations of
+        # this source take precedence over the shared table, whose results
+        # are added on first use
+        resolved: Dict[Union[bytes, memoryview], Optional[Resolution]] = {
+            name: resolution(ns, EditReason.DECL_QUALIFICATION)
+            for name, ns in self._decl_ns_map.items()
+            if ns
+        }
+        lookup = self._namespace_table().get
+        fixed = array("Q")
+        unresolved = array("Q")
+        out_idx = 0
+        # Identifiers are sliced through a read-only view of the source, which
+        # hashes and compares like bytes without copying
+        append, fix, miss = edits.append, fixed.append, unresolved.append
+        with memoryview(src) as view:
+            # Spans are unpacked inline, see `remusing_cpp.captures.unpack_span`
+            for span in fixups:
+                start_byte = span >> 32
+                if start_byte < out_idx:
+                    # Part of a `using` declaration that is already removed
+                    continue
+                end_byte = span & 0xFFFFFFFF
+
+                if span in using_decl_set:
+                    # Remove these nodes from the output text
+                    out_idx = end_byte
+                    # Skip newline-like characters
+                    while out_idx < len(src) and src[out_idx] in b"\n\r":
+                        out_idx += 1
+                    append(Edit(start_byte, out_idx, b"", EditReason.USING_REMOVAL))
+                    fix(span)
+                    continue
+
+                out_idx = end_byte
+                identifier = view[start_byte:end_byte]
+                found = resolved.get(identifier, _UNKNOWN)
+                if found is _UNKNOWN:
+                    key = identifier.tobytes()
+                    found = resolved[key] = lookup(key)
+                if found is None:
+                    miss(span)
+                else:
+                    prefix, reason = found
+                    if reason is EditReason.INDEX_QUALIFICATION and not _refers_to_index(
+                        self._tree.root_node, start_byte, end_byte, prefix[:-2]
+                    ):
+                        continue
+                    # Insert into text
+                    append(Edit(start_byte, start_byte, prefix, reason))
+                    fix(span)
+
+        return edits, fixed, unresolved
+
+    def report(self, locations: bool = True) -> SourceReport:
+        """
+        Find the `using` declarations and the unqualified symbols that the
+        fixes would qualify, without computing the edits or the fixed source.
+
+        Arguments:
+            locations: Whether to list every finding with its location, in
+                addition to the counts
+
+        Returns:
+            The findings by category and by namespace
+        """
+        self.process_captures()
+        with self._timed("report"):
+            return self._compute_report(locations)
+
+    def _compute_report(self, locations: bool) -> SourceReport:
+        """
+        Create the report from the processed captures, see `report`.
+        """
+        assert self._capture_store is not None
         assert self._unqualified_types is not None
         assert self._decl_ns_map is not None
+        assert self._tree is not None
+        store = self._capture_store
+        src = self.src
+        report = SourceReport()
+        # Start and end byte, category and namespace of each finding
+        found: List[Tuple[int, int, Category, str]] = []
+
+        # The namespace of a `using` declaration is its identifier, or the
+        # scope of its qualified name
+        using_decls: List[Tuple[int, int]] = []
+        for category, capture, name_capture in (
+            (
+                Category.USING_NAMESPACE,
+                self.using_query.USING_NS_DECL_CAPTURE,
+                self.using_query.USING_IDENT_CAPTURE,
+            ),
+            (
+                Category.USING_DECLARATION,
+                self.using_query.USING_DECL_CAPTURE,
+                self.using_query.USING_QUAL_TYPE_CAPTURE,
+            ),
+        ):
+            names = store.spans(name_capture)
+            for start, end in iter_spans(self._in_ranges(store.spans(capture))):
+                using_decls.append((start, end))
+                namespace = b""
+                i = bisect_right(names, start << 32)
+                if i < len(names) and names[i] >> 32 < end:
+                    name = src[names[i] >> 32 : names[i] & 0xFFFFFFFF]
+                    namespace = name.rpartition(b"::")[0] if b"::" in name else name
+                found.append((start, end, category, namespace.decode("utf8", errors="replace")))
+        using_decls.sort()
+        using_starts = [start for start, _ in using_decls]
+
+        # Resolution of each distinct identifier, with the same precedence as
+        # in `edits`
+        resolved: Dict[bytes, Optional[Resolution]] = {
+            name: resolution(ns, EditReason.DECL_QUALIFICATION)
+            for name, ns in self._decl_ns_map.items()
+            if ns
+        }
+        lookup = self._namespace_table().get
+        root = self._tree.root_node
+        for start, end in iter_spans(self._unqualified_types.spans()):
+            # Names in `using` declarations are removed with them
+            i = bisect_right(using_starts, start) - 1
+            if i >= 0 and start < using_decls[i][1]:
+                continue
+            identifier = src[start:end]
+            found_ns = resolved.get(identifier, _UNKNOWN)
+            if found_ns is _UNKNOWN:
+                found_ns = resolved[identifier] = lookup(identifier)
+            if found_ns is None:
+                continue
+            # Without the trailing "::" of the prefix
+            namespace = found_ns[0][:-2]
+            if found_ns[1] is EditReason.INDEX_QUALIFICATION and not _refers_to_index(
+                root, start, end, namespace
+            ):
+                continue
+            found.append(
+                (start, end, Category.UNQUALIFIED, namespace.decode("utf8", errors="replace"))
+            )
 
-        # Need to sort so that it makes creating the new text easier in one go
-        using_decls = self._lookup_captures.get(self.using_query.USING_DECL_CAPTURE, set())
-        using_ns = self._lookup_captures.get(self.using_query.USING_NS_DECL_CAPTURE, set())
-        fixups = sorted(set.union(set(self._unqualified_types), using_decls, using_ns))
-        for node in fixups:
-            start_byte = node.node.start_byte
-            start_txt = self._tree.text[out_idx:start_byte].decode("utf8")
-
-            if node.node.type == "using_declaration":
-                # Remove these nodes from the output text
-                output += start_txt.encode("utf8")
-                out_idx = node.node.end_byte
-                # Skip newline-like characters
-                while chr(self._tree.text[out_idx]) in {"\n", "\r"}:
-                    out_idx += 1
-            elif node.node.type in {"type_identifier", "identifier"}:
-                end_txt = self._tree.text[node.node.start_byte : node.node.end_byte].decode("utf8")
-                out_idx = node.node.end_byte
-
-                # Lookup namespace from existing 'using <decl>'
-                ns = self._decl_ns_map.get(node.text, "")
-                hard = self.hardcoded_namespace_map.get(node.text, None)
-                if ns:
-                    # Insert into text
-                    output += f"{start_txt}{ns}::{end_txt}".encode()
-                elif hard:
-                    # Maybe it's a hardcoded mapping (to handle 'using namespace <id>')
-                    output += f"{start_txt}{hard}::{end_txt}".encode()
-                else:
-                    # print(f"WARN: Could not find qualifier for type {node.text}")
-                    output += f"{start_txt}{end_txt}".encode()
-            else:  # pragma: no cover
-                print(f"ERROR: Not processing unknown node type: {node.node.type}")
-        output += self._tree.text[out_idx:]
+        for _, _, category, namespace in found:
+            report.add(category, namespace)
+        if locations and found:
+            lines = LineIndex(src)
+            for start, end, category, namespace in sorted(found):
+                line, column = lines.location(start)
+                text = src[start:end].decode("utf8", errors="replace")
+                report.findings.append(Finding(category, line, column, text, namespace))
+        return report
+
+    def _in_ranges(self, spans: "array[int]") -> "array[int]":
+        """
+        Keep the spans that lie completely inside one of the `ranges`.
+        """
+        if self.ranges is None:
+            return spans
+        ranges = _merge_ranges(list(self.ranges))
+        return array("Q", (span for span in spans if _contains(ranges, span)))
+
+    def _namespace_table(self) -> NamespaceTable:
+        """
+        Get the shared namespace table, or build it from the maps.
+        """
+        if self.namespace_table is None:
+            self.namespace_table = NamespaceTable.from_maps(
+                self.hardcoded_namespace_map, self.index_namespace_map
+            )
+        return self.namespace_table
+
+    def fix(self) -> bytes:
+        """
+        Fix the source code to remove `using` declarations and add namespace
+        qualifications to the unqualified symbols.
+
+        Returns:
+            The new fixed source code. This is the original `src` object if
+            nothing needed to change.
+        """
+        edits = self.edits()
+        with self._timed("fix"):
+            output = apply_edits(self.src, edits)
 
         self._did_fix = True
 
         return output
+
+    def _timed(self, stage: str) -> ContextManager[None]:
+        """
+        Time a stage if stats are recorded.
+        """
+        if self.stats is None:
+            return nullcontext()
+        return self.stats.time(stage)
+
+
+def _byte_to_point(src: bytes, byte: int) -> Tuple[int, int]:
+    """
+    Convert a byte offset into a tree-sitter `(row, column)` point.
+    """
+    row = src.count(b"\n", 0, byte)
+    return row, byte - (src.rfind(b"\n", 0, byte) + 1)
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Merge overlapping or touching byte ranges.
+    """
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _declaration_range(root: Node, start: int, end: int) -> Tuple[int, int]:
+    """
+    Widen `[start, end]` to the declarations at namespace scope that it
+    touches, plus their direct neighbours. The name of a namespace and the
+    parameters of a template change what the names inside of it refer to, so
+    a change of those widens to the whole namespace or template.
+    """
+    # The stubs lack `descendant_for_byte_range`, which 0.21 has
+    node: Node = root.descendant_for_byte_range(start, end)  # type: ignore[attr-defined]
+    if node.type in _SCOPE_BODIES:
+        if not node.child_count:
+            return start, end
+        first, last = _child_for_byte(node, start), _child_for_byte(node, end)
+    else:
+        parent = node.parent
+        while parent is not None and parent.type not in _SCOPE_BODIES:
+            node, parent = parent, parent.parent
+        first = last = node
+    before, after = first.prev_sibling, last.next_sibling
+    if before is not None:
+        first = before
+    if after is not None:
+        last = after
+    return min(start, first.start_byte), max(end, last.end_byte)
+
+
+def _child_for_byte(node: Node, byte: int) -> Node:
+    """
+    Find the first child of `node` that ends after `byte`, or its last child.
+    """
+    cursor = node.walk()
+    # The stubs lack these cursor methods, which 0.21 has
+    if not cursor.goto_first_child_for_byte(byte):  # type: ignore[attr-defined]
+        cursor.goto_last_child()  # type: ignore[attr-defined]
+    return cursor.node
+
+
+def _window(column: SpanColumn, first: int, start: int, end: int) -> "array[int]":
+    """
+    Select the spans that start in `[first, end]`, or that overlap or touch
+    `[start, end]`.
+    """
+    spans, _ = column.starting_in(min(first, start - column.max_length()), end)
+    return array("Q", (span for span in spans if span >> 32 >= first or span & 0xFFFFFFFF >= start))
+
+
+def _query_windows(root: Node, size: int) -> List[Tuple[int, int]]:
+    """
+    Split the source into byte ranges of about `size` bytes at node boundaries.
+    Nodes larger than `size`, like big namespace blocks, are split between
+    their children.
+    """
+    if root.end_byte <= size:
+        return [(0, root.end_byte)]
+
+    bounds = [0]
+
+    def split(node: Node) -> None:
+        for child in node.children:
+            if child.end_byte - bounds[-1] > size:
+                if child.start_byte > bounds[-1]:
+                    bounds.append(child.start_byte)
+                if child.end_byte - child.start_byte > size:
+                    split(child)
+
+    split(root)
+    if root.end_byte > bounds[-1]:
+        bounds.append(root.end_byte)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _contains(ranges: List[Tuple[int, int]], span: int) -> bool:
+    """
+    Check whether a packed span lies completely inside one of the sorted,
+    merged `ranges`.
+    """
+    start, end = span >> 32, span & 0xFFFFFFFF
+    # The last range that starts at or before the span
+    idx = bisect_right(ranges, (start, 1 << 64)) - 1
+    return idx >= 0 and end <= ranges[idx][1]
+
+
+def _using_declarations(root: Node, ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Find the byte ranges of the `using` declarations that can affect names
+    in the `ranges`: the ones at namespace scope, and the ones directly in
+    the blocks that enclose a range. Function and class bodies elsewhere are
+    not searched.
+    """
+    found: List[Tuple[int, int]] = []
+
+    def search(node: Node) -> None:
+        for child in node.children:
+            if child.type == "using_declaration":
+                found.append((child.start_byte, child.end_byte))
+            elif child.type in _NAMESPACE_SCOPES:
+                search(child)
+
+    search(root)
+    blocks = set()
+    for start, end in ranges:
+        # A block that overlaps a range encloses its first or its last byte.
+        # Blocks inside the range are queried as part of it.
+        for byte in (start, max(start, end - 1)):
+            # The stubs lack `descendant_for_byte_range`, which 0.21 has
+            node: Optional[Node] = root.descendant_for_byte_range(  # type: ignore[attr-defined]
+                byte, byte
+            )
+            while node is not None:
+                if node.type == "compound_statement" and node.start_byte not in blocks:
+                    blocks.add(node.start_byte)
+                    found.extend(
+                        (child.start_byte, child.end_byte)
+                        for child in node.children
+                        if child.type == "using_declaration"
+                    )
+                node = node.parent
+    return _merge_ranges(found)
+
+
+def _refers_to_index(root: Node, start: int, end: int, namespace: bytes) -> bool:
+    """
+    Check whether the identifier at `[start, end)`, which the index resolves
+    to `namespace`, is a use of that declaration that needs the qualification.
+    It is not if it declares the name itself, e.g. the name of a class
+    definition or a template parameter, if it is a template parameter of an
+    enclosing template, or if it is inside `namespace`, where the name
+    resolves without it.
+    """
+    # The stubs lack `descendant_for_byte_range`, which 0.21 has
+    node: Optional[Node] = root.descendant_for_byte_range(start, end)  # type: ignore[attr-defined]
+    assert node is not None
+    name = node.text
+    parent = node.parent
+    if parent is not None:
+        if parent.type in _TYPE_SPECIFIERS:
+            # A definition, or a forward declaration directly in a scope
+            if parent.child_by_field_name("body") is not None or (
+                parent.parent is not None and parent.parent.type in _DECLARATION_SCOPES
+            ):
+                return False
+        elif parent.type in _TYPE_PARAMETERS or parent.type == "alias_declaration":
+            return False
+    # Names declared by a `typedef`, also through pointer or array declarators
+    child = node
+    while parent is not None and parent.child_by_field_name("declarator") is not None:
+        if parent.type == "type_definition":
+            return all(
+                declarator != child for declarator in parent.children_by_field_name("declarator")
+            )
+        if not parent.type.endswith("_declarator"):
+            break
+        child, parent = parent, parent.parent
+
+    scopes: List[bytes] = []
+    while node is not None:
+        if node.type == "namespace_definition":
+            name_node = node.child_by_field_name("name")
+            if name_node is not None:
+                scopes.append(name_node.text)
+        elif node.type == "template_declaration" and name in _template_parameter_names(node):
+            return False
+        node = node.parent
+    scope = b"::".join(reversed(scopes))
+    return not (scope == namespace or scope.startswith(namespace + b"::"))
+
+
+def _template_parameter_names(template: Node) -> List[bytes]:
+    """
+    Get the type names that the parameters of a `template_declaration` declare.
+    """
+    names: List[bytes] = []
+    parameters = template.child_by_field_name("parameters")
+    for parameter in parameters.named_children if parameters is not None else ():
+        if parameter.type == "template_template_parameter_declaration":
+            parameter = parameter.named_children[-1]
+        if parameter.type in _TYPE_PARAMETERS:
+            names.extend(
+                child.text for child in parameter.named_children if child.type == "type_identifier"
+            )
+    return names
+
+
+class _EditColumns:
+    """
+    The edits of a source by the bytes that each one depends on, the span of
+    its fixup and the text that it removes, see `RemUsing.apply_text_edit`.
+    """
+
+    def __init__(self, edits: List[Edit], fixed: "array[int]", unresolved: "array[int]"):
+        """
+        Initialize the columns.
+
+        Arguments:
+            edits: Sorted edits, see `RemUsing._compute_edits`
+            fixed: The span of the fixup of each edit
+            unresolved: Sorted spans of the unresolved identifiers
+        """
+        self.edits = SpanColumn(array("Q", map(_footprint, edits, fixed)), _relative(edits))
+        """The edits, by the byte range that they depend on"""
+        self.unresolved = SpanColumn(unresolved)
+        """The unqualified identifiers that no namespace map resolves"""
+
+    def edit(self, start_byte: int, old_end_byte: int, new_end_byte: int) -> None:
+        """
+        Update the columns for an edit of the source, see `SpanColumn.edit`.
+        """
+        self.edits.edit(start_byte, old_end_byte, new_end_byte)
+        self.unresolved.edit(start_byte, old_end_byte, new_end_byte)
+
+    def remove(self, start: int, end: int) -> "array[int]":
+        """
+        Remove the edits that depend on bytes in `[start, end]`, and the
+        unresolved identifiers there.
+
+        Returns:
+            The byte ranges of the removed edits
+        """
+        self.unresolved.remove(start, end)
+        return self.edits.remove(start, end)[0]
+
+    def add(self, edits: List[Edit], fixed: "array[int]", unresolved: "array[int]") -> None:
+        """
+        Add new edits, see `__init__`.
+        """
+        self.edits.insert(array("Q", map(_footprint, edits, fixed)), _relative(edits))
+        self.unresolved.insert(unresolved)
+
+    def to_list(self) -> List[Edit]:
+        """
+        Get the edits at their current positions.
+        """
+        return [
+            Edit(start, start + length, replacement, reason)
+            for start, (length, replacement, reason) in zip(
+                map(rshift, self.edits.spans(), repeat(32)), self.edits.values()
+            )
+        ]
+
+
+def _footprint(edit: Edit, fixup: int) -> int:
+    """
+    Get the packed span of the bytes that an edit depends on.
+    """
+    return edit.start_byte << 32 | max(fixup & 0xFFFFFFFF, edit.end_byte)
+
+
+def _relative(edits: List[Edit]) -> List[Tuple[int, bytes, Optional[EditReason]]]:
+    """
+    Get the parts of edits that do not depend on their position.
+    """
+    return [(edit.end_byte - edit.start_byte, edit.replacement, edit.reason) for edit in edits]
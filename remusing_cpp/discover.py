@@ -0,0 +1,424 @@
+"""
+This module contains the discovery of the C/C++ files to process in a tree.
+
+`discover_paths` expands files, directories and glob patterns lazily, so
+that the processing pipeline starts on the first files while the tree is
+still being walked. Directories are walked with `os.scandir`, which yields
+the file type of every entry without a `stat` call per file. Files are
+selected by their extension, see `parse_extensions`, and the walk honors
+`.gitignore` files and skips vendored code by default, see `IgnoreRules`.
+`largest_first` reorders the files within a bounded window, so that the
+biggest files are handed to the workers early and do not end up as the last
+stragglers of a parallel run.
+"""
+import glob
+import heapq
+import os
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Pattern, Sequence, Set, Tuple
+
+HEADER_EXTENSIONS: Tuple[str, ...] = (".h", ".hh", ".hpp", ".hxx", ".h++", ".inl", ".ipp", ".tpp")
+"""File extensions of C/C++ headers"""
+SOURCE_EXTENSIONS: Tuple[str, ...] = (".c", ".cc", ".cpp", ".cxx", ".c++")
+"""File extensions of C/C++ source files"""
+DEFAULT_EXTENSIONS: Tuple[str, ...] = (
+    ".h",
+    ".hh",
+    ".hpp",
+    ".hxx",
+    ".c",
+    ".cc",
+    ".cpp",
+    ".cxx",
+)
+"""File extensions that are considered C/C++ sources when searching directories"""
+EXTENSION_SETS = {
+    "default": DEFAULT_EXTENSIONS,
+    "headers": HEADER_EXTENSIONS,
+    "sources": SOURCE_EXTENSIONS,
+    "all": HEADER_EXTENSIONS + SOURCE_EXTENSIONS,
+}
+"""Named extension sets for `parse_extensions`"""
+
+DEFAULT_EXCLUDES: Tuple[str, ...] = (
+    ".*/",
+    "node_modules/",
+    "vendor/",
+    "third_party/",
+    "third-party/",
+    "thirdparty/",
+    "3rdparty/",
+)
+"""
+Ignore patterns of the directories that are skipped by default: hidden
+directories like `.git`, and the usual homes of vendored third-party code
+"""
+
+DEFAULT_SORT_WINDOW = 4096
+"""Number of files that `largest_first` orders at once by default"""
+
+IGNORE_FILE = ".gitignore"
+"""Name of the files with ignore patterns for their directory"""
+
+_GLOB_CHARS = frozenset("*?[")
+
+
+def parse_extensions(spec: str) -> Tuple[str, ...]:
+    """
+    Parse a comma-separated list of file extensions and names of extension
+    sets, e.g. `headers,.cu`.
+
+    Args:
+        spec: The list, see `EXTENSION_SETS` for the names
+
+    Returns:
+        The file extensions, each with its leading dot
+    """
+    extensions: List[str] = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item in EXTENSION_SETS:
+            extensions.extend(EXTENSION_SETS[item])
+        elif item:
+            extensions.append(item if item.startswith(".") else f".{item}")
+    return tuple(dict.fromkeys(extensions))
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translate the glob of an ignore pattern into a regular expression for
+    paths with `/` separators.
+    """
+    parts: List[str] = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+            if chars[0] == "!":
+                chars = "^" + chars[1:]
+            parts.append(f"[{chars}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+
+class IgnoreRule(NamedTuple):
+    """
+    A compiled ignore pattern in the syntax of `.gitignore` files.
+    """
+
+    regex: Pattern[str]
+    """Matches the paths relative to the directory of the pattern"""
+    negated: bool
+    """Whether the pattern re-includes what an earlier pattern ignored"""
+    directories_only: bool
+    """Whether the pattern only matches directories"""
+
+    @classmethod
+    def parse(cls, line: str) -> Optional["IgnoreRule"]:
+        """
+        Compile a line of an ignore file.
+
+        Args:
+            line: The line, e.g. `build/`, `*.gen.hh` or `!/src/keep.hh`
+
+        Returns:
+            The rule, or `None` for blank lines and comments
+        """
+        line = line.rstrip("\r\n")
+        if not line.endswith("\\ "):
+            line = line.rstrip()
+        if not line or line.startswith("#"):
+            return None
+        negated = line.startswith("!")
+        if negated or line.startswith("\\"):
+            line = line[1:]
+        directories_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return None
+        # Patterns with a slash are relative to their directory, the others
+        # match at any depth
+        regex = _translate(line.lstrip("/"))
+        if "/" not in line:
+            regex = "(?:.*/)?" + regex
+        return cls(re.compile(regex), negated, directories_only)
+
+
+class IgnoreRules:
+    """
+    The ignore patterns that apply to a directory: the default excludes, the
+    extra patterns of the caller, and the patterns of the `.gitignore` files
+    in the directory and its parents. Later patterns take precedence, and
+    deeper files take precedence over the ones of their parents.
+    """
+
+    def __init__(self, layers: Sequence[Tuple[str, Sequence[IgnoreRule]]] = ()):
+        """
+        Initialize the rules.
+
+        Args:
+            layers: The base directory of each set of rules, from the
+                outermost to the innermost, and the rules relative to it
+        """
+        self.layers = list(layers)
+
+    @classmethod
+    def for_root(
+        cls, root: str, excludes: Sequence[str] = DEFAULT_EXCLUDES, ignore_files: bool = True
+    ) -> "IgnoreRules":
+        """
+        Create the rules for walking a directory, including the `.gitignore`
+        files of its parents up to the root of its git working tree.
+
+        Args:
+            root: The directory that is walked
+            excludes: Further patterns relative to `root`
+            ignore_files: Whether to read the `.gitignore` files
+
+        Returns:
+            The rules of `root`
+        """
+        root = os.path.abspath(root)
+        rules = cls([(root, [rule for rule in map(IgnoreRule.parse, excludes) if rule])])
+        if not ignore_files:
+            return rules
+        parents: List[str] = []
+        parent = os.path.dirname(root)
+        # Only look outside of the root if it is inside a working tree
+        if not os.path.exists(os.path.join(root, ".git")):
+            while True:
+                parents.append(parent)
+                if os.path.exists(os.path.join(parent, ".git")):
+                    break
+                grandparent = os.path.dirname(parent)
+                if grandparent == parent:
+                    parents = []
+                    break
+                parent = grandparent
+        for directory in reversed(parents):
+            rules = rules.child(directory)
+        return rules.child(root)
+
+    def child(self, directory: str) -> "IgnoreRules":
+        """
+        Get the rules of a directory, with the patterns of its `.gitignore`.
+
+        Args:
+            directory: A directory below the directories of the current rules
+
+        Returns:
+            The rules for the entries of the directory
+        """
+        try:
+            with open(os.path.join(directory, IGNORE_FILE), encoding="utf8", errors="replace") as f:
+                rules = [rule for rule in map(IgnoreRule.parse, f) if rule]
+        except OSError:
+            return self
+        return IgnoreRules([*self.layers, (directory, rules)]) if rules else self
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """
+        Check whether a path is ignored.
+
+        Args:
+            path: Normalized absolute path below the directories of the rules
+            is_dir: Whether the path is a directory
+
+        Returns:
+            Whether the last matching pattern ignores the path
+        """
+        ignored = False
+        for base, rules in self.layers:
+            # Cheaper than `os.path.relpath`, which normalizes both paths
+            relative = path[len(base.rstrip(os.sep)) + 1 :].replace(os.sep, "/")
+            for rule in rules:
+                if (
+                    rule.negated == ignored
+                    and (is_dir or not rule.directories_only)
+                    and rule.regex.fullmatch(relative)
+                ):
+                    ignored = not rule.negated
+        return ignored
+
+
+class SourceFile(NamedTuple):
+    """
+    A discovered file.
+    """
+
+    path: str
+    """Path of the file"""
+    size: int
+    """Size of the file in bytes, or 0 if it is not known"""
+
+
+def walk_sources(
+    root: str,
+    extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS,
+    excludes: Sequence[str] = DEFAULT_EXCLUDES,
+    ignore_files: bool = True,
+    sizes: bool = False,
+) -> Iterator[SourceFile]:
+    """
+    Walk a directory lazily and yield its C/C++ files.
+
+    Entries are visited in name order, depth-first. Symbolic links to
+    directories are not followed.
+
+    Args:
+        root: The directory to walk. It is walked even if it is ignored.
+        extensions: File extensions to select
+        excludes: Ignore patterns relative to `root` for the files and
+            directories to skip
+        ignore_files: Whether to also skip what the `.gitignore` files of
+            `root`, of its parents and of its subdirectories ignore
+        sizes: Whether to look up the size of every file
+
+    Returns:
+        An iterator over the files, with their size if requested
+    """
+    rules = IgnoreRules.for_root(root, excludes, ignore_files)
+    # The absolute path of each directory is kept for matching the rules
+    stack = [(root, os.path.abspath(root), rules)]
+    while stack:
+        directory, absolute, rules = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not (entry.name.endswith(extensions) and entry.is_file()):
+                    continue
+                if rules.layers and rules.ignored(os.path.join(absolute, entry.name), is_dir):
+                    continue
+                if is_dir:
+                    subdirectories.append(entry.name)
+                else:
+                    yield SourceFile(entry.path, entry.stat().st_size if sizes else 0)
+            except OSError:
+                # Removed during the walk
+                continue
+        for name in reversed(subdirectories):
+            path = os.path.join(absolute, name)
+            stack.append(
+                (os.path.join(directory, name), path, rules.child(path) if ignore_files else rules)
+            )
+
+
+def largest_first(
+    files: Iterable[SourceFile], window: int = DEFAULT_SORT_WINDOW
+) -> Iterator[SourceFile]:
+    """
+    Reorder files so that the largest ones come first, looking ahead at most
+    `window` files. Within a window, this is a sort by decreasing size, and
+    the first file is yielded as soon as the window is full.
+
+    Args:
+        files: The files with their sizes
+        window: Number of files to hold back at most
+
+    Returns:
+        An iterator over the files
+    """
+    heap: List[Tuple[int, int, SourceFile]] = []
+    for index, file in enumerate(files):
+        # Ties keep the input order
+        item = (-file.size, index, file)
+        if len(heap) < window:
+            heapq.heappush(heap, item)
+        else:
+            yield heapq.heappushpop(heap, item)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def _file_size(path: str) -> int:
+    """
+    Get the size of a file, or 0 if it does not exist.
+    """
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def discover_paths(
+    patterns: Iterable[str],
+    extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS,
+    excludes: Sequence[str] = DEFAULT_EXCLUDES,
+    ignore_files: bool = True,
+    sort_window: int = DEFAULT_SORT_WINDOW,
+) -> Iterator[str]:
+    """
+    Expand files, directories and glob patterns lazily into the files to
+    process.
+
+    Directories are walked with `walk_sources`. Glob patterns support `**`
+    for recursive matching. Explicitly listed files and the files that a
+    glob pattern matches are always included, regardless of their extension
+    and of the ignore patterns. Every file is yielded once.
+
+    Args:
+        patterns: Files, directories or glob patterns
+        extensions: File extensions to select when walking directories
+        excludes: Ignore patterns for walking directories, relative to each
+            walked directory
+        ignore_files: Whether to also honor the `.gitignore` files when
+            walking directories
+        sort_window: Reorder the files by decreasing size within windows of
+            this many files, see `largest_first`. With 0, the files are
+            yielded in the order in which they are found.
+
+    Returns:
+        An iterator over the paths
+    """
+
+    def found() -> Iterator[SourceFile]:
+        """
+        Find the files in walk order.
+        """
+        seen: Set[str] = set()
+        for pattern in patterns:
+            if _GLOB_CHARS.intersection(pattern):
+                matches: Iterable[str] = sorted(glob.iglob(pattern, recursive=True))
+            else:
+                matches = [pattern]
+            for match in matches:
+                if os.path.isdir(match):
+                    files: Iterable[SourceFile] = walk_sources(
+                        match, extensions, excludes, ignore_files, sort_window > 0
+                    )
+                else:
+                    files = [SourceFile(match, _file_size(match) if sort_window > 0 else 0)]
+                for file in files:
+                    if file.path not in seen:
+                        seen.add(file.path)
+                        yield file
+
+    files = found()
+    if sort_window > 0:
+        files = largest_first(files, sort_window)
+    return (file.path for file in files)
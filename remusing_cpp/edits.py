@@ -0,0 +1,251 @@
+"""
+This module contains the byte-range edit representation and the engine that
+applies edits to source code.
+"""
+import difflib
+from enum import Enum
+from itertools import accumulate
+from mmap import mmap
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+SourceBytes = Union[bytes, mmap]
+"""Source code in memory or memory-mapped from a file"""
+
+
+class EditReason(str, Enum):
+    """
+    Why an edit was made.
+    """
+
+    USING_REMOVAL = "using_removal"
+    """Removal of a `using` declaration"""
+    DECL_QUALIFICATION = "decl_qualification"
+    """Namespace qualification inferred from a `using <ns>::<name>;` declaration"""
+    HARDCODED_QUALIFICATION = "hardcoded_qualification"
+    """Namespace qualification from the hardcoded symbol to namespace mapping"""
+    INDEX_QUALIFICATION = "index_qualification"
+    """Namespace qualification from the project-wide symbol index"""
+
+
+class Edit(NamedTuple):
+    """
+    A replacement of the source bytes in `[start_byte, end_byte)`.
+
+    An insertion has `start_byte == end_byte` and a deletion has an empty
+    `replacement`.
+    """
+
+    start_byte: int
+    """Start of the replaced range (inclusive)"""
+    end_byte: int
+    """End of the replaced range (exclusive)"""
+    replacement: bytes
+    """The bytes to put in place of the range"""
+    reason: Optional[EditReason] = None
+    """Why the edit was made, if known"""
+
+    def as_json(self) -> Dict[str, Any]:
+        """
+        Convert the edit to a JSON-serializable dictionary.
+
+        Returns:
+            The edit with the replacement decoded as UTF-8
+        """
+        return {
+            "start_byte": self.start_byte,
+            "end_byte": self.end_byte,
+            "replacement": self.replacement.decode("utf8"),
+            "reason": None if self.reason is None else self.reason.value,
+        }
+
+
+def apply_edits(src: SourceBytes, edits: Sequence[Edit]) -> bytes:
+    """
+    Apply sorted, non-overlapping edits to the source in a single pass.
+
+    The unchanged spans are referenced through a `memoryview` and joined once
+    at the end, so the cost is linear in the size of the source plus the size
+    of the replacements, independent of the number of edits.
+
+    Args:
+        src: The source code to edit
+        edits: Edits sorted by `start_byte`. An edit may start where the
+            previous one ended but may not overlap it.
+
+    Returns:
+        The edited source code. If there are no edits and `src` is a `bytes`
+        object, `src` itself is returned.
+
+    Raises:
+        ValueError: If the edits are unsorted, overlapping or out of bounds
+    """
+    if not edits:
+        return src if isinstance(src, bytes) else src[:]
+
+    with memoryview(src) as view:
+        return b"".join(_edited_chunks(view, edits))
+
+
+def write_edits(src: SourceBytes, edits: Sequence[Edit], out: IO[bytes]) -> int:
+    """
+    Apply sorted, non-overlapping edits to the source while writing it out.
+
+    The unchanged spans are written straight from the source buffer, so the
+    edited source is never held in memory. Together with a memory-mapped
+    `src`, this keeps the memory use bounded for very large files.
+
+    Args:
+        src: The source code to edit
+        edits: Edits sorted by `start_byte`, see `apply_edits`
+        out: Binary stream to write the edited source to
+
+    Returns:
+        The number of bytes written
+
+    Raises:
+        ValueError: If the edits are unsorted, overlapping or out of bounds
+    """
+    written = 0
+    with memoryview(src) as view:
+        for chunk in _edited_chunks(view, edits):
+            if chunk:
+                out.write(chunk)
+                written += len(chunk)
+    return written
+
+
+def _edited_chunks(view: memoryview, edits: Sequence[Edit]) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Produce the unchanged spans of the source and the replacements in order.
+    """
+    pos = 0
+    for edit in edits:
+        start, end, replacement = edit.start_byte, edit.end_byte, edit.replacement
+        if start < pos or end < start or end > len(view):
+            raise ValueError(f"Invalid edit range [{start}, {end}) after position {pos}")
+        yield view[pos:start]
+        yield replacement
+        pos = end
+    yield view[pos:]
+
+
+def _split_lines(src: bytes) -> List[bytes]:
+    """
+    Split the source into lines on newlines, keeping the line endings.
+    """
+    lines = [line + b"\n" for line in src.split(b"\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+"""Diff line that follows a last line without a line break"""
+
+
+def unified_diff(
+    src: bytes,
+    edits: Sequence[Edit],
+    fromfile: str = "",
+    tofile: str = "",
+    context: int = 3,
+) -> Iterator[str]:
+    """
+    Produce a unified diff for the edits without building the whole edited
+    output. Only the lines touched by the edits (plus context) are compared.
+
+    Args:
+        src: The source code that the edits apply to
+        edits: Sorted, non-overlapping edits, see `apply_edits`
+        fromfile: Name of the original file in the diff header
+        tofile: Name of the edited file in the diff header
+        context: Number of context lines around each change
+
+    Returns:
+        The lines of the diff, each ending with a newline. Nothing is produced
+        if there are no edits. Bytes that are not valid UTF-8 are decoded
+        with the `surrogateescape` error handler, so encoding the diff the
+        same way restores them.
+    """
+    if not edits:
+        return
+
+    lines = _split_lines(src)
+    line_starts = [0, *accumulate(len(line) for line in lines)]
+
+    # Group the edits into hunks of affected (0-based, inclusive) line ranges
+    hunks: List[Tuple[int, int, List[Edit]]] = []
+    offset = line_no = 0
+    for edit in edits:
+        line_no += src.count(b"\n", offset, edit.start_byte)
+        offset = edit.start_byte
+        first = max(0, min(line_no, len(lines) - 1))
+        last = first + src.count(b"\n", edit.start_byte, edit.end_byte)
+        if edit.end_byte > edit.start_byte and src[edit.end_byte - 1] == ord("\n"):
+            # The line after the edit is untouched if the edited text still
+            # ends with a newline right before it
+            at_line_start = edit.start_byte == line_starts[first]
+            if edit.replacement.endswith(b"\n") or (not edit.replacement and at_line_start):
+                last -= 1
+        last = max(first, min(last, len(lines) - 1))
+        if hunks and first - hunks[-1][1] <= 2 * context + 1:
+            hunks[-1] = (hunks[-1][0], max(hunks[-1][1], last), hunks[-1][2] + [edit])
+        else:
+            hunks.append((first, last, [edit]))
+
+    yield f"--- {fromfile}\n"
+    yield f"+++ {tofile}\n"
+    line_delta = 0
+    for first, last, hunk_edits in hunks:
+        region_start = line_starts[first]
+        shifted = [
+            edit._replace(
+                start_byte=edit.start_byte - region_start, end_byte=edit.end_byte - region_start
+            )
+            for edit in hunk_edits
+        ]
+        old = lines[first : last + 1]
+        region_end = line_starts[min(last + 1, len(lines))]
+        new = _split_lines(apply_edits(src[region_start:region_end], shifted))
+
+        before = lines[max(0, first - context) : first]
+        after = lines[last + 1 : last + 1 + context]
+        old_start = first - len(before) + 1
+        old_len = len(before) + len(old) + len(after)
+        new_start = old_start + line_delta
+        new_len = len(before) + len(new) + len(after)
+        line_delta += len(new) - len(old)
+        yield (
+            f"@@ -{old_start if old_len else old_start - 1},{old_len} "
+            f"+{new_start if new_len else new_start - 1},{new_len} @@\n"
+        )
+
+        out: List[Tuple[str, bytes]] = [(" ", line) for line in before]
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                out.extend((" ", line) for line in old[i1:i2])
+            else:
+                out.extend(("-", line) for line in old[i1:i2])
+                out.extend(("+", line) for line in new[j1:j2])
+        out.extend((" ", line) for line in after)
+        for prefix, line_bytes in out:
+            # Bytes that are not UTF-8 round-trip through the surrogates
+            text = line_bytes.decode("utf8", errors="surrogateescape")
+            if text.endswith("\n"):
+                yield f"{prefix}{text}"
+            else:
+                yield f"{prefix}{text}\n"
+                yield NO_NEWLINE_MARKER
@@ -0,0 +1,281 @@
+"""
+This module contains a small executor layer that runs per-file work on a pool
+of worker processes or threads.
+
+`imap` keeps a bounded number of chunks in flight, so that arbitrarily long
+(lazy) inputs are never submitted all at once, and yields the results either
+in input order or as soon as they complete. Exceptions raised by the work are
+handed to an error callback per item, so that a single bad file turns into a
+result instead of aborting the run. `ProgressReporter` prints the progress
+and throughput of a run to a stream. The pools are only imported once they
+are used, so that the CLI can import this module for its options.
+"""
+import sys
+import time
+from dataclasses import dataclass
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+PROCESS_BACKEND = "process"
+"""Run the work in a pool of worker processes"""
+THREAD_BACKEND = "thread"
+"""Run the work in a pool of threads of the current process"""
+BACKENDS = (PROCESS_BACKEND, THREAD_BACKEND)
+"""The supported pool types"""
+
+ErrorHandler = Callable[[T, BaseException], R]
+"""Turns an exception raised by the work for an item into a result"""
+
+
+@dataclass
+class Progress:
+    """
+    The progress of a running `imap` call.
+    """
+
+    total: Optional[int] = None
+    """Number of items, if known up-front"""
+    done: int = 0
+    """Number of completed items"""
+    failed: int = 0
+    """Number of completed items that failed"""
+    started: float = 0.0
+    """Start time of the run, see `time.perf_counter`"""
+
+    @property
+    def seconds(self) -> float:
+        """
+        Wall time since the start of the run.
+        """
+        return time.perf_counter() - self.started
+
+    @property
+    def items_per_second(self) -> float:
+        """
+        Throughput in completed items per second.
+        """
+        seconds = self.seconds
+        return self.done / seconds if seconds > 0 else 0.0
+
+    def format(self) -> str:
+        """
+        Format the progress as a single status line.
+
+        Returns:
+            The status line, without a line break
+        """
+        count = f"{self.done}" if self.total is None else f"{self.done}/{self.total}"
+        return (
+            f"{count} file(s), {self.failed} error(s), {self.seconds:.1f}s, "
+            f"{self.items_per_second:.1f} files/s"
+        )
+
+
+class ProgressReporter:
+    """
+    Prints the progress of a run to a stream, at most once per interval.
+    """
+
+    def __init__(self, stream: TextIO = sys.stderr, interval: float = 0.5):
+        """
+        Initialize the reporter.
+
+        Args:
+            stream: Stream to print to. On a terminal, the status line is
+                updated in place.
+            interval: Minimum number of seconds between two updates
+        """
+        self.stream = stream
+        self.interval = interval
+        self._last = 0.0
+        self._tty = stream.isatty()
+
+    def __call__(self, progress: Progress) -> None:
+        """
+        Report the progress, unless the last report was too recent.
+
+        Args:
+            progress: The current progress
+        """
+        now = time.perf_counter()
+        if now - self._last < self.interval and progress.done != progress.total:
+            return
+        self._last = now
+        end = "\r" if self._tty and progress.done != progress.total else "\n"
+        self.stream.write(f"progress: {progress.format()}{end}")
+        self.stream.flush()
+
+
+def create_executor(
+    backend: str,
+    jobs: int,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple[Any, ...] = (),
+) -> "Executor":
+    """
+    Create a worker pool.
+
+    Args:
+        backend: One of `BACKENDS`
+        jobs: Number of workers
+        initializer: Function that every worker runs once before any work
+        initargs: Arguments of `initializer`
+
+    Returns:
+        The pool
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if backend == PROCESS_BACKEND:
+        return ProcessPoolExecutor(jobs, initializer=initializer, initargs=initargs)
+    if backend == THREAD_BACKEND:
+        return ThreadPoolExecutor(jobs, initializer=initializer, initargs=initargs)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def _run_chunk(fn: Callable[[T], R], chunk: Sequence[T]) -> List[Tuple[bool, Any]]:
+    """
+    Run the work for a chunk of items, catching the exception of each item.
+
+    Returns:
+        `(True, result)` or `(False, exception)` for each item
+    """
+    outcomes: List[Tuple[bool, Any]] = []
+    for item in chunk:
+        try:
+            outcomes.append((True, fn(item)))
+        except Exception as e:  # noqa: BLE001 - handed to the caller's error handler
+            outcomes.append((False, e))
+    return outcomes
+
+
+def imap(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    executor: Optional["Executor"] = None,
+    ordered: bool = True,
+    max_in_flight: int = 16,
+    chunksize: int = 1,
+    on_error: Optional[ErrorHandler[T, R]] = None,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+    total: Optional[int] = None,
+    is_failure: Optional[Callable[[R], bool]] = None,
+) -> Iterator[R]:
+    """
+    Run `fn` for every item and yield the results.
+
+    Only `max_in_flight` chunks are submitted or waiting to be yielded at any
+    time, so the items are consumed lazily and the memory use is bounded
+    regardless of their number.
+
+    Args:
+        fn: The work for a single item. With a process pool, it must be a
+            module-level function.
+        items: The items to process
+        executor: The pool to run the work on. Without a pool, the work runs
+            in the current thread.
+        ordered: Yield the results in the order of `items`. Otherwise, they
+            are yielded as soon as they complete.
+        max_in_flight: Maximum number of pending chunks
+        chunksize: Number of items that are sent to a worker at once
+        on_error: Turns an exception raised by `fn` into a result. Without
+            it, the exception is raised from the iterator.
+        on_progress: Called after every completed chunk
+        total: Number of items for the progress, if `items` has no length
+        is_failure: Tells whether a result is a failure for the progress, in
+            addition to the items whose work raised an exception
+
+    Returns:
+        An iterator over the result of each item
+    """
+    if total is None and isinstance(items, Sequence):
+        total = len(items)
+    progress = Progress(total, started=time.perf_counter())
+    it = iter(items)
+    chunks = iter(lambda: list(islice(it, max(1, chunksize))), [])
+
+    def finish(chunk: Sequence[T], outcomes: List[Tuple[bool, Any]]) -> List[R]:
+        """
+        Convert the outcomes of a chunk into results and update the progress.
+        """
+        results: List[R] = []
+        for item, (ok, value) in zip(chunk, outcomes):
+            if not ok:
+                progress.failed += 1
+                if on_error is None:
+                    raise value
+                value = on_error(item, value)
+            elif is_failure is not None and is_failure(value):
+                progress.failed += 1
+            results.append(value)
+        progress.done += len(chunk)
+        if on_progress is not None:
+            on_progress(progress)
+        return results
+
+    if executor is None:
+        for chunk in chunks:
+            yield from finish(chunk, _run_chunk(fn, chunk))
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    # Pending chunks by their position, and the completed ones that wait for
+    # an earlier chunk to be yielded
+    pending: Dict["Future[List[Tuple[bool, Any]]]", int] = {}
+    inputs: Dict[int, Sequence[T]] = {}
+    completed: Dict[int, List[Tuple[bool, Any]]] = {}
+    next_index = submitted = 0
+    try:
+        while True:
+            while len(pending) + len(completed) < max(1, max_in_flight):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending[executor.submit(_run_chunk, fn, chunk)] = submitted
+                inputs[submitted] = chunk
+                submitted += 1
+            if not pending and not completed:
+                return
+
+            if pending:
+                done: Set["Future[List[Tuple[bool, Any]]]"]
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    exc = future.exception()
+                    # A failure of the pool itself, e.g. a crashed worker
+                    # process, fails every item of the chunk
+                    outcomes = (
+                        [(False, exc)] * len(inputs[index]) if exc is not None else future.result()
+                    )
+                    completed[index] = outcomes
+            ready = sorted(completed) if not ordered else []
+            while ordered and next_index in completed:
+                ready.append(next_index)
+                next_index += 1
+            for index in ready:
+                yield from finish(inputs.pop(index), completed.pop(index))
+    finally:
+        for future in pending:
+            future.cancel()
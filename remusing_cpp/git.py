@@ -0,0 +1,258 @@
+"""
+This module contains the git integration that restricts a batch run to the
+files of a change, so that its runtime scales with the size of the change and
+not with the size of the repository.
+
+`changed_files` lists the C/C++ files that differ from a revision, including
+untracked ones. `staged_changes` lists the files in the index that differ
+from `HEAD`, together with their blob ids, whose contents `read_blobs` then
+reads straight from the object database with a single `git cat-file`
+process. `fix_staged` fixes these blobs with the batch pipeline and writes
+the fixed contents back into the index, and into the working tree where it
+matches the index.
+"""
+import os
+import subprocess
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from remusing_cpp.batch import FileResult, iter_batch_blobs
+from remusing_cpp.discover import DEFAULT_EXTENSIONS
+from remusing_cpp.util import atomic_open
+
+# Modes of regular files in the index, as opposed to symlinks and submodules
+_FILE_MODES = frozenset(["100644", "100755"])
+
+
+class GitError(Exception):
+    """
+    A git command failed, e.g. outside of a repository or for an unknown
+    revision.
+    """
+
+
+@dataclass
+class StagedFile:
+    """
+    A file whose staged contents differ from `HEAD`.
+    """
+
+    path: str
+    """Path of the file, relative to the current directory"""
+    name: str
+    """Path of the file, relative to the root of the working tree"""
+    mode: str
+    """Octal file mode in the index"""
+    blob: str
+    """Object id of the staged contents"""
+
+
+def _git(args: Sequence[str], cwd: Optional[str] = None, stdin: Optional[bytes] = None) -> bytes:
+    """
+    Run a git command and return its output.
+    """
+    try:
+        proc = subprocess.run(["git", *args], cwd=cwd, input=stdin, capture_output=True)
+    except OSError as e:
+        raise GitError(f"Cannot run git: {e}") from e
+    if proc.returncode != 0:
+        message = proc.stderr.decode(errors="replace").strip()
+        raise GitError(message or f"git {args[0]} failed with exit code {proc.returncode}")
+    return proc.stdout
+
+
+def toplevel(cwd: Optional[str] = None) -> str:
+    """
+    Find the root of the working tree.
+
+    Args:
+        cwd: A directory in the working tree (default: the current directory)
+
+    Returns:
+        The absolute path of the root directory
+    """
+    return os.fsdecode(_git(["rev-parse", "--show-toplevel"], cwd).rstrip(b"\n"))
+
+
+def _split_z(output: bytes) -> List[str]:
+    """
+    Split NUL-terminated git output into paths.
+    """
+    return [os.fsdecode(item) for item in output.split(b"\0") if item]
+
+
+def _select(root: str, paths: Iterable[str], extensions: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    Select the C/C++ files among paths relative to the root of the working
+    tree.
+
+    Returns:
+        Paths relative to the current directory by the paths relative to the
+        root
+    """
+    return {
+        path: os.path.relpath(os.path.join(root, path))
+        for path in paths
+        if path.endswith(extensions)
+    }
+
+
+def changed_files(
+    rev: str,
+    pathspecs: Sequence[str] = (),
+    extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS,
+) -> List[str]:
+    """
+    List the C/C++ files in the working tree that were added or modified
+    since a revision, and the untracked ones that are not ignored.
+
+    Args:
+        rev: The revision to compare with, e.g. `origin/main` or `HEAD~3`
+        pathspecs: Only consider files matching these git pathspecs
+        extensions: File extensions of C/C++ files
+
+    Returns:
+        Sorted paths of the existing files, relative to the current directory
+    """
+    root = toplevel()
+    spec = ["--", *pathspecs]
+    diff = _git(["diff", "--name-only", "-z", "--no-renames", "--diff-filter=AM", rev, *spec])
+    untracked = _git(["ls-files", "-z", "--others", "--exclude-standard", "--full-name", *spec])
+    files = _select(root, _split_z(diff) + _split_z(untracked), extensions)
+    return sorted(path for path in files.values() if os.path.isfile(path))
+
+
+def staged_changes(
+    pathspecs: Sequence[str] = (), extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS
+) -> List[StagedFile]:
+    """
+    List the regular C/C++ files whose staged contents were added or
+    modified compared with `HEAD` (or any staged file in a repository
+    without commits).
+
+    Args:
+        pathspecs: Only consider files matching these git pathspecs
+        extensions: File extensions of C/C++ files
+
+    Returns:
+        The staged files, sorted by path
+    """
+    root = toplevel()
+    entries: List[Tuple[bytes, bytes, bytes]] = []
+    try:
+        _git(["rev-parse", "--verify", "--quiet", "HEAD"])
+    except GitError:
+        # Without a commit, everything in the index is new. The lines are
+        # "<mode> <id> <stage>\t<path>".
+        output = _git(["ls-files", "-z", "--stage", "--full-name", "--", *pathspecs])
+        for line in output.split(b"\0"):
+            if line:
+                info, path = line.split(b"\t", 1)
+                mode, blob, _ = info.split()
+                entries.append((mode, blob, path))
+    else:
+        # Pairs of ":<old mode> <new mode> <old id> <new id> <status>" and
+        # "<path>"
+        args = ["diff-index", "--cached", "-z", "--no-renames", "--diff-filter=AM", "HEAD"]
+        fields = _git([*args, "--", *pathspecs]).split(b"\0")
+        for info, path in zip(fields[0:-1:2], fields[1::2]):
+            _, mode, _, blob, _ = info.split()
+            entries.append((mode, blob, path))
+
+    files = _select(root, (os.fsdecode(path) for _, _, path in entries), extensions)
+    staged = [
+        StagedFile(files[name], name, mode.decode(), blob.decode())
+        for mode, blob, name in ((m, b, os.fsdecode(p)) for m, b, p in entries)
+        if name in files and mode.decode() in _FILE_MODES
+    ]
+    return sorted(staged, key=lambda file: file.path)
+
+
+def read_blobs(blobs: Sequence[str]) -> List[bytes]:
+    """
+    Read the contents of blobs from the object database with a single git
+    process.
+
+    Args:
+        blobs: Object ids of the blobs
+
+    Returns:
+        The contents of each blob, in the same order
+    """
+    if not blobs:
+        return []
+    output = _git(["cat-file", "--batch"], stdin="".join(f"{b}\n" for b in blobs).encode())
+    contents: List[bytes] = []
+    pos = 0
+    for blob in blobs:
+        # "<id> <type> <size>\n<contents>\n", or "<id> missing\n"
+        header_end = output.index(b"\n", pos)
+        header = output[pos:header_end].split()
+        if len(header) != 3 or header[1] != b"blob":
+            raise GitError(f"Not a blob: {blob}")
+        start = header_end + 1
+        end = start + int(header[2])
+        contents.append(output[start:end])
+        pos = end + 1
+    return contents
+
+
+def stage_blobs(files: Sequence[Tuple[StagedFile, bytes]]) -> None:
+    """
+    Write new contents of staged files into the object database and the
+    index, leaving the working tree alone.
+
+    Args:
+        files: The staged files and their new contents
+    """
+    entries = []
+    for file, contents in files:
+        blob = _git(["hash-object", "-w", "--stdin"], stdin=contents).decode().strip()
+        entries.append(f"{file.mode} {blob}\t{file.name}\0")
+    if entries:
+        _git(["update-index", "-z", "--index-info"], toplevel(), "".join(entries).encode())
+
+
+def fix_staged(
+    pathspecs: Sequence[str],
+    ts_source: str,
+    ts_out: str,
+    extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS,
+    **options: Any,
+) -> Iterator[FileResult]:
+    """
+    Fix the staged contents of the changed C/C++ files and stage the fixed
+    contents.
+
+    The sources are read from the object database rather than from the
+    working tree, so unstaged changes are neither fixed nor committed. A
+    working tree file is only rewritten if it has no unstaged changes.
+
+    Args:
+        pathspecs: Only consider files matching these git pathspecs
+        ts_source: Tree-sitter C++ source code repo directory
+        ts_out: Tree-sitter language output file
+        extensions: File extensions of C/C++ files
+        options: Further arguments of `remusing_cpp.batch.iter_batch`
+
+    Returns:
+        An iterator over the result of each staged file. The index is
+        updated once all results were consumed.
+    """
+    staged = {file.path: file for file in staged_changes(pathspecs, extensions)}
+    contents = dict(zip(staged, read_blobs([file.blob for file in staged.values()])))
+    fixed: List[Tuple[StagedFile, bytes]] = []
+    for result in iter_batch_blobs(contents.items(), ts_source, ts_out, **options):
+        if result.fixed is not None:
+            fixed.append((staged[result.path], result.fixed))
+            try:
+                with open(result.path, "rb") as f:
+                    unstaged = f.read() != contents[result.path]
+                if not unstaged:
+                    with atomic_open(result.path) as f:
+                        f.write(result.fixed)
+            except OSError:
+                # The file was removed from the working tree after staging
+                pass
+        yield result
+    stage_blobs(fixed)
@@ -0,0 +1,396 @@
+"""
+This module contains a persistent, project-wide index of the symbols declared
+in C++ sources, used to resolve unqualified names across headers.
+
+The index is a SQLite database that records namespace definitions, type
+definitions and `using` declarations by name together with their namespace.
+It is updated incrementally: files whose size and modification time did not
+change are skipped, and files that were only touched are recognized by their
+content hash.
+"""
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from tree_sitter import Language, Node, Parser
+
+from remusing_cpp.queries import DEFAULT_QUERY_CACHE, IndexQuery
+from remusing_cpp.util import ensure_cpp_language, load_cpp_language
+
+SCHEMA_VERSION = 1
+"""Version of the database layout and of the indexed declarations"""
+
+NAMESPACE = "namespace"
+"""Symbol kind of a namespace definition"""
+TYPE = "type"
+"""Symbol kind of a type definition or declaration"""
+USING = "using"
+"""Symbol kind of a `using` declaration"""
+
+# Nodes whose contents are not reachable through a namespace qualification
+_LOCAL_SCOPES = frozenset(
+    [
+        "class_specifier",
+        "struct_specifier",
+        "union_specifier",
+        "field_declaration_list",
+        "compound_statement",
+        "function_definition",
+    ]
+)
+
+
+class SymbolRecord(NamedTuple):
+    """
+    A declaration found in a source file.
+    """
+
+    name: str
+    """The unqualified name"""
+    namespace: str
+    """The `::`-separated namespace that the name is declared in"""
+    kind: str
+    """One of `NAMESPACE`, `TYPE` or `USING`"""
+    line: int
+    """1-based line of the declaration"""
+
+
+@dataclass
+class IndexUpdateStats:
+    """
+    Counters for a `SymbolIndex.update` run.
+    """
+
+    scanned: int = 0
+    """Number of files that were parsed"""
+    unchanged: int = 0
+    """Number of files that were skipped because they did not change"""
+    removed: int = 0
+    """Number of files that were dropped from the index"""
+    errors: int = 0
+    """Number of files that could not be read"""
+
+
+def _enclosing_namespace(node: Node) -> Optional[str]:
+    """
+    Get the namespace that a declaration node is in.
+
+    Returns:
+        The `::`-separated namespace, or `None` if the declaration is in an
+        anonymous namespace, a class or a function.
+    """
+    parts: List[str] = []
+    parent = node.parent
+    while parent is not None:
+        if parent.type in _LOCAL_SCOPES:
+            return None
+        if parent.type == "namespace_definition":
+            name_node = parent.child_by_field_name("name")
+            if name_node is None:
+                return None
+            parts.append("".join(name_node.text.decode("utf8").split()))
+        parent = parent.parent
+    return "::".join(reversed(parts))
+
+
+def scan_symbols(src: bytes, parser: Parser, language: Language) -> List[SymbolRecord]:
+    """
+    Find the declarations to index in a source file.
+
+    Args:
+        src: The C++ source code
+        parser: The C++ tree-sitter parser
+        language: The C++ tree-sitter language
+
+    Returns:
+        The declarations in source order
+    """
+    index_query = IndexQuery()
+    query = DEFAULT_QUERY_CACHE.get(language, index_query.build_all_queries())
+    tree = parser.parse(src)
+
+    records: List[SymbolRecord] = []
+    for node, capture in query.captures(tree.root_node):
+        line = node.start_point[0] + 1
+        text = "".join(node.text.decode("utf8").split())
+        if capture == index_query.USING_QUAL_TYPE_CAPTURE:
+            scope, _, name = text.lstrip(":").rpartition("::")
+            if scope:
+                records.append(SymbolRecord(name, scope, USING, line))
+            continue
+
+        # The name node's parent is the declaration itself
+        assert node.parent is not None
+        namespace = _enclosing_namespace(node.parent)
+        if namespace is None:
+            continue
+        if capture == index_query.NAMESPACE_CAPTURE:
+            records.append(SymbolRecord(text, namespace, NAMESPACE, line))
+        elif capture == index_query.TYPE_DEF_CAPTURE:
+            records.append(SymbolRecord(text, namespace, TYPE, line))
+    return records
+
+
+class _ScanResult(NamedTuple):
+    """
+    The outcome of scanning a single file in a worker.
+    """
+
+    path: str
+    mtime_ns: int
+    size: int
+    digest: str
+    symbols: Optional[List[SymbolRecord]]
+    """`None` if the contents did not change since they were indexed"""
+    error: Optional[str] = None
+
+
+class _Scanner:
+    """
+    The tree-sitter state to scan files with, one per process.
+    """
+
+    def __init__(self, lib_path: str):
+        """
+        Load the C++ language.
+
+        Args:
+            lib_path: Path of the compiled tree-sitter C++ language
+        """
+        self.lib_path = lib_path
+        self.language = load_cpp_language(lib_path)
+        self.parser = Parser()
+        self.parser.set_language(self.language)
+
+    def scan(self, job: Tuple[str, Optional[str]]) -> _ScanResult:
+        """
+        Hash and, if its contents changed, scan a file.
+
+        Args:
+            job: The file and the digest it was last indexed with, if any
+
+        Returns:
+            The result of scanning the file
+        """
+        path, old_digest = job
+        try:
+            st = os.stat(path)
+            with open(path, "rb") as f:
+                src = f.read()
+        except OSError as e:
+            return _ScanResult(path, 0, 0, "", None, str(e))
+        digest = hashlib.sha256(src).hexdigest()
+        if digest == old_digest:
+            return _ScanResult(path, st.st_mtime_ns, st.st_size, digest, None)
+        symbols = scan_symbols(src, self.parser, self.language)
+        return _ScanResult(path, st.st_mtime_ns, st.st_size, digest, symbols)
+
+
+# The scanner of a worker process, see `_init_worker`
+_worker_scanner: Optional[_Scanner] = None
+
+
+def _init_worker(lib_path: str) -> None:
+    """
+    Initialize a worker process of `SymbolIndex.update`.
+    """
+    global _worker_scanner
+    _worker_scanner = _Scanner(lib_path)
+
+
+def _scan_file(job: Tuple[str, Optional[str]]) -> _ScanResult:
+    """
+    Scan a file in a worker process, see `_Scanner.scan`.
+    """
+    assert _worker_scanner is not None
+    return _worker_scanner.scan(job)
+
+
+class SymbolIndex:
+    """
+    A persistent index of the symbols declared in a project.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open or create the index database.
+
+        Args:
+            db_path: Path of the SQLite database
+        """
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.executescript(
+                f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS symbols;
+                CREATE TABLE files (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    digest TEXT NOT NULL
+                );
+                CREATE TABLE symbols (
+                    path TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    namespace TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    line INTEGER NOT NULL
+                );
+                CREATE INDEX symbols_name ON symbols (name);
+                CREATE INDEX symbols_path ON symbols (path);
+                PRAGMA user_version = {SCHEMA_VERSION};
+                """
+            )
+        self._namespace_map: Optional[Dict[str, str]] = None
+        self._scanner: Optional[_Scanner] = None
+
+    def close(self) -> None:
+        """
+        Close the database.
+        """
+        self._conn.close()
+
+    def __enter__(self) -> "SymbolIndex":
+        """
+        Use the index as a context manager that closes the database.
+        """
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        """
+        Close the database.
+        """
+        self.close()
+
+    def update(
+        self, paths: Iterable[str], ts_source: str, ts_out: str, jobs: int = 1
+    ) -> IndexUpdateStats:
+        """
+        Bring the index up to date with the given project files. Indexed files
+        that no longer exist are removed, other indexed files are kept as-is.
+
+        Args:
+            paths: All source files of the project
+            ts_source: Tree-sitter C++ source code repo directory
+            ts_out: Tree-sitter language output file
+            jobs: Number of worker processes used to scan changed files
+
+        Returns:
+            What was done to update the index
+        """
+        stats = IndexUpdateStats()
+        known = {
+            path: (mtime_ns, size, digest)
+            for path, mtime_ns, size, digest in self._conn.execute(
+                "SELECT path, mtime_ns, size, digest FROM files"
+            )
+        }
+
+        jobs_to_scan: List[Tuple[str, Optional[str]]] = []
+        current = set()
+        for path in paths:
+            path = os.path.abspath(path)
+            current.add(path)
+            old = known.get(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                stats.errors += 1
+                continue
+            if old is not None and old[:2] == (st.st_mtime_ns, st.st_size):
+                stats.unchanged += 1
+                continue
+            jobs_to_scan.append((path, None if old is None else old[2]))
+
+        removed = [path for path in known if path not in current and not os.path.exists(path)]
+        results = self._scan(jobs_to_scan, ts_source, ts_out, jobs) if jobs_to_scan else []
+
+        with self._conn:
+            for path in removed:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                self._conn.execute("DELETE FROM symbols WHERE path = ?", (path,))
+            stats.removed = len(removed)
+            for result in results:
+                if result.error is not None:
+                    stats.errors += 1
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                    (result.path, result.mtime_ns, result.size, result.digest),
+                )
+                if result.symbols is None:
+                    stats.unchanged += 1
+                    continue
+                stats.scanned += 1
+                self._conn.execute("DELETE FROM symbols WHERE path = ?", (result.path,))
+                self._conn.executemany(
+                    "INSERT INTO symbols VALUES (?, ?, ?, ?, ?)",
+                    [(result.path, *symbol) for symbol in result.symbols],
+                )
+        self._namespace_map = None
+        return stats
+
+    def _scan(
+        self, jobs_to_scan: List[Tuple[str, Optional[str]]], ts_source: str, ts_out: str, jobs: int
+    ) -> List[_ScanResult]:
+        """
+        Scan files across `jobs` worker processes, or in this process with a
+        scanner of its own.
+        """
+        lib_path = ensure_cpp_language(ts_source, ts_out)
+        if jobs <= 1 or len(jobs_to_scan) <= 1:
+            if self._scanner is None or self._scanner.lib_path != lib_path:
+                self._scanner = _Scanner(lib_path)
+            return [self._scanner.scan(job) for job in jobs_to_scan]
+        chunksize = max(1, len(jobs_to_scan) // (jobs * 4))
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(lib_path,)
+        ) as executor:
+            return list(executor.map(_scan_file, jobs_to_scan, chunksize=chunksize))
+
+    def symbols(self, name: str) -> List[Tuple[str, SymbolRecord]]:
+        """
+        Look up all declarations of a name.
+
+        Args:
+            name: The unqualified name
+
+        Returns:
+            The file and the declaration for each match
+        """
+        rows = self._conn.execute(
+            "SELECT path, name, namespace, kind, line FROM symbols WHERE name = ? "
+            "ORDER BY path, line",
+            (name,),
+        )
+        return [(path, SymbolRecord(*record)) for path, *record in rows]
+
+    def namespace_map(self) -> Dict[str, str]:
+        """
+        Map every type name that is declared in exactly one namespace, and not
+        in the global namespace, to that namespace. Names declared in several
+        namespaces are ambiguous and left out.
+
+        The map is loaded from the database once, so that resolving a name is
+        a dictionary lookup.
+
+        Returns:
+            A mapping from unqualified name to namespace
+        """
+        if self._namespace_map is None:
+            rows = self._conn.execute(
+                f"""
+                SELECT name, MIN(namespace) FROM symbols
+                WHERE kind IN ('{TYPE}', '{USING}')
+                GROUP BY name
+                HAVING COUNT(DISTINCT namespace) = 1 AND MIN(namespace) != ''
+                """
+            )
+            self._namespace_map = dict(rows.fetchall())
+        return self._namespace_map
@@ -0,0 +1,99 @@
+"""
+This module contains a fast byte-level check that rules out files that cannot
+need any changes, so that they are not parsed at all.
+
+A file can only change if it contains a `using` declaration or an identifier
+that one of the namespace maps resolves. `Prefilter` finds all identifiers of
+the raw source buffer (which may be memory-mapped) chunk by chunk with one
+fixed regular expression and checks them against the set of these words, so
+that building a prefilter for large maps only costs a set. Matches in comments
+or strings only cost a parse, they never cause a file to be skipped wrongly.
+"""
+import re
+from typing import Iterable, Mapping
+
+from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import SourceBytes
+
+USING_KEYWORD = "using"
+"""The keyword of the declarations that are removed"""
+
+# Whole identifiers, with the bytes of UTF-8 encoded characters as word
+# characters. Only matches where no word character precedes, so that e.g.
+# `3string` is not a match for `string`.
+_IDENTIFIER = re.compile(rb"(?<![\w\x80-\xff])[A-Za-z_\x80-\xff][\w\x80-\xff]*")
+
+_NON_WORD = re.compile(rb"[^\w\x80-\xff]")
+
+# Bytes to scan at once, so that most sources that need changes are decided
+# long before all of their identifiers are found
+_CHUNK_BYTES = 4096
+
+
+class Prefilter:
+    """
+    Decides from the raw bytes whether a source may need changes.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        """
+        Initialize the prefilter.
+
+        Args:
+            words: The keywords and identifiers whose presence means that a
+                source may need changes
+        """
+        self.words = frozenset(words)
+        """The words to look for"""
+        self._encoded = frozenset(word.encode("utf8") for word in self.words)
+
+    @classmethod
+    def from_maps(
+        cls, hardcoded_namespace_map: Mapping[str, str], index_namespace_map: Mapping[str, str]
+    ) -> "Prefilter":
+        """
+        Create the prefilter for the namespace maps of a `RemUsing` instance.
+
+        Args:
+            hardcoded_namespace_map: See `RemUsing.hardcoded_namespace_map`
+            index_namespace_map: See `RemUsing.index_namespace_map`
+
+        Returns:
+            A prefilter for the `using` keyword and the names of the maps
+        """
+        return cls({USING_KEYWORD}.union(hardcoded_namespace_map, index_namespace_map))
+
+    @classmethod
+    def for_remusing(cls, remusing: RemUsing) -> "Prefilter":
+        """
+        Create the prefilter for the configuration of a `RemUsing` instance.
+
+        Args:
+            remusing: A configured instance. Its source is not used.
+
+        Returns:
+            A prefilter for the `using` keyword and the names of the hardcoded
+            and index namespace maps
+        """
+        return cls.from_maps(remusing.hardcoded_namespace_map, remusing.index_namespace_map)
+
+    def might_change(self, src: SourceBytes) -> bool:
+        """
+        Check whether a source may need changes.
+
+        Args:
+            src: The source code
+
+        Returns:
+            `False` if the source certainly needs no changes
+        """
+        words = self._encoded
+        start, end = 0, len(src)
+        while start < end:
+            # Chunks end before a non-word byte, so that no identifier is split
+            match = _NON_WORD.search(src, start + _CHUNK_BYTES)
+            stop = end if match is None else match.start()
+            if not words.isdisjoint(_IDENTIFIER.findall(src, start, stop)):
+                return True
+            start = stop
+        return False
@@ -1,6 +1,17 @@
 """
-This module contains classes that build tree-sitter queries.
+This module contains classes that build tree-sitter queries and a cache for the
+compiled queries.
 """
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Tuple
+
+from tree_sitter import Language
+
+if TYPE_CHECKING:
+    # `tree_sitter` exports `Query` since 0.21, but the stubs only declare it
+    # in `tree_sitter.binding`, where it lived before
+    from tree_sitter.binding import Query
 
 
 class TypeQuery:
@@ -240,3 +251,143 @@ class UsingQuery:
         {self.build_using_qual_type_query()}
         {self.build_using_ns_query()}
         """
+
+
+class IndexQuery:
+    """
+    A class to build tree-sitter queries to capture the declarations recorded
+    in a project-wide symbol index.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the tree-sitter query builder for capturing declarations.
+        You may change the capture names by setting the appropriate instance
+        variables.
+        """
+        self.NAMESPACE_CAPTURE = "index_ns"
+        """Capture name for the name of a namespace definition"""
+        self.TYPE_DEF_CAPTURE = "index_type"
+        """
+        Capture name for the name of a class, struct, union, enum, `typedef`
+        or alias declaration
+        """
+        self.USING_QUAL_TYPE_CAPTURE = "index_using"
+        """
+        Capture name for the qualified name in a `using` declaration, e.g.
+        `std::string` in `using std::string;`
+        """
+
+    def build_namespace_query(self) -> str:
+        """
+        Build a query to select the names of all namespace definitions.
+
+        Returns:
+            A query string to pass to tree-sitter
+        """
+        return f"""
+        (namespace_definition name: (_) @{self.NAMESPACE_CAPTURE})
+        """
+
+    def build_type_definition_query(self) -> str:
+        """
+        Build a query to select the names of all type definitions and
+        declarations.
+
+        Returns:
+            A query string to pass to tree-sitter
+        """
+        return f"""
+        (class_specifier name: (type_identifier) @{self.TYPE_DEF_CAPTURE})
+        (struct_specifier name: (type_identifier) @{self.TYPE_DEF_CAPTURE})
+        (union_specifier name: (type_identifier) @{self.TYPE_DEF_CAPTURE})
+        (enum_specifier name: (type_identifier) @{self.TYPE_DEF_CAPTURE})
+        (type_definition declarator: (type_identifier) @{self.TYPE_DEF_CAPTURE})
+        (alias_declaration name: (type_identifier) @{self.TYPE_DEF_CAPTURE})
+        """
+
+    def build_using_query(self) -> str:
+        """
+        Build a query to select the qualified names of `using` declarations.
+
+        Returns:
+            A query string to pass to tree-sitter
+        """
+        return f"""
+        (using_declaration (qualified_identifier) @{self.USING_QUAL_TYPE_CAPTURE})
+        """
+
+    def build_all_queries(self) -> str:
+        """
+        Build all queries and combine into one.
+
+        Returns:
+            All queries as a single string to pass to tree-sitter
+        """
+        return f"""
+        {self.build_namespace_query()}
+        {self.build_type_definition_query()}
+        {self.build_using_query()}
+        """
+
+
+@dataclass
+class QueryCacheStats:
+    """
+    Counters for a `QueryCache`.
+    """
+
+    hits: int = 0
+    """Number of lookups that returned an already compiled query"""
+    misses: int = 0
+    """Number of lookups that had to compile a query"""
+
+
+class QueryCache:
+    """
+    A cache of compiled tree-sitter queries keyed on the language and the query
+    text, so that each query is compiled only once per process.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty cache.
+        """
+        self.stats = QueryCacheStats()
+        """Hit and miss counters for this cache"""
+        self._queries: Dict[Tuple[int, str], Query] = {}
+        self._lock = threading.Lock()
+
+    def get(self, language: Language, query_str: str) -> "Query":
+        """
+        Get the compiled query for `query_str`, compiling it on first use.
+
+        Args:
+            language: The tree-sitter language to compile the query for
+            query_str: The query text
+
+        Returns:
+            The compiled query
+        """
+        key = (language.language_id, query_str)
+        with self._lock:
+            query = self._queries.get(key)
+            if query is not None:
+                self.stats.hits += 1
+                return query
+            self.stats.misses += 1
+            query = language.query(query_str)
+            self._queries[key] = query
+            return query
+
+    def clear(self) -> None:
+        """
+        Remove all compiled queries and reset the counters.
+        """
+        with self._lock:
+            self._queries.clear()
+            self.stats = QueryCacheStats()
+
+
+DEFAULT_QUERY_CACHE = QueryCache()
+"""The process-wide query cache shared by all `RemUsing` instances by default"""
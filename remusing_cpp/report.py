@@ -0,0 +1,180 @@
+"""
+This module contains the findings of a scan of a source, see
+`remusing_cpp.core.RemUsing.report`.
+
+A scan stops after the captures are processed: it counts the `using`
+declarations of a source and the unqualified symbols that a fix would
+qualify, by category and by namespace, but neither computes the edits nor
+builds the fixed source. The location of each finding is optional, since
+mapping byte offsets to lines is the only part of a scan that grows with the
+number of findings.
+"""
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from remusing_cpp.edits import SourceBytes
+
+
+class Category(str, Enum):
+    """
+    What a finding is.
+    """
+
+    USING_NAMESPACE = "using_namespace"
+    """A `using` directive, e.g. `using namespace std;`"""
+    USING_DECLARATION = "using_declaration"
+    """A `using` declaration of a single name, e.g. `using std::string;`"""
+    UNQUALIFIED = "unqualified"
+    """An unqualified symbol that a namespace map resolves, e.g. `string`"""
+
+
+CATEGORIES = tuple(Category)
+"""All categories, in the order of the report columns"""
+
+
+class Finding(NamedTuple):
+    """
+    A single `using` declaration or unqualified symbol.
+    """
+
+    category: Category
+    """What was found"""
+    line: int
+    """Line of the first byte, starting at 1"""
+    column: int
+    """Byte column of the first byte in its line, starting at 1"""
+    text: str
+    """The declaration or the symbol name"""
+    namespace: str
+    """
+    The namespace that a declaration uses, or that qualifies the symbol,
+    e.g. `std`
+    """
+
+    def as_json(self) -> Dict[str, Any]:
+        """
+        Convert the finding into a JSON-serializable dictionary.
+
+        Returns:
+            The fields by name
+        """
+        return {
+            "category": self.category.value,
+            "line": self.line,
+            "column": self.column,
+            "text": self.text,
+            "namespace": self.namespace,
+        }
+
+
+@dataclass
+class SourceReport:
+    """
+    The findings of a source.
+    """
+
+    counts: Dict[Category, int] = field(default_factory=lambda: dict.fromkeys(CATEGORIES, 0))
+    """Number of findings of each category"""
+    namespaces: Dict[str, int] = field(default_factory=dict)
+    """Number of unqualified symbols by the namespace that qualifies them"""
+    findings: List[Finding] = field(default_factory=list)
+    """Every finding in source order, if the locations were requested"""
+
+    @property
+    def total(self) -> int:
+        """
+        Number of findings of all categories.
+        """
+        return sum(self.counts.values())
+
+    def add(self, category: Category, namespace: str) -> None:
+        """
+        Count a finding.
+
+        Args:
+            category: What was found
+            namespace: The namespace of the finding
+        """
+        self.counts[category] += 1
+        if category is Category.UNQUALIFIED:
+            self.namespaces[namespace] = self.namespaces.get(namespace, 0) + 1
+
+    def merge(self, other: "SourceReport") -> None:
+        """
+        Add the counts of another report. Its findings are not copied.
+
+        Args:
+            other: The report to add
+        """
+        for category, count in other.counts.items():
+            self.counts[category] += count
+        for namespace, count in other.namespaces.items():
+            self.namespaces[namespace] = self.namespaces.get(namespace, 0) + count
+
+    def as_json(self) -> Dict[str, Any]:
+        """
+        Convert the report into a JSON-serializable dictionary.
+
+        Returns:
+            The counts, and the findings if there are any
+        """
+        report: Dict[str, Any] = {
+            "counts": {category.value: count for category, count in self.counts.items()},
+            "namespaces": dict(sorted(self.namespaces.items())),
+        }
+        if self.findings:
+            report["findings"] = [finding.as_json() for finding in self.findings]
+        return report
+
+
+class LineIndex:
+    """
+    Maps byte offsets of a source to lines and columns.
+    """
+
+    def __init__(self, src: SourceBytes):
+        """
+        Index the line starts of a source.
+
+        Args:
+            src: The source code
+        """
+        self._size = len(src)
+        self._starts = array("Q", [0])
+        pos = src.find(b"\n")
+        while pos != -1:
+            self._starts.append(pos + 1)
+            pos = src.find(b"\n", pos + 1)
+
+    def location(self, byte: int) -> Tuple[int, int]:
+        """
+        Locate a byte offset.
+
+        Args:
+            byte: The byte offset
+
+        Returns:
+            The line and the byte column, both starting at 1
+        """
+        line = bisect_right(self._starts, byte)
+        return line, byte - self._starts[line - 1] + 1
+
+    def byte_range(self, first_line: int, last_line: int) -> Tuple[int, int]:
+        """
+        Get the byte range of a range of lines.
+
+        Args:
+            first_line: The first line, starting at 1
+            last_line: The last line (inclusive)
+
+        Returns:
+            The byte range `[start, end)`, including the line break of the
+            last line. Lines past the end of the source are empty.
+        """
+        starts = self._starts
+        start = starts[first_line - 1] if 1 <= first_line <= len(starts) else self._size
+        end = starts[last_line] if 0 <= last_line < len(starts) else self._size
+        return min(start, end), end
@@ -0,0 +1,109 @@
+"""
+This module contains the memoized lookup table that resolves unqualified
+identifiers to their namespace qualification.
+
+`NamespaceTable` merges the namespace maps that do not depend on the source
+with a defined precedence. It maps identifier bytes straight to the prebuilt
+prefix bytes (e.g. `b"std::"`) and the reason of the edit, so that neither
+decoding nor formatting happens per occurrence. Identifiers are resolved
+against the maps on first use and memoized, so a table costs nothing up-front
+even for large maps and gets faster the more sources share it, e.g. all files
+of a batch worker. The `using` declarations of a source take precedence over
+the table and are merged in per source, see `remusing_cpp.core.RemUsing.edits`.
+"""
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from remusing_cpp.edits import EditReason
+
+Resolution = Tuple[bytes, EditReason]
+"""The prefix to insert before an identifier, and the reason for it"""
+
+# Marker for identifiers that were not looked up yet
+_UNKNOWN: Any = object()
+
+
+def resolution(namespace: bytes, reason: EditReason) -> Resolution:
+    """
+    Build the resolution of an identifier into a namespace.
+
+    Args:
+        namespace: The namespace, e.g. `b"std"`
+        reason: Where the namespace comes from
+
+    Returns:
+        The prefix to insert, e.g. `b"std::"`, and the reason
+    """
+    return namespace + b"::", reason
+
+
+class NamespaceTable:
+    """
+    The merged namespace maps as a memoized, byte-keyed lookup table.
+    """
+
+    def __init__(self, layers: Sequence[Tuple[Mapping[str, str], EditReason]]):
+        """
+        Initialize the table. The maps must not change while it is in use.
+
+        Args:
+            layers: Maps from identifier to namespace, with the reason for
+                their edits, in order of decreasing precedence. Empty
+                namespaces are ignored.
+        """
+        self.layers = list(layers)
+        self.table: Dict[bytes, Optional[Resolution]] = {}
+        """The resolution of each identifier that was looked up so far"""
+        # The resolution of each distinct namespace of each layer, so that
+        # identifiers in the same namespace share their prefix bytes
+        self._prefixes: List[Dict[str, Resolution]] = [{} for _ in self.layers]
+
+    @classmethod
+    def from_maps(
+        cls, hardcoded_namespace_map: Mapping[str, str], index_namespace_map: Mapping[str, str]
+    ) -> "NamespaceTable":
+        """
+        Build the table of the namespace maps of `remusing_cpp.core.RemUsing`.
+
+        Args:
+            hardcoded_namespace_map: See `RemUsing.hardcoded_namespace_map`
+            index_namespace_map: See `RemUsing.index_namespace_map`, it has
+                the lowest precedence
+
+        Returns:
+            The table
+        """
+        return cls(
+            [
+                (hardcoded_namespace_map, EditReason.HARDCODED_QUALIFICATION),
+                (index_namespace_map, EditReason.INDEX_QUALIFICATION),
+            ]
+        )
+
+    def get(self, identifier: bytes) -> Optional[Resolution]:
+        """
+        Resolve an identifier.
+
+        Args:
+            identifier: The identifier bytes
+
+        Returns:
+            The resolution, or `None` if no map knows the identifier
+        """
+        cached = self.table.get(identifier, _UNKNOWN)
+        if cached is not _UNKNOWN:
+            return cached  # type: ignore[no-any-return]
+        found: Optional[Resolution] = None
+        # The maps are keyed on text, only decode for them. Bytes that are not
+        # UTF-8, e.g. in Latin-1 sources, are kept as lone surrogates, which
+        # round-trip and only match keys that were decoded the same way.
+        text = identifier.decode("utf8", errors="surrogateescape")
+        for (namespace_map, reason), prefixes in zip(self.layers, self._prefixes):
+            namespace = namespace_map.get(text)
+            if namespace:
+                found = prefixes.get(namespace)
+                if found is None:
+                    prefix = namespace.encode("utf8", errors="surrogateescape")
+                    found = prefixes[namespace] = resolution(prefix, reason)
+                break
+        self.table[identifier] = found
+        return found
@@ -0,0 +1,452 @@
+"""
+This module contains a long-running server that keeps the tree-sitter parser,
+language and compiled queries warm between fix requests, and a client to talk
+to it.
+
+The protocol is JSON-RPC 2.0 with one JSON message per line, served either
+over a Unix socket or over stdin/stdout. Source code is sent as text, with
+bytes that are not valid UTF-8 carried through as surrogate escapes.
+
+The supported methods are:
+
+* `fix`: Fix a single buffer (`source`) or file (`path`). The `format` is one
+  of `source`, `json` or `diff`, like on the CLI. With `in_place`, the file is
+  overwritten instead of the output being returned.
+* `fix_files`: Fix the given `paths` in-place and return a result per file.
+* `ping`: Check that the server is alive.
+* `shutdown`: Stop the server after answering.
+"""
+import errno
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+from typing import IO, Any, Dict, List, Optional, Sequence, Union
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp.batch import FileResult, fix_file
+from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import Edit, SourceBytes, apply_edits, unified_diff
+from remusing_cpp.resolve import NamespaceTable
+from remusing_cpp.symbols import layered_namespace_map
+from remusing_cpp.util import load_cpp_language
+
+FORMATS = ("source", "json", "diff")
+"""Output formats supported by the `fix` method"""
+
+PARSE_ERROR = -32700
+"""JSON-RPC error code for a malformed message"""
+INVALID_REQUEST = -32600
+"""JSON-RPC error code for a message that is not a valid request"""
+METHOD_NOT_FOUND = -32601
+"""JSON-RPC error code for an unknown method"""
+INVALID_PARAMS = -32602
+"""JSON-RPC error code for invalid method parameters"""
+SERVER_ERROR = -32000
+"""JSON-RPC error code for failures while processing a request"""
+
+DEFAULT_TIMEOUT = 120.0
+"""Seconds that a `FixClient` waits for the server by default"""
+
+
+class RpcError(Exception):
+    """
+    An error to report back to the client as a JSON-RPC error response.
+    """
+
+    def __init__(self, code: int, message: str):
+        """
+        Initialize the error.
+
+        Arguments:
+            code: The JSON-RPC error code
+            message: Description of the error
+        """
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _decode(data: bytes) -> str:
+    """
+    Decode source bytes for transport, keeping invalid UTF-8 intact.
+    """
+    return data.decode("utf8", errors="surrogateescape")
+
+
+def _encode(text: str) -> bytes:
+    """
+    Encode transported text back to the original source bytes.
+    """
+    return text.encode("utf8", errors="surrogateescape")
+
+
+def render_edits(src: SourceBytes, edits: List[Edit], fmt: str, name: str = "") -> str:
+    """
+    Render the edits of a source in one of the output formats.
+
+    Arguments:
+        src: The source code that the edits apply to
+        edits: The edits for the source
+        fmt: One of `FORMATS`
+        name: Name of the file in the diff header
+
+    Returns:
+        The fixed source, the edits as JSON or a unified diff
+    """
+    if fmt == "json":
+        return json.dumps([edit.as_json() for edit in edits], indent=2) + "\n"
+    if fmt == "diff":
+        return "".join(unified_diff(src if isinstance(src, bytes) else src[:], edits, name, name))
+    return _decode(apply_edits(src, edits))
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    """
+    Remove a socket that was left behind by a server that did not shut down.
+
+    Arguments:
+        socket_path: Path of the Unix socket to listen on
+
+    Raises:
+        FileExistsError: If the path is not a socket, or a server is still
+            listening on it
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "Not a socket", socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise FileExistsError(errno.EEXIST, "A server is already listening", socket_path)
+
+
+class FixServer:
+    """
+    Answers fix requests using a single, warm tree-sitter parser.
+    """
+
+    def __init__(self, lib_path: str, symbol_maps: Sequence[str] = ()):
+        """
+        Initialize the server state. The language is loaded and the queries
+        are compiled up-front so that the first request is as fast as the rest.
+
+        Arguments:
+            lib_path: Path of the already built tree-sitter C++ language
+            symbol_maps: Symbol map files, see
+                `remusing_cpp.symbols.layered_namespace_map`
+        """
+        self.language: Language = load_cpp_language(lib_path)
+        self.parser = Parser()
+        self.parser.set_language(self.language)
+        self.running = True
+        """Whether the server should keep accepting requests"""
+        self.namespace_table = NamespaceTable.from_maps(layered_namespace_map(symbol_maps), {})
+        """Resolutions of the namespace maps, memoized across requests"""
+
+        RemUsing(b"", self.parser, self.language).query()
+
+    def fix(
+        self,
+        source: Optional[str] = None,
+        path: Optional[str] = None,
+        format: str = "source",
+        in_place: bool = False,
+        name: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Fix a single buffer or file.
+
+        Arguments:
+            source: The source code to fix
+            path: The file to fix, if no `source` is given
+            format: One of `FORMATS`
+            in_place: Overwrite `path` instead of returning the output
+            name: Name of the file in the diff header (default: `path` or
+                `<stdin>`)
+
+        Returns:
+            Whether the source changed and the rendered `output`, which is
+            `None` for in-place fixes
+        """
+        if format not in FORMATS:
+            raise RpcError(INVALID_PARAMS, f"Unknown format: {format}")
+        if (source is None) == (path is None):
+            raise RpcError(INVALID_PARAMS, "Exactly one of 'source' and 'path' is required")
+        if in_place:
+            if path is None:
+                raise RpcError(INVALID_PARAMS, "'in_place' requires a 'path'")
+            result = fix_file(
+                path, self.parser, self.language, namespace_table=self.namespace_table
+            )
+            if result.error is not None:
+                raise RpcError(SERVER_ERROR, result.error)
+            return {"changed": result.changed, "output": None}
+
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    src = f.read()
+            except OSError as e:
+                raise RpcError(SERVER_ERROR, str(e)) from e
+        else:
+            assert source is not None
+            src = _encode(source)
+        remusing = RemUsing(src, self.parser, self.language)
+        remusing.namespace_table = self.namespace_table
+        edits = remusing.edits()
+        return {
+            "changed": bool(edits),
+            "output": render_edits(src, edits, format, name or path or "<stdin>"),
+        }
+
+    def fix_files(self, paths: List[str]) -> Dict[str, Any]:
+        """
+        Fix files in-place.
+
+        Arguments:
+            paths: Files to fix
+
+        Returns:
+            The per-file `results`
+        """
+        results = [
+            fix_file(path, self.parser, self.language, namespace_table=self.namespace_table)
+            for path in paths
+        ]
+        return {"results": [vars(result) for result in results]}
+
+    def handle(self, request: Any) -> Optional[Dict[str, Any]]:
+        """
+        Answer a single JSON-RPC request.
+
+        Arguments:
+            request: The decoded request message
+
+        Returns:
+            The response message, or `None` for notifications
+        """
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RpcError(INVALID_REQUEST, "Invalid request")
+            method = request["method"]
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, "Parameters must be an object")
+            try:
+                if method == "fix":
+                    result: Any = self.fix(**params)
+                elif method == "fix_files":
+                    result = self.fix_files(**params)
+                elif method == "ping":
+                    result = "pong"
+                elif method == "shutdown":
+                    self.running = False
+                    result = None
+                else:
+                    raise RpcError(METHOD_NOT_FOUND, f"Unknown method: {method}")
+            except TypeError as e:
+                raise RpcError(INVALID_PARAMS, str(e)) from e
+        except RpcError as e:
+            response: Dict[str, Any] = {"error": {"code": e.code, "message": e.message}}
+        except Exception as e:  # noqa: BLE001 - a failed request must not stop the server
+            message = f"{type(e).__name__}: {e}"
+            response = {"error": {"code": SERVER_ERROR, "message": message}}
+        else:
+            if "id" not in request:
+                return None
+            response = {"result": result}
+        return {"jsonrpc": "2.0", "id": request_id, **response}
+
+    def handle_line(self, line: bytes) -> Optional[bytes]:
+        """
+        Answer a single line of the protocol.
+
+        Arguments:
+            line: One JSON message
+
+        Returns:
+            The encoded response line, or `None` if there is nothing to send
+        """
+        if not line.strip():
+            return None
+        try:
+            request = json.loads(line)
+        except ValueError:
+            response: Optional[Dict[str, Any]] = {
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": PARSE_ERROR, "message": "Parse error"},
+            }
+        else:
+            response = self.handle(request)
+        if response is None:
+            return None
+        return json.dumps(response).encode("utf8") + b"\n"
+
+    def serve_stream(
+        self,
+        rfile: Union[IO[bytes], io.BufferedIOBase],
+        wfile: Union[IO[bytes], io.BufferedIOBase],
+    ) -> None:
+        """
+        Answer requests from a stream until it is closed or a shutdown is
+        requested.
+
+        Arguments:
+            rfile: Stream to read requests from
+            wfile: Stream to write responses to
+        """
+        for line in rfile:
+            response = self.handle_line(line)
+            if response is not None:
+                wfile.write(response)
+                wfile.flush()
+            if not self.running:
+                break
+
+    def serve_unix(self, socket_path: str) -> None:
+        """
+        Answer requests on a Unix socket until a shutdown is requested.
+        Connections are handled one at a time, since the parser is shared.
+
+        Arguments:
+            socket_path: Path of the Unix socket to listen on
+
+        Raises:
+            FileExistsError: If something else than a stale socket is in the
+                way
+        """
+        fix_server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            """
+            Serves the requests of a single connection.
+            """
+
+            def handle(self) -> None:
+                """
+                Answer the requests of the connection.
+                """
+                fix_server.serve_stream(self.rfile, self.wfile)
+
+        _remove_stale_socket(socket_path)
+        with socketserver.UnixStreamServer(socket_path, Handler) as server:
+            try:
+                while self.running:
+                    server.handle_request()
+            finally:
+                os.unlink(socket_path)
+
+
+class FixClient:
+    """
+    Sends requests to a `FixServer` listening on a Unix socket.
+    """
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = DEFAULT_TIMEOUT):
+        """
+        Connect to the server.
+
+        Arguments:
+            socket_path: Path of the server's Unix socket
+            timeout: Seconds to wait for the connection and for each response,
+                or `None` to wait forever. A server that does not answer in
+                time raises `TimeoutError` (`socket.timeout` before Python
+                3.10).
+
+        Raises:
+            OSError: If the server cannot be reached
+        """
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(socket_path)
+        except OSError:
+            self._sock.close()
+            raise
+        self._rfile = self._sock.makefile("rb")
+        self._next_id = 0
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+        self._rfile.close()
+        self._sock.close()
+
+    def __enter__(self) -> "FixClient":
+        """
+        Use the client as a context manager that closes the connection.
+        """
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """
+        Close the connection.
+        """
+        self.close()
+
+    def call(self, method: str, **params: Any) -> Any:
+        """
+        Call a server method and wait for its result.
+
+        Arguments:
+            method: The method name
+            params: The method parameters
+
+        Returns:
+            The result of the call
+
+        Raises:
+            RpcError: If the server answers with an error
+            ConnectionError: If the server closes the connection
+            OSError: If the server does not answer within the timeout
+        """
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        self._sock.sendall(json.dumps(request).encode("utf8") + b"\n")
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RpcError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def fix(self, src: bytes, format: str = "source", name: Optional[str] = None) -> str:
+        """
+        Fix a buffer on the server.
+
+        Arguments:
+            src: The source code to fix
+            format: One of `FORMATS`
+            name: Name of the file in the diff header
+
+        Returns:
+            The rendered output
+        """
+        output: str = self.call("fix", source=_decode(src), format=format, name=name)["output"]
+        return output
+
+    def fix_files(self, paths: List[str]) -> List[FileResult]:
+        """
+        Fix files in-place on the server.
+
+        Arguments:
+            paths: Files to fix
+
+        Returns:
+            The per-file results
+        """
+        return [FileResult(**result) for result in self.call("fix_files", paths=paths)["results"]]
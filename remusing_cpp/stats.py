@@ -0,0 +1,143 @@
+"""
+This module contains optional instrumentation of the `RemUsing` stages.
+
+Attach a `RemUsingStats` object to `RemUsing.stats` to record the wall time
+of each stage, the number of captures per capture name, the fixups by type
+and the source sizes. Stats of many files are combined with `merge`, which
+tells whether a run is parse-bound, query-bound or rewrite-bound.
+"""
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+from remusing_cpp.edits import Edit
+
+STAGES = ("parse", "query", "process_captures", "edits", "fix")
+"""The instrumented `RemUsing` stages, in the order they run"""
+
+UNRESOLVED = "unresolved"
+"""Fixup type of an unqualified identifier that no namespace map resolves"""
+
+
+@dataclass
+class RemUsingStats:
+    """
+    Counters and timings of one or more `RemUsing` runs.
+    """
+
+    files: int = 0
+    """Number of processed sources"""
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    """Wall time of each stage, excluding the stages it depends on"""
+    captures: Dict[str, int] = field(default_factory=dict)
+    """Number of captures per capture name"""
+    fixups: Dict[str, int] = field(default_factory=dict)
+    """
+    Number of fixups per `remusing_cpp.edits.EditReason` value, and of
+    unqualified identifiers that were left alone under `UNRESOLVED`
+    """
+    bytes_in: int = 0
+    """Total size of the sources"""
+    bytes_out: int = 0
+    """Total size of the fixed sources"""
+    skipped: int = 0
+    """Number of sources that were not parsed since they cannot need changes"""
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+        Add the wall time of a block to a stage.
+
+        Args:
+            stage: One of `STAGES`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + elapsed
+
+    def record_captures(self, counts: Dict[str, int]) -> None:
+        """
+        Add capture counts.
+
+        Args:
+            counts: Number of captures per capture name
+        """
+        for name, count in counts.items():
+            self.captures[name] = self.captures.get(name, 0) + count
+
+    def record_edits(self, src_size: int, edits: Sequence[Edit], unresolved: int = 0) -> None:
+        """
+        Count a processed source and its fixups.
+
+        Args:
+            src_size: Size of the source in bytes
+            edits: The edits for the source
+            unresolved: Number of unqualified identifiers without a namespace
+        """
+        self.files += 1
+        self.bytes_in += src_size
+        self.bytes_out += src_size
+        for edit in edits:
+            self.bytes_out += len(edit.replacement) - (edit.end_byte - edit.start_byte)
+            reason = UNRESOLVED if edit.reason is None else edit.reason.value
+            self.fixups[reason] = self.fixups.get(reason, 0) + 1
+        if unresolved:
+            self.fixups[UNRESOLVED] = self.fixups.get(UNRESOLVED, 0) + unresolved
+
+    def merge(self, other: "RemUsingStats") -> None:
+        """
+        Add the counters and timings of another stats object to this one.
+
+        Args:
+            other: The stats to add
+        """
+        self.files += other.files
+        self.skipped += other.skipped
+        for stage, seconds in other.stage_seconds.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.record_captures(other.captures)
+        for reason, count in other.fixups.items():
+            self.fixups[reason] = self.fixups.get(reason, 0) + count
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+
+    def as_json(self) -> Dict[str, Any]:
+        """
+        Convert the stats into a JSON-serializable dictionary.
+
+        Returns:
+            The counters and timings, with the stages in execution order
+        """
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return {
+            "files": self.files,
+            "skipped": self.skipped,
+            "stage_seconds": dict(
+                sorted(self.stage_seconds.items(), key=lambda item: order.get(item[0], len(order)))
+            ),
+            "captures": dict(sorted(self.captures.items())),
+            "fixups": dict(sorted(self.fixups.items())),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+def merge_stats(stats: Iterable[Optional[RemUsingStats]]) -> RemUsingStats:
+    """
+    Combine the stats of many runs.
+
+    Args:
+        stats: Stats of each run. `None` entries are skipped.
+
+    Returns:
+        The combined stats
+    """
+    total = RemUsingStats()
+    for item in stats:
+        if item is not None:
+            total.merge(item)
+    return total
@@ -1,8 +1,38 @@
 """
 This module contains functionality for handling symbol names and namespace
 mappings.
+
+Besides the hardcoded `std` symbols, namespace maps can be loaded from symbol
+map files, see `load_symbol_map`. A text map lists one qualified name per
+line, e.g. `boost::asio::io_context`, and `compile_symbol_map` turns any
+number of them into a compiled map that loads without parsing. Loaded maps
+are cached per process and read-only, so that every `RemUsing` instance and
+every file of a batch worker shares them instead of building a dictionary of
+its own. `layered_namespace_map` stacks several maps by precedence.
 """
-from typing import Dict, List
+import os
+import pickle
+from collections import ChainMap
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+from remusing_cpp.util import atomic_open, open_source
+
+COMPILED_MAGIC = "remusing_cpp.symbol_map"
+"""Tag of the compiled symbol map format"""
+COMPILED_VERSION = 1
+"""Version of the compiled symbol map format"""
+
+# Loaded symbol maps by absolute path, with the modification time and size
+# of the file that they were loaded from
+_loaded_maps: Dict[str, Tuple[Tuple[int, int], Mapping[str, str]]] = {}
+
+
+class SymbolMapError(Exception):
+    """
+    A symbol map file could not be loaded.
+    """
 
 
 def get_default_std_symbols() -> List[str]:
@@ -24,8 +54,17 @@ def get_default_std_symbols() -> List[str]:
     Returns:
         A list of symbols belonging to the 'std::' namespace
     """
+    return list(_default_std_symbols())
+
+
+@lru_cache(maxsize=None)
+def _default_std_symbols() -> Tuple[str, ...]:
+    """
+    Split the hard-coded list of `std::` symbols once.
+    """
     # This is written in a way to more easily add/delete/sort the entries
-    return """
+    return tuple(
+        """
 abs
 ceil
 cerr
@@ -73,7 +112,8 @@ unordered_map
 vector
 ws
 """.strip().split(
-        "\n"
+            "\n"
+        )
     )
 
 
@@ -85,3 +125,129 @@ def get_default_symb_namespace_map() -> Dict[str, str]:
         A default mapping from symbol name to namespace
     """
     return {s: "std" for s in get_default_std_symbols()}
+
+
+@lru_cache(maxsize=None)
+def default_namespace_map() -> Mapping[str, str]:
+    """
+    The default mapping of `get_default_symb_namespace_map`, built once and
+    shared read-only.
+
+    Returns:
+        A read-only mapping from symbol name to namespace
+    """
+    return MappingProxyType(get_default_symb_namespace_map())
+
+
+def parse_symbol_map(lines: Sequence[str], name: str = "<symbol map>") -> Dict[str, str]:
+    """
+    Parse a text symbol map. Every line holds a qualified name, e.g.
+    `std::string` or `boost::asio::io_context`, that maps the last component
+    to the namespace before it. Blank lines and lines starting with `#` are
+    ignored. If a name is listed more than once, the first line wins.
+
+    Args:
+        lines: The lines of the map
+        name: Name of the map in error messages
+
+    Returns:
+        The mapping from symbol name to namespace
+    """
+    namespace_map: Dict[str, str] = {}
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        namespace, _, symbol = line.lstrip(":").rpartition("::")
+        if not namespace or not symbol or len(line.split()) > 1:
+            raise SymbolMapError(f"{name}:{number}: expected a qualified name, got '{line}'")
+        namespace_map.setdefault(symbol, namespace)
+    return namespace_map
+
+
+def _read_symbol_map(path: str) -> Dict[str, str]:
+    """
+    Read a text or compiled symbol map file.
+    """
+    with open_source(path) as data:
+        # Text maps cannot start with a pickle protocol marker, which is not
+        # valid UTF-8 on its own
+        if data[:1] != b"\x80":
+            return parse_symbol_map(bytes(data).decode("utf8").splitlines(), path)
+        try:
+            magic, version, namespace_map = pickle.loads(data)
+        except Exception as e:  # noqa: BLE001 - unpickling raises all kinds of errors
+            raise SymbolMapError(f"{path}: not a compiled symbol map: {e}") from e
+    if magic != COMPILED_MAGIC or version != COMPILED_VERSION or type(namespace_map) is not dict:
+        raise SymbolMapError(f"{path}: not a compiled symbol map of version {COMPILED_VERSION}")
+    return namespace_map
+
+
+def load_symbol_map(path: str) -> Mapping[str, str]:
+    """
+    Load a symbol map file, or get it from the cache of the process if the
+    file has not changed since.
+
+    Text maps are parsed with `parse_symbol_map`. Compiled maps, see
+    `compile_symbol_map`, are unpickled straight from a read-only memory map
+    of the file. Compiled maps are pickles, so only load trusted files.
+
+    Args:
+        path: The map file
+
+    Returns:
+        A read-only mapping from symbol name to namespace
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = _loaded_maps.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        namespace_map = MappingProxyType(_read_symbol_map(path))
+    except (OSError, UnicodeDecodeError) as e:
+        raise SymbolMapError(f"{path}: {e}") from e
+    _loaded_maps[path] = (version, namespace_map)
+    return namespace_map
+
+
+def layered_namespace_map(paths: Sequence[str] = ()) -> Mapping[str, str]:
+    """
+    Stack symbol map files on top of the default namespace map.
+
+    Args:
+        paths: The map files, in order of decreasing precedence. All of them
+            take precedence over the default map.
+
+    Returns:
+        The layered read-only mapping from symbol name to namespace, see
+        `remusing_cpp.core.RemUsing.hardcoded_namespace_map`
+    """
+    if not paths:
+        return default_namespace_map()
+    maps = [*map(load_symbol_map, paths), default_namespace_map()]
+    # The layers are read-only, but a `ChainMap` is only written to on assignment
+    return ChainMap(*maps)  # type: ignore[arg-type]
+
+
+def compile_symbol_map(paths: Sequence[str], out_path: str) -> int:
+    """
+    Merge symbol map files into a compiled symbol map, see `load_symbol_map`.
+
+    Args:
+        paths: The text or compiled map files, in order of decreasing
+            precedence
+        out_path: The compiled map file to write
+
+    Returns:
+        Number of symbols in the compiled map
+    """
+    namespace_map: Dict[str, str] = {}
+    for path in reversed(paths):
+        namespace_map.update(load_symbol_map(path))
+    with atomic_open(out_path) as f:
+        pickle.dump(
+            (COMPILED_MAGIC, COMPILED_VERSION, namespace_map), f, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    return len(namespace_map)
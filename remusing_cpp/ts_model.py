@@ -1,6 +1,10 @@
 """
 This module contains custom data models to improve upon the original tree sitter
 data types.
+
+The package itself keeps captures as packed spans, see
+`remusing_cpp.captures`. `HashableTreeNode` is kept for code that still wraps
+nodes with it.
 """
 from dataclasses import dataclass
 from functools import total_ordering
@@ -18,10 +22,21 @@ class HashableTreeNode:
 
     node: Node
 
+    @property
+    def data(self) -> bytes:
+        """
+        Get the source code bytes for this node, without decoding them.
+
+        Returns:
+            The bytes of this node.
+        """
+        return self.node.text
+
     @property
     def text(self) -> str:
         """
-        Get the source code text for this node.
+        Get the source code text for this node. Prefer `data` unless text is
+        needed, since this decodes on every access.
 
         Returns:
             String text for this node.
@@ -1,38 +1,375 @@
 """
 This module contains helpful utility functions for interacting with tree-sitter
 and preparing for usage of the library.
+
+The grammar either comes prebuilt with the `tree_sitter_cpp` package, see
+`PREBUILT_GRAMMAR`, or is compiled from a grammar repo on first use. The
+`tree_sitter` package is only imported once a language is loaded, so that
+importing this module stays cheap for the CLI.
+"""
+import hashlib
+import importlib.util
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager, suppress
+from typing import IO, TYPE_CHECKING, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from tree_sitter import Language, Parser
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on Windows. The atomic rename still prevents readers from
+    # seeing partially written libraries, only concurrent builds are not
+    # serialized.
+    fcntl = None  # type: ignore[assignment]
+
+PREBUILT_GRAMMAR = "<prebuilt>"
+"""
+Stands for the grammar of the installed `tree_sitter_cpp` package, in place of
+both a grammar repo directory and a built library path. It needs no compiler.
 """
-from typing import Tuple
 
-from tree_sitter import Language, Parser
+
+def _read_umask() -> int:
+    """
+    Read the process umask. This means changing it, which races with other
+    threads, so it is only done once at import.
+
+    Returns:
+        The umask of the process
+    """
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_NEW_FILE_MODE = 0o666 & ~_read_umask()
+"""The mode `open` gives new files, see `atomic_open`."""
+
+
+def _grammar_sources(tree_sitter_cpp_path: str) -> List[str]:
+    """
+    List the grammar source files that the built language depends on.
+
+    Args:
+        tree_sitter_cpp_path: Where to look for the tree sitter C++ repo
+
+    Returns:
+        Sorted paths to the grammar sources
+    """
+    src_path = os.path.join(tree_sitter_cpp_path, "src")
+    sources = [os.path.join(src_path, "parser.c")]
+    for scanner in ("scanner.cc", "scanner.c"):
+        if os.path.exists(os.path.join(src_path, scanner)):
+            sources.append(os.path.join(src_path, scanner))
+            break
+    header_path = os.path.join(src_path, "tree_sitter")
+    if os.path.isdir(header_path):
+        sources.extend(
+            os.path.join(header_path, name)
+            for name in sorted(os.listdir(header_path))
+            if name.endswith(".h")
+        )
+    return sources
+
+
+def prebuilt_grammar_available() -> bool:
+    """
+    Check whether the prebuilt grammar can be loaded, without importing it.
+
+    Returns:
+        Whether the `tree_sitter_cpp` package is installed
+    """
+    return importlib.util.find_spec("tree_sitter_cpp") is not None
+
+
+def _prebuilt_grammar_digest() -> str:
+    """
+    Identify the grammar revision of the `tree_sitter_cpp` package by its
+    version.
+
+    Returns:
+        Hex digest identifying the grammar revision
+    """
+    from importlib.metadata import version
+
+    return hashlib.sha256(f"tree-sitter-cpp=={version('tree-sitter-cpp')}".encode()).hexdigest()
+
+
+def grammar_digest(tree_sitter_cpp_path: str) -> str:
+    """
+    Hash the contents of the C++ grammar sources.
+
+    Args:
+        tree_sitter_cpp_path: Where to look for the tree sitter C++ repo
+
+    Returns:
+        Hex digest identifying the grammar revision
+    """
+    h = hashlib.sha256()
+    for source in _grammar_sources(tree_sitter_cpp_path):
+        h.update(os.path.basename(source).encode("utf8"))
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def _grammar_fingerprint(tree_sitter_cpp_path: str) -> str:
+    """
+    Cheap, stat-based fingerprint of the grammar sources. This is used to
+    avoid re-hashing the (large) sources when nothing has changed.
+
+    Args:
+        tree_sitter_cpp_path: Where to look for the tree sitter C++ repo
+
+    Returns:
+        Fingerprint of the grammar sources
+    """
+    parts = []
+    for source in _grammar_sources(tree_sitter_cpp_path):
+        st = os.stat(source)
+        parts.append(f"{os.path.abspath(source)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+@contextmanager
+def atomic_open(path: str) -> Iterator[IO[bytes]]:
+    """
+    Open a temporary file next to `path` for writing and rename it into place
+    when the context exits without an error. Readers never observe a partially
+    written file. The permissions of an existing file are kept, new files get
+    the mode `open` would give them under the process umask.
+
+    Symbolic links are followed, so that the file they point to is replaced
+    and the link is kept. The owner and group of an existing file are carried
+    over where the process is allowed to.
+
+    Args:
+        path: File to write
+
+    Returns:
+        A binary file object to write the new contents to
+    """
+    path = os.path.realpath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        try:
+            st: Optional[os.stat_result] = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is None:
+            os.chmod(tmp_path, _NEW_FILE_MODE)
+        else:
+            if hasattr(os, "chown"):
+                # Unprivileged users may not be allowed to keep the owner
+                with suppress(PermissionError):
+                    os.chown(tmp_path, st.st_uid, st.st_gid)
+            os.chmod(tmp_path, st.st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
-def build_cpp_language(tree_sitter_cpp_path: str, out_path: str) -> Language:
+def _atomic_write(path: str, data: bytes) -> None:
+    """
+    Write a file by renaming a fully written temporary file into place.
+
+    Args:
+        path: File to write
+        data: Contents to write
+    """
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+@contextmanager
+def open_source(path: str) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Map a source file into memory read-only, so that large files are paged in
+    on demand instead of being copied into a `bytes` object.
+
+    Files that cannot be mapped, like empty files or pipes, are read instead.
+    The mapping must not be used after the context exits.
+
+    Args:
+        path: File to open
+
+    Returns:
+        The contents of the file
+    """
+    mapped: Optional[mmap.mmap] = None
+    data = b""
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            data = f.read()
+    if mapped is None:
+        yield data
+    else:
+        with mapped:
+            yield mapped
+
+
+def cached_grammar_digest(tree_sitter_cpp_path: str, out_path: str) -> str:
+    """
+    Get the grammar digest, reusing the digest stored next to `out_path` if
+    the grammar sources have not been touched since it was computed.
+
+    Args:
+        tree_sitter_cpp_path: Where to look for the tree sitter C++ repo, or
+            `PREBUILT_GRAMMAR`
+        out_path: Base path for the built language
+
+    Returns:
+        Hex digest identifying the grammar revision
+    """
+    if tree_sitter_cpp_path == PREBUILT_GRAMMAR:
+        return _prebuilt_grammar_digest()
+    stamp_path = f"{out_path}.stamp"
+    fingerprint = _grammar_fingerprint(tree_sitter_cpp_path)
+    try:
+        with open(stamp_path, encoding="utf8") as f:
+            stamp_fingerprint, digest = f.read().split("\n")[:2]
+        if stamp_fingerprint == fingerprint:
+            return digest
+    except (OSError, ValueError):
+        pass
+
+    digest = grammar_digest(tree_sitter_cpp_path)
+    _atomic_write(stamp_path, f"{fingerprint}\n{digest}\n".encode())
+    return digest
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive advisory lock on `path` for the duration of the context.
+
+    Args:
+        path: Lock file to create and lock
+    """
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def cpp_language_path(tree_sitter_cpp_path: str, out_path: str) -> str:
+    """
+    Get the content-addressed path of the built C++ language library.
+
+    Args:
+        tree_sitter_cpp_path: Where to look for the tree sitter C++ repo
+        out_path: Base path for the built language. The grammar digest is
+            appended to it.
+
+    Returns:
+        Path of the built language for the current grammar sources
+    """
+    digest = cached_grammar_digest(tree_sitter_cpp_path, out_path)
+    return f"{out_path}-{digest[:16]}.so"
+
+
+def ensure_cpp_language(tree_sitter_cpp_path: str, out_path: str) -> str:
+    """
+    Build the C++ tree-sitter language library unless an up-to-date build is
+    already cached.
+
+    Concurrent callers are serialized with a file lock, and the library is
+    moved into place with an atomic rename, so readers never observe a
+    partially written file.
+
+    Args:
+        tree_sitter_cpp_path: Where to look for the tree sitter C++ repo. For
+            `PREBUILT_GRAMMAR`, nothing is built.
+        out_path: Base path for the built language
+
+    Returns:
+        Path of the built language library, or `PREBUILT_GRAMMAR`
+    """
+    if tree_sitter_cpp_path == PREBUILT_GRAMMAR:
+        return PREBUILT_GRAMMAR
+    lib_path = cpp_language_path(tree_sitter_cpp_path, out_path)
+    if os.path.exists(lib_path):
+        return lib_path
+
+    with _file_lock(f"{lib_path}.lock"):
+        # Someone else may have built it while we waited for the lock
+        if os.path.exists(lib_path):
+            return lib_path
+        tmp_path = f"{lib_path}.{os.getpid()}.tmp"
+        try:
+            from tree_sitter import Language
+
+            Language.build_library(tmp_path, [tree_sitter_cpp_path])
+            os.replace(tmp_path, lib_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    return lib_path
+
+
+def load_cpp_language(lib_path: str) -> "Language":
+    """
+    Load an already built C++ tree-sitter language library without checking
+    the grammar sources.
+
+    Args:
+        lib_path: Path of the built language, see `ensure_cpp_language`, or
+            `PREBUILT_GRAMMAR`
+
+    Returns:
+        The loaded language
+    """
+    from tree_sitter import Language
+
+    if lib_path == PREBUILT_GRAMMAR:
+        import tree_sitter_cpp
+
+        # The binding also takes the pointer to a loaded language
+        return Language(tree_sitter_cpp.language(), "cpp")  # type: ignore[arg-type]
+    return Language(lib_path, "cpp")
+
+
+def build_cpp_language(tree_sitter_cpp_path: str, out_path: str) -> "Language":
     """
     Build the C++ tree-sitter language.
 
     Args:
         tree_sitter_cpp_path: Where to look for the tree sitter C++ repo
-        out_path: Where to place the built langauge
+        out_path: Base path for the built langauge
 
     Returns:
         The built language
     """
-    Language.build_library(out_path, [tree_sitter_cpp_path])
-    return Language(out_path, "cpp")
+    return load_cpp_language(ensure_cpp_language(tree_sitter_cpp_path, out_path))
 
 
-def build_cpp_parser(tree_sitter_cpp_path: str, out_path: str) -> Tuple[Parser, Language]:
+def build_cpp_parser(tree_sitter_cpp_path: str, out_path: str) -> Tuple["Parser", "Language"]:
     """
     Build the C++ tree -itter parser.
 
     Args:
         tree_sitter_cpp_path: Where to look for the tree-sitter C++ repo
-        out_path: Where to place the built langauge
+        out_path: Base path for the built langauge
 
     Returns:
         A C++ tree-sitter parser
     """
+    from tree_sitter import Parser
+
     language = build_cpp_language(tree_sitter_cpp_path, out_path)
     parser = Parser()
     parser.set_language(language)
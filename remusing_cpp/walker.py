@@ -0,0 +1,311 @@
+"""
+This module contains a single-pass, scope-aware alternative to the tree-sitter
+query engine of `remusing_cpp.core.RemUsing`.
+
+`TreeWalker` visits every node of the syntax tree once with a `TreeCursor`
+and records the same captures as the combined tree-sitter query, under the
+same capture names, so that the rest of the pipeline does not depend on the
+engine. While walking, it keeps a stack of scopes (namespaces, classes,
+functions, blocks) with the names declared in them. Unqualified names that
+refer to a declaration in an enclosing scope, e.g. a parameter called `hex`
+or a project class called `string`, are not captured and therefore not
+qualified.
+
+The scope tracking is a single forward pass: a name is only known after its
+declaration, and class members are only known inside the class after they
+are declared.
+"""
+from typing import Dict, List, Optional, Set
+
+from tree_sitter import Node, Tree
+
+from remusing_cpp.captures import CaptureStore
+from remusing_cpp.edits import SourceBytes
+from remusing_cpp.queries import SymbolQuery, TypeQuery, UsingQuery
+
+# Nodes that open a scope for the declarations within them
+_SCOPES = frozenset(
+    [
+        "namespace_definition",
+        "field_declaration_list",
+        "function_definition",
+        "lambda_expression",
+        "compound_statement",
+        "for_statement",
+        "for_range_loop",
+        "catch_clause",
+    ]
+)
+
+# Nodes whose `declarator` fields declare names in the current scope
+_DECLARATIONS = frozenset(["declaration", "field_declaration", "type_definition"])
+
+_PARAMETERS = frozenset(
+    [
+        "parameter_declaration",
+        "optional_parameter_declaration",
+        "variadic_parameter_declaration",
+    ]
+)
+
+# Nodes whose parameters are visible in their body
+_PARAMETER_OWNERS = frozenset(["function_definition", "lambda_expression", "catch_clause"])
+
+_TYPE_SPECIFIERS = frozenset(
+    ["class_specifier", "struct_specifier", "union_specifier", "enum_specifier"]
+)
+
+_NAMES = frozenset(["identifier", "field_identifier", "type_identifier"])
+
+# Nodes without any names in them, whose children are not visited
+_OPAQUE = frozenset(
+    ["string_literal", "raw_string_literal", "char_literal", "number_literal", "comment"]
+)
+
+# All nodes that `TreeWalker._visit` handles, other nodes are only traversed
+_VISITED = _SCOPES.union(
+    _DECLARATIONS,
+    _PARAMETERS,
+    _TYPE_SPECIFIERS,
+    [
+        "type_identifier",
+        "qualified_identifier",
+        "binary_expression",
+        "call_expression",
+        "using_declaration",
+        "alias_declaration",
+    ],
+)
+
+
+def _declarator_name(node: Optional[Node]) -> Optional[Node]:
+    """
+    Find the declared name in a declarator, e.g. `p` in `*p[3]`.
+
+    Returns:
+        The name node, or `None` for unnamed and qualified declarators
+    """
+    while node is not None:
+        if node.type in _NAMES:
+            return node
+        inner = node.child_by_field_name("declarator")
+        if inner is None and node.type == "reference_declarator" and node.named_child_count:
+            # References wrap their declarator without a field name
+            inner = node.named_children[-1]
+        node = inner
+    return None
+
+
+def _owns_parameters(parameter: Node) -> bool:
+    """
+    Check whether a parameter is visible in a body, as opposed to a parameter
+    of a function declaration or a template.
+    """
+    owner = parameter.parent.parent if parameter.parent is not None else None
+    while owner is not None and owner.type.endswith("declarator"):
+        owner = owner.parent
+    return owner is not None and owner.type in _PARAMETER_OWNERS
+
+
+class TreeWalker:
+    """
+    Collects the captures of the `RemUsing` queries in a single traversal of
+    the syntax tree, skipping locally shadowed names.
+    """
+
+    def __init__(self, types_query: TypeQuery, symbols_query: SymbolQuery, using_query: UsingQuery):
+        """
+        Initialize the walker with the capture names of the query builders.
+
+        Arguments:
+            types_query: Capture names for types
+            symbols_query: Capture names for symbols
+            using_query: Capture names for `using` declarations
+        """
+        self.types_query = types_query
+        self.symbols_query = symbols_query
+        self.using_query = using_query
+        self.shadowing = True
+        """
+        Skip names that are declared in an enclosing scope. Without it, the
+        captures are the same as those of the tree-sitter query.
+        """
+        self._src: SourceBytes = b""
+        self._store = CaptureStore()
+        self._ids: Dict[str, int] = {}
+        self._scopes: List[Set[bytes]] = []
+
+    def walk(self, tree: Tree, src: SourceBytes) -> CaptureStore:
+        """
+        Collect the captures of a syntax tree.
+
+        Arguments:
+            tree: The parsed source code
+            src: The source code that `tree` was parsed from
+
+        Returns:
+            The captures, named like those of the tree-sitter query
+        """
+        store = CaptureStore()
+        self._src = src
+        self._store = store
+        self._ids = {}
+        self._scopes = [set()]
+        scope_depths: List[int] = [-1]
+
+        visit = self._visit
+        cursor = tree.walk()
+        depth = 0
+        while True:
+            node = cursor.node
+            node_type = node.type
+            if node_type in _VISITED:
+                if node_type in _SCOPES:
+                    if node_type == "function_definition":
+                        # The function name belongs to the enclosing scope
+                        self._declare(_declarator_name(node.child_by_field_name("declarator")))
+                    self._scopes.append(set())
+                    scope_depths.append(depth)
+                visit(node, node_type)
+
+            if node_type not in _OPAQUE and cursor.goto_first_child():
+                depth += 1
+                continue
+            while True:
+                # Leave the current node and the scopes it opened
+                while scope_depths[-1] >= depth:
+                    scope_depths.pop()
+                    self._scopes.pop()
+                if cursor.goto_next_sibling():
+                    break
+                if not cursor.goto_parent():
+                    return store
+                depth -= 1
+
+    def _declare(self, name: Optional[Node]) -> None:
+        """
+        Add a declared name to the innermost scope.
+        """
+        if name is not None and self.shadowing:
+            self._scopes[-1].add(self._src[name.start_byte : name.end_byte])
+
+    def _shadowed(self, node: Node) -> bool:
+        """
+        Check whether a name refers to a declaration in an enclosing scope.
+        """
+        if not self.shadowing:
+            return False
+        text = self._src[node.start_byte : node.end_byte]
+        return any(text in scope for scope in self._scopes)
+
+    def _add(self, node: Node, name: str) -> None:
+        """
+        Record a capture.
+        """
+        store = self._store
+        capture_id = self._ids.get(name)
+        if capture_id is None:
+            capture_id = self._ids[name] = store.capture_id(name)
+        # The store is new and its spans are not computed yet, so the columns
+        # can be appended to directly
+        store.start_bytes.append(node.start_byte)
+        store.end_bytes.append(node.end_byte)
+        store.capture_ids.append(capture_id)
+
+    def _visit(self, node: Node, node_type: str) -> None:
+        """
+        Record the declarations and captures of a single node.
+        """
+        types, symbols, using = self.types_query, self.symbols_query, self.using_query
+        if node_type == "type_identifier":
+            if not self._shadowed(node):
+                self._add(node, types.TYPE_ALL_CAPTURE)
+        elif node_type == "qualified_identifier":
+            self._visit_qualified(node)
+        elif node_type == "binary_expression":
+            self._visit_binary(node)
+        elif node_type == "call_expression":
+            function = node.child_by_field_name("function")
+            if function is not None and function.type == "template_function":
+                function = function.child_by_field_name("name")
+            if (
+                function is not None
+                and function.type == "identifier"
+                and not self._shadowed(function)
+            ):
+                self._add(function, symbols.SYMBOL_FUNC_CAPTURE)
+        elif node_type == "using_declaration":
+            for child in node.named_children:
+                if child.type == "qualified_identifier":
+                    self._add(child, using.USING_QUAL_TYPE_CAPTURE)
+                    self._add(node, using.USING_DECL_CAPTURE)
+                elif child.type == "identifier":
+                    self._add(child, using.USING_IDENT_CAPTURE)
+                    self._add(node, using.USING_NS_DECL_CAPTURE)
+        elif node_type in _DECLARATIONS:
+            for declarator in node.children_by_field_name("declarator"):
+                self._declare(_declarator_name(declarator))
+        elif node_type in _PARAMETERS:
+            if _owns_parameters(node):
+                self._declare(_declarator_name(node.child_by_field_name("declarator")))
+        elif node_type == "for_range_loop":
+            self._declare(_declarator_name(node.child_by_field_name("declarator")))
+        elif node_type in _TYPE_SPECIFIERS:
+            if node.child_by_field_name("body") is not None:
+                self._declare(node.child_by_field_name("name"))
+        elif node_type == "alias_declaration":
+            self._declare(node.child_by_field_name("name"))
+
+    def _visit_qualified(self, node: Node) -> None:
+        """
+        Record the captures of the qualified type patterns.
+        """
+        scope = node.child_by_field_name("scope")
+        name = node.child_by_field_name("name")
+        if scope is None or scope.type != "namespace_identifier" or name is None:
+            return
+        types = self.types_query
+        if name.type == "type_identifier":
+            self._add(scope, types.TYPE_SCOPE_CAPTURE)
+            self._add(name, types.TYPE_QUAL_CAPTURE)
+        elif name.type == "template_type":
+            template_name = name.child_by_field_name("name")
+            if template_name is not None and template_name.type == "type_identifier":
+                self._add(scope, types.TYPE_SCOPE_TEMPLATE_CAPTURE)
+                self._add(template_name, types.TYPE_QUAL_TEMPLATE_CAPTURE)
+        elif name.type == "qualified_identifier":
+            inner_scope = name.child_by_field_name("scope")
+            inner_name = name.child_by_field_name("name")
+            if (
+                inner_scope is None
+                or inner_scope.type != "template_type"
+                or inner_name is None
+                or inner_name.type != "type_identifier"
+            ):
+                return
+            template_name = inner_scope.child_by_field_name("name")
+            if template_name is not None and template_name.type == "type_identifier":
+                self._add(scope, types.TYPE_SCOPE_TEMPLATE_CAPTURE)
+                self._add(template_name, types.TYPE_QUAL_TEMPLATE_CAPTURE)
+                self._add(inner_name, types.TYPE_QUAL_TEMPLATE_CAPTURE)
+
+    def _visit_binary(self, node: Node) -> None:
+        """
+        Record the captures of the stream operator patterns.
+        """
+        src = self._src
+        start, end = node.start_byte, node.end_byte
+        has_shift_left = src.find(b"<<", start, end) != -1
+        symbols = self.symbols_query
+        if has_shift_left:
+            right = node.child_by_field_name("right")
+            if right is not None and right.type == "identifier":
+                self._add(node, symbols._SYMBOL_STREAM_CAPTURE)
+                if not self._shadowed(right):
+                    self._add(right, symbols.SYMBOL_CAPTURE)
+        if has_shift_left or src.find(b">>", start, end) != -1:
+            left = node.child_by_field_name("left")
+            if left is not None and left.type == "identifier":
+                self._add(node, symbols._SYMBOL_STREAM_CAPTURE)
+                if not self._shadowed(left):
+                    self._add(left, symbols.SYMBOL_CAPTURE)
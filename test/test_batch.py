@@ -0,0 +1,173 @@
+import io
+import os
+
+from remusing_cpp import batch
+from remusing_cpp.batch import (
+    BatchReport,
+    ScanReport,
+    expand_paths,
+    iter_batch,
+    iter_batch_blobs,
+    iter_scan,
+    run_batch,
+)
+from remusing_cpp.report import Category
+
+SRC = b"""using namespace std;
+string s;
+"""
+FIXED = b"""std::string s;
+"""
+
+
+def _write_tree(root) -> None:
+    (root / "sub").mkdir()
+    (root / "a.hh").write_bytes(SRC)
+    (root / "sub" / "b.cpp").write_bytes(SRC)
+    (root / "sub" / "c.cpp").write_bytes(FIXED)
+    (root / "notes.txt").write_bytes(SRC)
+
+
+def test_expand_paths(tmp_path):
+    _write_tree(tmp_path)
+    expected = [
+        os.path.join(tmp_path, "a.hh"),
+        os.path.join(tmp_path, "sub", "b.cpp"),
+        os.path.join(tmp_path, "sub", "c.cpp"),
+    ]
+    assert expand_paths([str(tmp_path)]) == expected
+    assert expand_paths([os.path.join(tmp_path, "**", "*.cpp")]) == expected[1:]
+    # Explicit files are kept regardless of extension
+    notes = os.path.join(tmp_path, "notes.txt")
+    assert expand_paths([notes, notes]) == [notes]
+
+
+def test_run_batch(tmp_path, language_out, cpp_tree_sitter_repo):
+    _write_tree(tmp_path)
+    paths = expand_paths([str(tmp_path)]) + [os.path.join(tmp_path, "missing.hh")]
+    for jobs, backend in ((1, "process"), (2, "process"), (2, "thread")):
+        results = run_batch(paths, cpp_tree_sitter_repo, language_out, jobs=jobs, backend=backend)
+        assert [r.path for r in results] == paths
+        assert [r.changed for r in results] == [jobs == 1, jobs == 1, False, False]
+        assert [r.error is None for r in results] == [True, True, True, False]
+        assert (tmp_path / "a.hh").read_bytes() == FIXED
+        assert (tmp_path / "sub" / "b.cpp").read_bytes() == FIXED
+
+
+def test_iter_batch(tmp_path, language_out, cpp_tree_sitter_repo):
+    _write_tree(tmp_path)
+    paths = expand_paths([str(tmp_path)]) + [os.path.join(tmp_path, "missing.hh")]
+    results = list(iter_batch(paths, cpp_tree_sitter_repo, language_out, jobs=2, ordered=False))
+    assert sorted(r.path for r in results) == sorted(paths)
+    report = BatchReport()
+    for result in results:
+        report.add(result)
+    assert (report.files, report.changed, report.unchanged) == (4, 2, 1)
+    assert [path for path, _ in report.failures] == [paths[-1]]
+    assert report.as_json()["failures"][0]["path"] == paths[-1]
+    assert "stats" not in report.as_json()
+
+    report = BatchReport()
+    for result in iter_batch(paths[:-1], cpp_tree_sitter_repo, language_out, collect_stats=True):
+        report.add(result)
+    assert report.as_json()["stats"]["files"] == 3
+
+
+def test_run_batch_threads(tmp_path, language_out, cpp_tree_sitter_repo):
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"{i}.cpp"
+        path.write_bytes(SRC + f"vector<int> v{i};\n".encode())
+        paths.append(str(path))
+    results = run_batch(paths, cpp_tree_sitter_repo, language_out, jobs=4, backend="thread")
+    assert [r.path for r in results] == paths
+    assert all(r.changed for r in results)
+    for i in range(20):
+        assert (tmp_path / f"{i}.cpp").read_bytes() == FIXED + f"std::vector<int> v{i};\n".encode()
+
+
+def test_iter_batch_blobs(tmp_path, language_out, cpp_tree_sitter_repo, monkeypatch):
+    blobs = [("a.hh", SRC), ("b.hh", b"int i;\n"), ("c.hh", b"// using\nint i;\n")]
+    cache_dir = str(tmp_path / "cache")
+    for cached in (False, True):
+        results = list(
+            iter_batch_blobs(
+                blobs, cpp_tree_sitter_repo, language_out, cache_dir=cache_dir, collect_stats=True
+            )
+        )
+        assert [(r.path, r.changed, r.skipped, r.cached) for r in results] == [
+            ("a.hh", True, False, cached),
+            ("b.hh", False, True, False),
+            ("c.hh", False, False, cached),
+        ]
+        assert results[0].fixed == FIXED and results[0].stats is not None
+    # The files themselves are not read or written
+    assert not os.path.exists("a.hh")
+
+    def fail(src, *args):
+        raise UnicodeDecodeError("utf-8", b"\xe9", 0, 1, "invalid continuation byte")
+
+    monkeypatch.setattr(batch, "source_edits", fail)
+    result = next(iter_batch_blobs(blobs, cpp_tree_sitter_repo, language_out))
+    assert result.error.startswith("'utf-8' codec can't decode")
+
+    def crash(blob):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(batch, "_fix_blob", crash)
+    result = next(iter_batch_blobs(blobs, cpp_tree_sitter_repo, language_out))
+    assert (result.path, result.error) == ("a.hh", "RuntimeError: crash")
+
+
+def test_iter_scan(tmp_path, language_out, cpp_tree_sitter_repo):
+    _write_tree(tmp_path)
+    paths = expand_paths([str(tmp_path)]) + [os.path.join(tmp_path, "missing.hh")]
+    for jobs, backend in ((1, "process"), (2, "process"), (2, "thread")):
+        report = ScanReport()
+        for result in iter_scan(
+            paths, cpp_tree_sitter_repo, language_out, True, jobs=jobs, backend=backend
+        ):
+            report.add(result)
+        # Nothing is fixed
+        assert (tmp_path / "a.hh").read_bytes() == SRC
+        assert (report.files, len(report.failures)) == (4, 1)
+        assert [path for path, _ in report.sources] == paths[:2]
+        assert report.as_json()["counts"] == {
+            "using_namespace": 2,
+            "using_declaration": 0,
+            "unqualified": 2,
+        }
+
+    stream = io.StringIO()
+    report.write_csv(stream)
+    assert stream.getvalue().splitlines() == [
+        "path,using_namespace,using_declaration,unqualified",
+        f"{paths[0]},1,0,1",
+        f"{paths[1]},1,0,1",
+    ]
+    stream = io.StringIO()
+    report.write_csv(stream, locations=True)
+    assert stream.getvalue().splitlines()[:3] == [
+        "path,category,line,column,namespace,text",
+        f"{paths[0]},using_namespace,1,1,std,using namespace std;",
+        f"{paths[0]},unqualified,2,1,std,string",
+    ]
+
+
+def test_iter_scan_index(tmp_path, language_out, cpp_tree_sitter_repo):
+    (tmp_path / "a.hh").write_bytes(b"using Base<string>::f;\nWidget w;\n")
+    results = list(
+        iter_scan(
+            [str(tmp_path / "a.hh")],
+            cpp_tree_sitter_repo,
+            language_out,
+            index_namespace_map={"Widget": "ui"},
+        )
+    )
+    # The names in the `using` declaration are removed with it
+    report = results[0].report
+    assert (report.counts[Category.USING_DECLARATION], report.counts[Category.UNQUALIFIED]) == (
+        1,
+        1,
+    )
+    assert report.namespaces == {"ui": 1}
@@ -0,0 +1,121 @@
+import io
+import json
+import sys
+from contextlib import redirect_stdout
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp._cli import main
+from remusing_cpp.bench import (
+    STAGES,
+    STARTUP_MODULE,
+    generate_corpus,
+    generate_source,
+    peak_rss,
+    run_bench,
+    time_startup,
+)
+from remusing_cpp.core import RemUsing
+
+
+def test_generate_source(language: Language, parser: Parser) -> None:
+    src = generate_source(4096, density=1.0, seed=3)
+    assert src == generate_source(4096, density=1.0, seed=3)
+    assert src != generate_source(4096, density=1.0, seed=4)
+    assert 4096 <= len(src) < 8192
+    assert b"using namespace std;" in src
+    assert b"<vector<" in src or b"<map<" in src
+
+    fixed = RemUsing(src, parser, language).fix()
+    assert b"using namespace std;" not in fixed
+    assert not parser.parse(fixed).root_node.has_error
+
+    src = generate_source(4096, density=0.0)
+    assert RemUsing(src, parser, language).edits() == []
+
+
+def test_generate_corpus() -> None:
+    corpus = generate_corpus(3, 1024, seed=10)
+    assert sorted(corpus) == ["gen_00000.cpp", "gen_00001.cpp", "gen_00002.cpp"]
+    assert corpus["gen_00001.cpp"] == generate_source(1024, seed=11)
+
+
+def test_run_bench(language: Language, parser: Parser) -> None:
+    sources = list(generate_corpus(2, 2048).values())
+    result = run_bench(sources, parser, language, repeat=2)
+    assert (result.files, result.bytes) == (2, sum(map(len, sources)))
+    assert result.edits > 0
+    assert list(result.stage_seconds) == list(STAGES)
+    assert all(seconds > 0 for seconds in result.stage_seconds.values())
+    assert result.files_per_second > 0 and result.mb_per_second > 0
+    assert result.peak_rss > 0
+
+
+def test_peak_rss(monkeypatch) -> None:
+    assert peak_rss() > 0
+    # Platforms without the `resource` module report nothing
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert peak_rss() == 0
+
+
+def test_cli_bench(tmp_path) -> None:
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["bench", "--files", "2", "--size-kb", "1", "--repeat", "1", "--json"])
+    assert ret == 0
+    report = json.loads(f.getvalue())
+    assert report["files"] == 2
+    assert set(report["stage_seconds"]) == set(STAGES)
+
+    (tmp_path / "a.hh").write_bytes(b"using namespace std;\nstring s;\n")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["bench", "--repeat", "1", str(tmp_path)])
+    assert ret == 0
+    assert "1 file(s)" in f.getvalue()
+    assert "files/s" in f.getvalue()
+
+
+def test_cli_bench_scaling() -> None:
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["bench", "--files", "4", "--size-kb", "1", "--scaling", "1,2", "--json"])
+    assert ret == 0
+    rows = json.loads(f.getvalue())
+    assert [(row["backend"], row["jobs"]) for row in rows] == [
+        ("process", 1),
+        ("process", 2),
+        ("thread", 1),
+        ("thread", 2),
+    ]
+    assert all(row["seconds"] > 0 for row in rows)
+
+    f = io.StringIO()
+    with redirect_stdout(f):
+        main(["bench", "--files", "2", "--size-kb", "1", "--scaling", "2", "--backend", "thread"])
+    lines = f.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[1].split()[:2] == ["thread", "2"]
+    assert lines[1].endswith("1.00x")
+
+
+def test_time_startup() -> None:
+    times = time_startup(repeat=1)
+    assert times[STARTUP_MODULE][1] >= times[STARTUP_MODULE][0] > 0
+    # The CLI only imports tree-sitter once a command needs it
+    assert "tree_sitter" not in times
+    assert "remusing_cpp.core" not in times
+    assert "concurrent.futures" not in times
+
+
+def test_cli_bench_startup() -> None:
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["bench", "--startup", "--repeat", "1", "--json"])
+    assert ret == 0
+    assert STARTUP_MODULE in json.loads(f.getvalue())
+
+    f = io.StringIO()
+    with redirect_stdout(f):
+        main(["bench", "--startup", "--repeat", "1"])
+    assert f.getvalue().startswith(f"import {STARTUP_MODULE}: ")
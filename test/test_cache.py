@@ -0,0 +1,114 @@
+import os
+import pickle
+from typing import List
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp.batch import FileResult, fix_file, run_batch
+from remusing_cpp.cache import ResultCache, config_digest
+from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import Edit, EditReason
+
+
+def test_config_digest(language: Language, parser: Parser) -> None:
+    remusing = RemUsing(b"", parser, language)
+    digest = config_digest(remusing, "grammar")
+    assert config_digest(RemUsing(b"other", parser, language), "grammar") == digest
+    assert config_digest(remusing, "other grammar") != digest
+
+    remusing.hardcoded_namespace_map = {"string": "mystd"}
+    assert config_digest(remusing, "grammar") != digest
+    remusing = RemUsing(b"", parser, language)
+    remusing.index_namespace_map = {"Widget": "ui"}
+    assert config_digest(remusing, "grammar") != digest
+    remusing = RemUsing(b"", parser, language)
+    remusing.types_query.TYPE_ALL_CAPTURE = "all_types"
+    assert config_digest(remusing, "grammar") != digest
+
+
+def test_result_cache(tmp_path) -> None:
+    cache = ResultCache(str(tmp_path), "config", max_bytes=0)
+    key = cache.key(b"string s;")
+    assert key != ResultCache(str(tmp_path), "other").key(b"string s;")
+    assert cache.get(key) is None
+
+    edits = [Edit(0, 0, b"std::")]
+    cache.put(key, edits)
+    assert cache.get(key) == edits
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+    edits = [Edit(0, 4, b"", EditReason.USING_REMOVAL), Edit(9, 9, b"caf\xe9::")]
+    cache.put(key, edits)
+    assert cache.get(key) == edits
+
+    # Corrupt entries are misses and are removed
+    for junk in (b"junk", b"{}", b'[[0, "1", "", null]]', b'[[0, 1, "", "other"]]', b"[[0]]"):
+        with open(cache._path(key), "wb") as f:
+            f.write(junk)
+        assert cache.get(key) is None
+        assert not os.path.exists(cache._path(key))
+    # Entries are data, never code
+    with open(cache._path(key), "wb") as f:
+        pickle.dump(edits, f)
+    assert cache.get(key) is None
+
+
+def test_result_cache_prune(tmp_path) -> None:
+    cache = ResultCache(str(tmp_path), "config")
+    keys = [cache.key(bytes([i])) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, [Edit(i, i, b"x" * 100)])
+        os.utime(cache._path(key), ns=(i, i))
+    # Using an entry makes it the most recent one
+    assert cache.get(keys[0]) is not None
+    size = os.path.getsize(cache._path(keys[0]))
+
+    cache.max_bytes = 2 * size
+    # Files next to the shards are not entries
+    (tmp_path / "README").write_bytes(b"x" * size)
+    assert cache.prune() == 1
+    assert [cache.get(key) is not None for key in keys] == [True, False, True]
+
+
+def test_fix_file_cached(tmp_path, language: Language, parser: Parser) -> None:
+    path = tmp_path / "a.hh"
+    path.write_bytes(b"using namespace std;\nstring s;\n")
+    cache = ResultCache(str(tmp_path / "cache"), "config")
+    result = fix_file(str(path), parser, language, cache=cache)
+    assert (result.changed, result.cached) == (True, False)
+
+    path.write_bytes(b"using namespace std;\nstring s;\n")
+    result = fix_file(str(path), parser, language, cache=cache)
+    assert (result.changed, result.cached) == (True, True)
+    assert path.read_bytes() == b"std::string s;\n"
+
+
+def test_run_batch_cached(tmp_path, cpp_tree_sitter_repo: str, language_out: str) -> None:
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.hh"
+        path.write_bytes(b"using namespace std;\nstring s%d;\n" % i if i else b"int i;\n")
+        paths.append(str(path))
+    cache_dir = str(tmp_path / "cache")
+
+    def run() -> List[FileResult]:
+        # Without the prefilter, so that the unchanged file goes through the cache
+        return run_batch(
+            paths, cpp_tree_sitter_repo, language_out, 2, cache_dir=cache_dir, prefilter=False
+        )
+
+    results = run()
+    assert [(r.changed, r.cached) for r in results] == [
+        (False, False),
+        (True, False),
+        (True, False),
+    ]
+    # The fixed files are new contents, the unchanged one is a hit
+    results = run()
+    assert [(r.changed, r.cached) for r in results] == [
+        (False, True),
+        (False, False),
+        (False, False),
+    ]
+    results = run()
+    assert [(r.changed, r.cached) for r in results] == [(False, True), (False, True), (False, True)]
@@ -0,0 +1,164 @@
+import random
+from array import array
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp.captures import (
+    CaptureStore,
+    SpanColumn,
+    difference,
+    iter_spans,
+    pack_span,
+    touching,
+    union,
+    unpack_span,
+)
+
+
+def spans(*ranges):
+    return array("Q", [pack_span(start, end) for start, end in ranges])
+
+
+def test_pack_span() -> None:
+    assert unpack_span(pack_span(3, 7)) == (3, 7)
+    assert pack_span(1, 100) < pack_span(2, 3) < pack_span(2, 4)
+    assert list(iter_spans(spans((0, 1), (5, 9)))) == [(0, 1), (5, 9)]
+
+
+def test_union() -> None:
+    assert union() == array("Q")
+    assert union(spans((0, 1), (4, 5)), spans(), spans((0, 1), (2, 3), (6, 7))) == spans(
+        (0, 1), (2, 3), (4, 5), (6, 7)
+    )
+
+
+def test_difference() -> None:
+    a = spans((0, 1), (2, 3), (4, 5))
+    assert difference(a, spans()) == a
+    assert difference(a, spans((2, 3), (4, 6), (8, 9))) == spans((0, 1), (4, 5))
+
+
+def test_touching() -> None:
+    a = spans((0, 4), (2, 3), (5, 9), (10, 11))
+    assert touching(a, 0, 1) == spans((0, 4))
+    assert touching(a, 4, 5) == spans((0, 4), (5, 9))
+    assert touching(a, 9, 20) == spans((5, 9), (10, 11))
+    assert touching(a, 12, 20) == spans()
+
+
+def test_span_column() -> None:
+    column = SpanColumn(spans((0, 3), (4, 7), (8, 11), (12, 15)), ["a", "b", "c", "d"])
+    assert column.max_length() == 3
+    # Replace "b" with 3 more bytes, then the text before it grows too
+    column.edit(4, 7, 10)
+    column.edit(0, 0, 2)
+    assert column.starting_in(10, 13) == (spans((13, 16)), ["c"])
+    assert list(iter_spans(column.spans())) == [(2, 5), (13, 16), (17, 20)]
+    assert column.values() == ["a", "c", "d"]
+
+    # Spans that reach into a change are kept until they are removed
+    column.edit(4, 12, 4)
+    assert list(iter_spans(column.spans())) == [(2, 5), (5, 8), (9, 12)]
+    assert column.remove(4, 4) == (spans((2, 5)), ["a"])
+    column.insert(spans((0, 10), (7, 10)), ["e", "f"])
+    assert list(iter_spans(column.spans())) == [(0, 10), (5, 8), (7, 10), (9, 12)]
+    assert column.values() == ["e", "c", "f", "d"]
+    assert column.max_length() == 10
+
+    plain = SpanColumn(spans((0, 1), (5, 6)))
+    plain.insert(spans())
+    plain.insert(spans((2, 3), (5, 6)))
+    assert plain.spans() == spans((0, 1), (2, 3), (5, 6))
+    assert plain.starting_in(1, 2) == (spans((2, 3)), [])
+    assert len(plain) == 3
+
+
+def test_span_column_random() -> None:
+    rng = random.Random(0)
+    expected = sorted({(start, start + rng.randrange(5)) for start in range(0, 1000, 3)})
+    column = SpanColumn(spans(*expected))
+    for _ in range(200):
+        start = rng.randrange(1000)
+        old_end = start + rng.randrange(10)
+        new_end = start + rng.randrange(30)
+        delta = new_end - old_end
+        column.edit(start, old_end, new_end)
+        expected = [
+            (s + delta, e + delta) if s >= old_end else (s, e)
+            for s, e in expected
+            if not start <= s < old_end
+        ]
+        # Replace the spans around the edit, as `CaptureStore.edit` does
+        lo, hi = max(0, start - 2), new_end + 2
+        removed = [(s, e) for s, e in expected if e >= lo and s <= hi]
+        assert list(iter_spans(column.remove(lo, hi)[0])) == removed
+        added = sorted({(s, s + rng.randrange(5)) for s in range(lo, hi, 4)})
+        column.insert(spans(*added))
+        expected = sorted({*(span for span in expected if span not in removed), *added})
+
+        first = rng.randrange(1000)
+        window = [(s, e) for s, e in expected if first <= s <= first + 50]
+        assert list(iter_spans(column.starting_in(first, first + 50)[0])) == window
+        if rng.random() < 0.1:
+            assert list(iter_spans(column.spans())) == expected
+    assert list(iter_spans(column.spans())) == expected
+
+
+def test_capture_store(language: Language, parser: Parser) -> None:
+    src = b"string s; vector<string> v;"
+    tree = parser.parse(src)
+    query = language.query("(type_identifier) @type (declaration) @decl")
+
+    store = CaptureStore()
+    store.extend(query.captures(tree.root_node))
+    store.append(0, 6, "type")
+    assert len(store) == 6
+    assert sorted(store.names) == ["decl", "type"]
+    assert [src[s:e] for s, e in iter_spans(store.spans("type"))] == [
+        b"string",
+        b"vector",
+        b"string",
+    ]
+    assert list(iter_spans(store.spans("decl"))) == [(0, 9), (10, 27)]
+    assert store.spans("missing") == array("Q")
+
+
+def test_capture_store_edit(language: Language, parser: Parser) -> None:
+    src = b"string s; vector<string> v;"
+    tree = parser.parse(src)
+    query = language.query("(type_identifier) @type (declaration) @decl")
+    store = CaptureStore()
+    store.extend(query.captures(tree.root_node))
+
+    # Replace `string s;` with `map m;`
+    new_src = b"map m; vector<string> v;"
+    tree.edit(0, 9, 6, (0, 0), (0, 9), (0, 6))
+    new_tree = parser.parse(new_src, tree)
+    ranges = [(0, 6)]
+    added = store.edit(
+        0,
+        9,
+        6,
+        ranges,
+        query.captures(new_tree.root_node, start_byte=0, end_byte=7),  # type: ignore[call-arg]
+    )
+    assert list(iter_spans(added.spans("decl"))) == [(0, 6)]
+    assert [new_src[s:e] for s, e in iter_spans(store.spans("type"))] == [
+        b"map",
+        b"vector",
+        b"string",
+    ]
+    assert list(iter_spans(store.spans("decl"))) == [(0, 6), (7, 24)]
+    assert len(store) == 5
+    assert store.counts() == {"type": 3, "decl": 2}
+    assert sorted((start, end, store.names[i]) for start, end, i in store.rows()) == [
+        (0, 3, "type"),
+        (0, 6, "decl"),
+        (7, 13, "type"),
+        (7, 24, "decl"),
+        (14, 20, "type"),
+    ]
+
+    store.append(25, 26, "other")
+    assert store.spans("other") == spans((25, 26))
+    assert len(store) == 6
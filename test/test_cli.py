@@ -1,8 +1,11 @@
 import io
-from contextlib import redirect_stdout
+import json
+from contextlib import redirect_stderr, redirect_stdout
 from os.path import join as path_join
 from pathlib import Path
 
+import pytest
+
 from remusing_cpp._cli import main
 
 DATA_DIR = path_join(Path(__file__).resolve().parent, "data")
@@ -18,3 +21,169 @@ std::string s;
         main([test_file])
     out = f.getvalue()
     assert out == expected
+
+
+def test_cli_dash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    test_file = path_join(DATA_DIR, "test.cpp")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        assert main([test_file, "-"]) == 0
+    assert f.getvalue() == "#include <string>\nstd::string s;\n"
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("using namespace std;\nstring s;\n"))
+    assert main(["-", "out.hh"]) == 0
+    assert (tmp_path / "out.hh").read_bytes() == b"std::string s;\n"
+
+
+def test_cli_batch(tmp_path):
+    (tmp_path / "a.hh").write_bytes(b"using namespace std;\nstring s;\n")
+    (tmp_path / "b.hh").write_bytes(b"std::string s;\n")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["-i", "-j", "1", str(tmp_path)])
+    assert ret == 0
+    assert (tmp_path / "a.hh").read_bytes() == b"std::string s;\n"
+    lines = f.getvalue().splitlines()
+    assert lines[:-1] == [f"fixed: {tmp_path / 'a.hh'}", f"unchanged: {tmp_path / 'b.hh'}"]
+    assert lines[-1] == "2 file(s) processed: 1 fixed, 1 unchanged, 0 error(s)"
+
+
+def test_cli_single_file_in_place(tmp_path):
+    src = tmp_path / "a.hh"
+    src.write_bytes(b"using namespace std;\nstring s;\n")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        assert main(["-i", "-j", "1", str(src)]) == 0
+    # Silent like before batch mode, unless asked for
+    assert f.getvalue() == ""
+    assert src.read_bytes() == b"std::string s;\n"
+    with redirect_stdout(f):
+        assert main(["-i", "-v", "-j", "1", str(src)]) == 0
+    assert f.getvalue().splitlines()[0] == f"unchanged: {src}"
+
+
+def test_cli_in_place_symlink(tmp_path):
+    target = tmp_path / "real" / "a.hh"
+    target.parent.mkdir()
+    target.write_bytes(b"using namespace std;\nstring s;\n")
+    link = tmp_path / "link.hh"
+    link.symlink_to(target)
+    assert main(["-i", "-j", "1", str(link)]) == 0
+    # The target is rewritten and the link is kept
+    assert link.is_symlink()
+    assert target.read_bytes() == b"std::string s;\n"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["link.hh", "real"]
+
+
+def test_cli_jobs():
+    err = io.StringIO()
+    for jobs in ("0", "-2", "many"):
+        with redirect_stderr(err), pytest.raises(SystemExit):
+            main(["-i", "-j", jobs, "a.hh"])
+    assert "Must be at least 1: 0" in err.getvalue()
+    assert "Not a number: many" in err.getvalue()
+
+
+def test_cli_formats():
+    test_file = path_join(DATA_DIR, "test.cpp")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        main(["-f", "json", test_file])
+    assert [edit["reason"] for edit in json.loads(f.getvalue())] == [
+        "using_removal",
+        "hardcoded_qualification",
+    ]
+
+    f = io.StringIO()
+    with redirect_stdout(f):
+        main(["--format", "diff", test_file])
+    assert f.getvalue().splitlines()[2:] == [
+        "@@ -1,3 +1,2 @@",
+        " #include <string>",
+        "-using namespace std;",
+        "-string s;",
+        "+std::string s;",
+    ]
+
+
+def test_cli_outfile(tmp_path):
+    test_file = tmp_path / "test.cpp"
+    test_file.write_bytes(b"using namespace std;\nstring s;\n")
+    # The output may replace the memory-mapped input
+    assert main([str(test_file), str(test_file)]) == 0
+    assert test_file.read_bytes() == b"std::string s;\n"
+
+    # Sources that are not UTF-8 are diffed byte for byte
+    test_file.write_bytes(b"// caf\xe9\nusing namespace std;\nstring s;\n")
+    diff_file = tmp_path / "fix.diff"
+    assert main(["-f", "diff", str(test_file), str(diff_file)]) == 0
+    assert b"+// caf\xe9\n" not in diff_file.read_bytes()
+    assert b" // caf\xe9\n-using namespace std;\n" in diff_file.read_bytes()
+
+
+def test_cli_index(tmp_path):
+    header = b"namespace ui {\nclass Widget { Widget* next; };\n}\n"
+    header += b"template <typename Widget> class Box;\n"
+    (tmp_path / "widget.hh").write_bytes(header)
+    (tmp_path / "main.cc").write_bytes(b"using namespace ui;\nWidget w;\n")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["-i", "-j", "1", "--index", str(tmp_path / "index.db"), str(tmp_path)])
+    assert ret == 0
+    assert (tmp_path / "main.cc").read_bytes() == b"ui::Widget w;\n"
+    # The declarations themselves are left alone
+    assert (tmp_path / "widget.hh").read_bytes() == header
+
+
+def test_cli_batch_report(tmp_path):
+    (tmp_path / "a.hh").write_bytes(b"using namespace std;\nstring s;\n")
+    missing = str(tmp_path / "missing.hh")
+    report_path = tmp_path / "report.json"
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        ret = main(["-i", "-j", "1", "--report", str(report_path), str(tmp_path / "a.hh"), missing])
+    assert ret == 1
+    # Failures are not interleaved with the per-file output
+    assert out.getvalue().splitlines()[0] == f"fixed: {tmp_path / 'a.hh'}"
+    assert "error" not in out.getvalue().splitlines()[0]
+    assert err.getvalue().startswith(f"error: {missing}: ")
+    report = json.loads(report_path.read_text())
+    assert (report["files"], report["changed"]) == (2, 1)
+    assert [failure["path"] for failure in report["failures"]] == [missing]
+
+
+def test_cli_scan(tmp_path):
+    (tmp_path / "a.hh").write_bytes(b"using namespace std;\nstring s;\n")
+    (tmp_path / "b.cpp").write_bytes(b"int x;\n")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["scan", "-j", "1", str(tmp_path)])
+    assert ret == 0
+    report = json.loads(f.getvalue())
+    assert (report["files"], report["files_with_findings"]) == (2, 1)
+    assert report["namespaces"] == {"std": 1}
+    assert (tmp_path / "a.hh").read_bytes() == b"using namespace std;\nstring s;\n"
+
+    out = tmp_path / "report.csv"
+    assert main(["scan", "-f", "csv", "--locations", "-o", str(out), str(tmp_path)]) == 0
+    assert out.read_text().splitlines()[1:] == [
+        f"{tmp_path / 'a.hh'},using_namespace,1,1,std,using namespace std;",
+        f"{tmp_path / 'a.hh'},unqualified,2,1,std,string",
+    ]
+
+
+def test_cli_lines(tmp_path):
+    src = tmp_path / "a.hh"
+    src.write_bytes(b"using namespace std;\nstring s;\nstring t;\n")
+    out = tmp_path / "out.hh"
+    assert main(["--lines", "3", str(src), str(out)]) == 0
+    assert out.read_bytes() == b"using namespace std;\nstring s;\nstd::string t;\n"
+    assert main(["--lines", "1:2", "--lines", "3:3", str(src), str(out)]) == 0
+    assert out.read_bytes() == b"std::string s;\nstd::string t;\n"
+
+    err = io.StringIO()
+    with redirect_stderr(err), redirect_stdout(io.StringIO()):
+        assert main(["-i", "--lines", "1:2", str(src)]) == 1
+    assert "'lines'" in err.getvalue()
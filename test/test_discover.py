@@ -0,0 +1,146 @@
+import io
+import os
+import shutil
+import subprocess
+from contextlib import redirect_stdout
+
+from remusing_cpp._cli import main
+from remusing_cpp.discover import (
+    HEADER_EXTENSIONS,
+    IgnoreRule,
+    SourceFile,
+    discover_paths,
+    largest_first,
+    parse_extensions,
+    walk_sources,
+)
+
+SRC = b"using namespace std;\nstring s;\n"
+
+
+def _write_tree(root) -> None:
+    for path, size in (
+        ("a.hh", 10),
+        ("big.cpp", 300),
+        ("notes.txt", 10),
+        ("src/b.cpp", 200),
+        ("src/gen/b.gen.cpp", 10),
+        ("src/keep.gen.cpp", 10),
+        ("src/x.cu", 10),
+        ("vendor/lib.hh", 10),
+        (".cache/c.hh", 10),
+        ("build/out.cpp", 10),
+    ):
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(b" " * size)
+    (root / ".gitignore").write_text("# generated\n/build/\n*.gen.cpp\n")
+    (root / "src" / ".gitignore").write_text("!keep.gen.cpp\n")
+
+
+def _relative(root, paths):
+    return [os.path.relpath(path, root) for path in paths]
+
+
+def test_parse_extensions() -> None:
+    assert parse_extensions("headers") == HEADER_EXTENSIONS
+    assert parse_extensions(".cc, cu,.cc") == (".cc", ".cu")
+
+
+def test_ignore_rule() -> None:
+    assert IgnoreRule.parse("# comment") is None
+    assert IgnoreRule.parse("  ") is None
+    rule = IgnoreRule.parse("*.gen.hh")
+    assert rule.regex.fullmatch("a.gen.hh") and rule.regex.fullmatch("src/a.gen.hh")
+    assert not rule.regex.fullmatch("a.gen.hh/b.hh")
+    rule = IgnoreRule.parse("/src/*.hh")
+    assert rule.regex.fullmatch("src/a.hh") and not rule.regex.fullmatch("lib/src/a.hh")
+    assert not rule.regex.fullmatch("src/sub/a.hh")
+    rule = IgnoreRule.parse("src/**/[a-c]?.hh")
+    assert rule.regex.fullmatch("src/b1.hh") and rule.regex.fullmatch("src/x/y/a2.hh")
+    assert not rule.regex.fullmatch("src/d1.hh")
+    rule = IgnoreRule.parse("!out/")
+    assert rule.negated and rule.directories_only and rule.regex.fullmatch("sub/out")
+    rule = IgnoreRule.parse("gen**.hh")
+    assert rule.regex.fullmatch("gen/a/b.hh") and not rule.regex.fullmatch("a/b.hh")
+    rule = IgnoreRule.parse("[!a]\\*.hh")
+    assert rule.regex.fullmatch("b*.hh") and not rule.regex.fullmatch("a*.hh")
+    assert not rule.regex.fullmatch("bc.hh")
+    assert IgnoreRule.parse("!/") is None
+
+
+def test_walk_sources(tmp_path) -> None:
+    _write_tree(tmp_path)
+    files = list(walk_sources(str(tmp_path), sizes=True))
+    assert _relative(tmp_path, [file.path for file in files]) == [
+        "a.hh",
+        "big.cpp",
+        os.path.join("src", "b.cpp"),
+        os.path.join("src", "keep.gen.cpp"),
+    ]
+    assert [file.size for file in files] == [10, 300, 200, 10]
+
+    files = walk_sources(str(tmp_path), (".cu",), excludes=(), ignore_files=False)
+    assert _relative(tmp_path, [file.path for file in files]) == [os.path.join("src", "x.cu")]
+    files = walk_sources(str(tmp_path), excludes=("src/",), ignore_files=False)
+    assert len(list(files)) == 5
+
+
+def test_walk_sources_removed(tmp_path) -> None:
+    _write_tree(tmp_path)
+    files = walk_sources(str(tmp_path), sizes=True)
+    assert os.path.basename(next(files).path) == "a.hh"
+    # Files and directories that disappear during the walk are skipped
+    os.unlink(tmp_path / "big.cpp")
+    shutil.rmtree(tmp_path / "src")
+    assert list(files) == []
+
+
+def test_largest_first() -> None:
+    files = [SourceFile(str(size), size) for size in (1, 5, 3, 5, 9, 2)]
+    assert [file.path for file in largest_first(files)] == ["9", "5", "5", "3", "2", "1"]
+    assert [file.path for file in largest_first(files, 2)] == ["5", "5", "9", "3", "2", "1"]
+
+
+def test_discover_paths(tmp_path) -> None:
+    _write_tree(tmp_path)
+    notes = os.path.join(tmp_path, "notes.txt")
+    paths = discover_paths([str(tmp_path), notes, os.path.join(tmp_path, "src", "*.cpp")])
+    assert _relative(tmp_path, paths) == [
+        "big.cpp",
+        os.path.join("src", "b.cpp"),
+        "a.hh",
+        os.path.join("src", "keep.gen.cpp"),
+        "notes.txt",
+    ]
+    paths = discover_paths([str(tmp_path)], sort_window=0)
+    assert _relative(tmp_path, paths)[:2] == ["a.hh", "big.cpp"]
+
+
+def test_discover_git_ignore(tmp_path) -> None:
+    _write_tree(tmp_path)
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    (tmp_path / ".gitignore").write_text("/src/b.cpp\n")
+    # The ignore files above the walked directory apply as well
+    paths = discover_paths([str(tmp_path / "src")], sort_window=0)
+    # The files of a directory come before its subdirectories
+    assert _relative(tmp_path, paths) == [
+        os.path.join("src", "keep.gen.cpp"),
+        os.path.join("src", "gen", "b.gen.cpp"),
+    ]
+
+
+def test_cli_discover(tmp_path) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+    (tmp_path / "b.cu").write_bytes(SRC)
+    (tmp_path / "vendor").mkdir()
+    (tmp_path / "vendor" / "c.hh").write_bytes(SRC)
+    f = io.StringIO()
+    with redirect_stdout(f):
+        assert main(["-i", "-j", "1", "--extensions", "cu", str(tmp_path)]) == 0
+    assert f.getvalue().splitlines()[0] == f"fixed: {tmp_path / 'b.cu'}"
+    assert (tmp_path / "a.hh").read_bytes() == SRC
+    f = io.StringIO()
+    with redirect_stdout(f):
+        assert main(["-i", "-j", "1", "--no-ignore", "--exclude", "a.*", str(tmp_path)]) == 0
+    assert f.getvalue().splitlines()[0] == f"fixed: {tmp_path / 'vendor' / 'c.hh'}"
+    assert (tmp_path / "a.hh").read_bytes() == SRC
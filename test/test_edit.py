@@ -1,6 +1,11 @@
+import pytest
 from tree_sitter import Language, Parser
 
+from remusing_cpp.bench import generate_source
 from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import EditReason
+from remusing_cpp.report import Category, LineIndex
+from remusing_cpp.stats import RemUsingStats
 from remusing_cpp.util import build_cpp_parser
 
 
@@ -160,3 +165,134 @@ custom<string, fake::vector<my::own::string<keep::map, fake::vector>>> t;
     remusing.process_captures()
     output = remusing.fix()
     assert output == expected
+
+
+def test_edits_reasons(language: Language, parser: Parser) -> None:
+    src = bytes(
+        """using std::foo;
+using namespace std;
+foo f;
+string s;
+custom c;
+""",
+        "utf8",
+    )
+    remusing = RemUsing(src, parser, language)
+    edits = remusing.edits()
+    assert [(e.start_byte, e.end_byte, e.replacement, e.reason) for e in edits] == [
+        (0, 16, b"", EditReason.USING_REMOVAL),
+        (16, 37, b"", EditReason.USING_REMOVAL),
+        (37, 37, b"std::", EditReason.DECL_QUALIFICATION),
+        (44, 44, b"std::", EditReason.HARDCODED_QUALIFICATION),
+    ]
+    assert remusing.fix() == b"std::foo f;\nstd::string s;\ncustom c;\n"
+
+
+def test_fix_noop_returns_src(language: Language, parser: Parser) -> None:
+    src = b"custom c;\n"
+    remusing = RemUsing(src, parser, language)
+    assert remusing.edits() == []
+    assert remusing.fix() is src
+
+
+@pytest.mark.parametrize("window", [1, 16, 100])
+def test_query_windows(language: Language, parser: Parser, window: int) -> None:
+    src = b"""using std::vector;
+namespace foo {
+using namespace std;
+string s; keep::vector<string> t;
+int main() { cout << hex << 3; min(1, 2); }
+}
+"""
+    remusing = RemUsing(src, parser, language)
+    remusing.query_window_bytes = window
+    assert remusing.edits() == RemUsing(src, parser, language).edits()
+
+
+def test_repeated_identifiers(language: Language, parser: Parser) -> None:
+    src = b"""using my::ns::widget;
+using namespace std;
+widget a; widget b; string c; string d; gadget e; gadget f; custom g; custom h;
+"""
+    remusing = RemUsing(src, parser, language)
+    remusing.index_namespace_map = {"gadget": "proj"}
+    remusing.stats = RemUsingStats()
+    edits = remusing.edits()
+    assert remusing._decl_ns_map == {b"widget": b"my::ns"}
+    assert [(e.replacement, e.reason) for e in edits[2:]] == [
+        (b"my::ns::", EditReason.DECL_QUALIFICATION),
+        (b"my::ns::", EditReason.DECL_QUALIFICATION),
+        (b"std::", EditReason.HARDCODED_QUALIFICATION),
+        (b"std::", EditReason.HARDCODED_QUALIFICATION),
+        (b"proj::", EditReason.INDEX_QUALIFICATION),
+        (b"proj::", EditReason.INDEX_QUALIFICATION),
+    ]
+    assert remusing.stats.fixups["unresolved"] == 2
+    # Identical identifiers share their replacement bytes
+    assert edits[2].replacement is edits[3].replacement
+
+
+def test_names_in_removed_using(language: Language, parser: Parser) -> None:
+    src = b"using Base<string>::f;\nstring s;\n"
+    remusing = RemUsing(src, parser, language)
+    # The names in the removed declaration are not qualified
+    assert remusing.fix() == b"std::string s;\n"
+
+
+def test_ranges(language: Language, parser: Parser) -> None:
+    src = b"""using std::vector;
+namespace a {
+using namespace std;
+string s1;
+}
+void f() {
+  using std::map;
+  map<int, int> m1;
+  string s2; vector<int> v;
+}
+void g() { using foo::map; map<int> m2; }
+string s3;
+"""
+    lines = LineIndex(src)
+    remusing = RemUsing(src, parser, language)
+    remusing.ranges = [lines.byte_range(8, 9)]
+    # The `using` declarations at namespace scope and in the enclosing block
+    # resolve the names, but are kept
+    assert remusing.fix() == src.replace(b"map<int, int>", b"std::map<int, int>").replace(
+        b"string s2; vector", b"std::string s2; std::vector"
+    )
+
+    remusing = RemUsing(src, parser, language)
+    remusing.ranges = [lines.byte_range(3, 4), lines.byte_range(12, 12)]
+    assert remusing.fix() == src.replace(b"using namespace std;\n", b"").replace(
+        b"string s1", b"std::string s1"
+    ).replace(b"string s3", b"std::string s3")
+
+    remusing = RemUsing(src, parser, language)
+    remusing.ranges = []
+    assert remusing.edits() == []
+
+
+def test_ranges_past_block(language: Language, parser: Parser) -> None:
+    src = b"void f() {\n  using lib::Thing;\n  Thing a;\n  Thing b;\n}\nint z;\n"
+    start = src.index(b"Thing b")
+    remusing = RemUsing(src, parser, language)
+    # The range ends after the block that declares `Thing`
+    remusing.ranges = [(start, len(src))]
+    assert remusing.fix() == src.replace(b"Thing b", b"lib::Thing b")
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_ranges_match_full(language: Language, parser: Parser, seed: int) -> None:
+    src = generate_source(16384, 0.5, seed)
+    lines = LineIndex(src)
+    ranges = [lines.byte_range(20, 60), lines.byte_range(200, 230)]
+    full = RemUsing(src, parser, language).edits()
+    remusing = RemUsing(src, parser, language)
+    remusing.ranges = ranges
+    edits = remusing.edits()
+    assert edits == [
+        edit for edit in full if any(start <= edit.start_byte < end for start, end in ranges)
+    ]
+    qualified = [edit for edit in edits if edit.reason != EditReason.USING_REMOVAL]
+    assert 0 < len(qualified) == remusing.report().counts[Category.UNQUALIFIED]
@@ -0,0 +1,109 @@
+import io
+import mmap
+import subprocess
+
+import pytest
+
+from remusing_cpp.edits import Edit, EditReason, apply_edits, unified_diff, write_edits
+
+
+def test_apply_edits():
+    src = b"using namespace std;\nstring s; vector v;"
+    edits = [
+        Edit(0, 21, b""),
+        Edit(21, 21, b"std::"),
+        Edit(31, 31, b"std::"),
+        Edit(39, 40, b"!"),
+    ]
+    assert apply_edits(src, edits) == b"std::string s; std::vector v!"
+
+
+def test_write_edits(tmp_path):
+    src = b"using namespace std;\nstring s; vector v;"
+    edits = [Edit(0, 21, b""), Edit(21, 21, b"std::"), Edit(31, 31, b"std::")]
+    out = io.BytesIO()
+    assert write_edits(src, edits, out) == len(out.getvalue())
+    assert out.getvalue() == apply_edits(src, edits)
+
+    path = tmp_path / "src.cpp"
+    path.write_bytes(src)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        out = io.BytesIO()
+        write_edits(mapped, edits, out)
+        assert out.getvalue() == apply_edits(src, edits)
+        assert apply_edits(mapped, []) == src
+
+
+def test_apply_edits_noop():
+    src = b"custom s;"
+    assert apply_edits(src, []) is src
+
+
+@pytest.mark.parametrize(
+    "edits", [[Edit(2, 4, b""), Edit(3, 5, b"")], [Edit(4, 2, b"")], [Edit(0, 10, b"")]]
+)
+def test_apply_edits_invalid(edits):
+    with pytest.raises(ValueError):
+        apply_edits(b"custom s;", edits)
+
+
+def test_unified_diff():
+    src = b"".join(b"line%d\n" % i for i in range(12))
+    edits = [
+        Edit(6, 6, b"std::", EditReason.HARDCODED_QUALIFICATION),
+        Edit(12, 18, b"", EditReason.USING_REMOVAL),
+        Edit(67, 67, b"std::", EditReason.DECL_QUALIFICATION),
+    ]
+    diff = "".join(unified_diff(src, edits, "a.cpp", "b.cpp", context=1))
+    assert diff == (
+        "--- a.cpp\n"
+        "+++ b.cpp\n"
+        "@@ -1,4 +1,3 @@\n"
+        " line0\n"
+        "-line1\n"
+        "-line2\n"
+        "+std::line1\n"
+        " line3\n"
+        "@@ -11,2 +10,2 @@\n"
+        " line10\n"
+        "-line11\n"
+        "+std::line11\n"
+    )
+    # Unchanged lines between the edits of a hunk are context
+    diff = "".join(unified_diff(src, [Edit(0, 0, b"std::"), Edit(12, 12, b"std::")], context=1))
+    assert diff.splitlines()[2:] == [
+        "@@ -1,4 +1,4 @@",
+        "-line0",
+        "+std::line0",
+        " line1",
+        "-line2",
+        "+std::line2",
+        " line3",
+    ]
+    assert list(unified_diff(src, [])) == []
+
+
+def test_unified_diff_no_newline(tmp_path):
+    src = b"\xe9t\xe9\nline1"
+    diff = "".join(unified_diff(src, [Edit(4, 4, b"std::")], "a.cpp", "a.cpp"))
+    assert diff.splitlines()[-4:] == [
+        "-line1",
+        "\\ No newline at end of file",
+        "+std::line1",
+        "\\ No newline at end of file",
+    ]
+    # The diff applies and restores the bytes that are not UTF-8
+    (tmp_path / "a.cpp").write_bytes(src)
+    (tmp_path / "fix.diff").write_bytes(diff.encode("utf8", errors="surrogateescape"))
+    subprocess.run(["git", "apply", "fix.diff"], cwd=tmp_path, check=True)
+    assert (tmp_path / "a.cpp").read_bytes() == b"\xe9t\xe9\nstd::line1"
+
+
+def test_edit_as_json():
+    edit = Edit(3, 3, b"std::", EditReason.DECL_QUALIFICATION)
+    assert edit.as_json() == {
+        "start_byte": 3,
+        "end_byte": 3,
+        "replacement": "std::",
+        "reason": "decl_qualification",
+    }
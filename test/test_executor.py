@@ -0,0 +1,107 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from remusing_cpp.executor import (
+    PROCESS_BACKEND,
+    THREAD_BACKEND,
+    Progress,
+    ProgressReporter,
+    create_executor,
+    imap,
+)
+
+
+def _square(n: int) -> int:
+    if n < 0:
+        raise ValueError(f"negative: {n}")
+    return n * n
+
+
+def _sleep_square(n: int) -> int:
+    # Later items finish first
+    time.sleep(0.01 * (5 - n))
+    return n * n
+
+
+def test_create_executor_unknown():
+    with pytest.raises(ValueError, match="Unknown backend: fibers"):
+        create_executor("fibers", 2)
+
+
+def test_imap_serial():
+    assert list(imap(_square, range(5))) == [0, 1, 4, 9, 16]
+    assert list(imap(_square, range(5), chunksize=2)) == [0, 1, 4, 9, 16]
+
+
+@pytest.mark.parametrize("backend", [PROCESS_BACKEND, THREAD_BACKEND])
+def test_imap_pool(backend):
+    with create_executor(backend, 2) as executor:
+        results = imap(_square, range(50), executor, max_in_flight=3, chunksize=4)
+        assert list(results) == [n * n for n in range(50)]
+
+
+def test_imap_unordered():
+    with ThreadPoolExecutor(5) as executor:
+        ordered = list(imap(_sleep_square, range(5), executor))
+        unordered = list(imap(_sleep_square, range(5), executor, ordered=False))
+    assert ordered == [0, 1, 4, 9, 16]
+    assert sorted(unordered) == ordered
+    assert unordered != ordered
+
+
+def test_imap_bounded():
+    consumed = []
+
+    def items():
+        for n in range(100):
+            consumed.append(n)
+            yield n
+
+    with ThreadPoolExecutor(2) as executor:
+        results = imap(_square, items(), executor, max_in_flight=4)
+        assert next(results) == 0
+        assert len(consumed) <= 5
+        assert sum(1 for _ in results) == 99
+
+        # Closing the iterator early cancels the work that did not start
+        consumed.clear()
+        results = imap(_sleep_square, items(), executor, max_in_flight=4)
+        assert next(results) == 0
+        results.close()
+        assert len(consumed) <= 5
+
+
+def test_imap_errors():
+    items = [1, -2, 3]
+    with pytest.raises(ValueError, match="negative: -2"):
+        list(imap(_square, items))
+
+    progress = []
+    with ThreadPoolExecutor(2) as executor:
+        results = imap(
+            _square,
+            items,
+            executor,
+            on_error=lambda n, e: str(e),
+            on_progress=lambda p: progress.append((p.done, p.failed)),
+        )
+        assert list(results) == [1, "negative: -2", 9]
+    assert progress[-1] == (3, 1)
+
+
+def test_progress_reporter():
+    stream = io.StringIO()
+    report = ProgressReporter(stream, interval=60)
+    progress = Progress(total=2, started=time.perf_counter())
+    progress.done = 1
+    report(progress)
+    # Throttled
+    report(progress)
+    progress.done = 2
+    report(progress)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[-1].startswith("progress: 2/2 file(s), 0 error(s)")
@@ -0,0 +1,119 @@
+import io
+import subprocess
+from contextlib import redirect_stderr, redirect_stdout
+
+import pytest
+
+from remusing_cpp._cli import main
+from remusing_cpp.git import GitError, changed_files, fix_staged, read_blobs, staged_changes
+
+SRC = b"using namespace std;\nstring s;\n"
+FIXED = b"std::string s;\n"
+
+
+def git(*args: str) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    git("init", "-q")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "old.hh").write_bytes(SRC)
+    (tmp_path / "src" / "same.hh").write_bytes(SRC)
+    git("add", ".")
+    git("commit", "-q", "-m", "initial")
+    return tmp_path
+
+
+def test_changed_files(repo):
+    assert changed_files("HEAD") == []
+    (repo / "src" / "old.hh").write_bytes(SRC + b"vector<int> v;\n")
+    (repo / "src" / "new.cpp").write_bytes(SRC)
+    (repo / "notes.txt").write_bytes(SRC)
+    assert changed_files("HEAD") == ["src/new.cpp", "src/old.hh"]
+    assert changed_files("HEAD", ["src/new.cpp"]) == ["src/new.cpp"]
+    with pytest.raises(GitError):
+        changed_files("no-such-revision")
+
+
+def test_staged_changes(repo):
+    (repo / "src" / "old.hh").write_bytes(SRC + b"vector<int> v;\n")
+    (repo / "src" / "new.cpp").write_bytes(SRC)
+    git("add", "src/old.hh")
+    staged = staged_changes()
+    assert [file.path for file in staged] == ["src/old.hh"]
+    assert read_blobs([file.blob for file in staged]) == [SRC + b"vector<int> v;\n"]
+
+
+def test_staged_changes_without_commits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    git("init", "-q")
+    (tmp_path / "a.hh").write_bytes(SRC)
+    (tmp_path / "notes.txt").write_bytes(SRC)
+    git("add", ".")
+    # Everything in the index is new
+    staged = staged_changes()
+    assert [(file.path, file.mode) for file in staged] == [("a.hh", "100644")]
+    assert read_blobs([file.blob for file in staged]) == [SRC]
+
+
+def test_git_errors(repo, monkeypatch):
+    assert read_blobs([]) == []
+    with pytest.raises(GitError, match="Not a blob"):
+        read_blobs(["0" * 40])
+    monkeypatch.setenv("PATH", "")
+    with pytest.raises(GitError, match="Cannot run git"):
+        changed_files("HEAD")
+
+
+def test_fix_staged_removed(repo, cpp_tree_sitter_repo, language_out):
+    (repo / "src" / "new.cpp").write_bytes(SRC)
+    git("add", ".")
+    (repo / "src" / "new.cpp").unlink()
+    results = list(fix_staged([], cpp_tree_sitter_repo, language_out))
+    assert [(r.path, r.changed) for r in results] == [("src/new.cpp", True)]
+    # The staged contents are fixed even without a working tree file
+    assert git("show", ":src/new.cpp").encode() == FIXED
+    assert not (repo / "src" / "new.cpp").exists()
+
+
+def test_cli_changed_since(repo):
+    (repo / "src" / "new.cpp").write_bytes(SRC)
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["--changed-since", "HEAD", "-j", "1"])
+    assert ret == 0
+    assert f.getvalue().splitlines()[0] == "fixed: src/new.cpp"
+    assert (repo / "src" / "new.cpp").read_bytes() == FIXED
+    # Unchanged files are not touched, even if they need fixes
+    assert (repo / "src" / "same.hh").read_bytes() == SRC
+
+    err = io.StringIO()
+    with redirect_stderr(err):
+        assert main(["--changed-since", "no-such-revision"]) == 1
+    assert err.getvalue().startswith("git: ")
+
+
+def test_cli_staged(repo):
+    (repo / "src" / "old.hh").write_bytes(SRC + b"vector<int> v;\n")
+    (repo / "src" / "new.cpp").write_bytes(SRC)
+    git("add", ".")
+    # Unstaged changes are neither fixed nor staged
+    (repo / "src" / "new.cpp").write_bytes(SRC + b"string t;\n")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        ret = main(["--staged", "-j", "2"])
+    assert ret == 0
+    assert f.getvalue().splitlines()[:2] == ["fixed: src/new.cpp", "fixed: src/old.hh"]
+    assert git("show", ":src/old.hh").encode() == FIXED + b"std::vector<int> v;\n"
+    assert git("show", ":src/new.cpp").encode() == FIXED
+    assert (repo / "src" / "old.hh").read_bytes() == FIXED + b"std::vector<int> v;\n"
+    assert (repo / "src" / "new.cpp").read_bytes() == SRC + b"string t;\n"
+    assert git("status", "--porcelain", "src/old.hh") == "M  src/old.hh\n"
@@ -0,0 +1,154 @@
+from typing import List, Tuple
+
+import pytest
+from tree_sitter import Language, Parser
+
+from remusing_cpp.captures import CaptureStore
+from remusing_cpp.core import WALKER_ENGINE, RemUsing
+
+SRC = b"""using my::own::string;
+using fake::vector;
+using namespace std;
+vector v;
+std::vector v2;
+string s;
+keep::vector<string> t;
+int main() { cout << hex << 3; min(1, 2); foo(cin); }
+"""
+
+
+@pytest.mark.parametrize(
+    "old,new",
+    [
+        (b"vector v;", b"vector v; map<int, list> m;"),
+        (b"string s;", b""),
+        (b"using fake::vector;\n", b""),
+        (b"keep::vector", b"vector"),
+        (b"foo(cin);", b"foo(cin); cerr << endl;"),
+        (b"int main()", b"int main("),
+        (SRC, b""),
+    ],
+)
+def test_apply_text_edit(language: Language, parser: Parser, old: bytes, new: bytes) -> None:
+    remusing = RemUsing(SRC, parser, language)
+    remusing.fix()
+
+    start = SRC.index(old)
+    remusing.apply_text_edit(start, start + len(old), new)
+    expected_src = SRC.replace(old, new, 1)
+    assert remusing.src == expected_src
+
+    fresh = RemUsing(expected_src, parser, language)
+    assert remusing.edits() == fresh.edits()
+    assert remusing.fix() == fresh.fix()
+
+
+def test_apply_text_edit_repeated(language: Language, parser: Parser) -> None:
+    remusing = RemUsing(SRC, parser, language)
+    src = SRC
+    for old, new in [(b"v2", b"v3"), (b"hex", b"dec"), (b"vector v;", b"set<vector> v;")]:
+        start = src.index(old)
+        remusing.apply_text_edit(start, start + len(old), new)
+        src = src.replace(old, new, 1)
+    assert remusing.fix() == RemUsing(src, parser, language).fix()
+
+
+# A header whose declarations are all in one namespace, with a `using`
+# declaration in the middle
+NAMESPACED = b"""namespace project {
+using std::string;
+template <typename T> struct Box { T t; vector<T> v; };
+string s;
+
+using namespace std;
+void f() { cout << endl; }
+}  // namespace project
+"""
+
+
+@pytest.mark.parametrize(
+    "old,new",
+    [
+        # Edits next to a `using` declaration, whose removal takes the newlines
+        (b"\n\nusing namespace", b"\nusing namespace"),
+        (b"string s;\n", b"string s;\n\n\n"),
+        (b";\n\nusing", b"; using"),
+        # The `using` declaration of a type changes what all of its uses need
+        (b"using std::string;", b"using other::string;"),
+        (b"using std::string;", b""),
+        # Names that refer to the template parameter or to the namespace
+        (b"template <typename T>", b"template <typename U>"),
+        (b"namespace project {", b"namespace lib {"),
+        (b"string s;", b"Box<string> b; Widget w;"),
+        # Syntax errors are queried in full
+        (b"void f() {", b"void f() {{"),
+    ],
+)
+def test_apply_text_edit_namespaced(
+    language: Language, parser: Parser, old: bytes, new: bytes
+) -> None:
+    index = {"Widget": "lib", "T": "lib", "Box": "project"}
+    remusing = RemUsing(NAMESPACED, parser, language)
+    remusing.index_namespace_map = index
+    remusing.edits()
+    src = NAMESPACED
+    for _ in range(2):
+        # Apply the edit, and then revert it
+        start = src.index(old)
+        remusing.apply_text_edit(start, start + len(old), new)
+        src = src.replace(old, new, 1)
+        fresh = RemUsing(src, parser, language)
+        fresh.index_namespace_map = index
+        assert remusing.edits() == fresh.edits()
+        old, new = new, old
+
+
+def test_apply_text_edit_walker(language: Language, parser: Parser) -> None:
+    remusing = RemUsing(SRC, parser, language)
+    remusing.engine = WALKER_ENGINE
+    remusing.edits()
+    start = SRC.index(b"string s;")
+    remusing.apply_text_edit(start, start, b"list l; ")
+    fresh = RemUsing(remusing.src, parser, language)
+    fresh.engine = WALKER_ENGINE
+    assert remusing.edits() == fresh.edits()
+
+
+def test_apply_text_edit_flat(
+    language: Language, parser: Parser, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    The work of an edit does not grow with the size of the source.
+    """
+    line = b"string s; vector<int> v; void f() { cout << endl; }\n"
+    work: List[Tuple[int, int]] = []
+    store_edit = CaptureStore.edit
+    compute_edits = RemUsing._compute_edits
+
+    def spy_store_edit(self: CaptureStore, *args: object, **kwargs: object) -> CaptureStore:
+        added = store_edit(self, *args, **kwargs)  # type: ignore[arg-type]
+        work.append((len(added), 0))
+        return added
+
+    def spy_compute_edits(self: RemUsing, fixups, using_decls):  # type: ignore[no-untyped-def]
+        work.append((0, len(fixups)))
+        return compute_edits(self, fixups, using_decls)
+
+    def edit_work(lines: int) -> List[Tuple[int, int]]:
+        src = b"using namespace std;\nnamespace project {\n" + line * lines + b"}\n"
+        remusing = RemUsing(src, parser, language)
+        remusing.edits()
+        middle = src.index(line, len(src) // 2)
+        work.clear()
+        remusing.apply_text_edit(middle, middle, b"list<int> l; ")
+        remusing.apply_text_edit(middle + 5, middle + 8, b"")
+        edits = remusing.edits()
+        done = list(work)
+        assert edits == RemUsing(remusing.src, parser, language).edits()
+        return done
+
+    monkeypatch.setattr(CaptureStore, "edit", spy_store_edit)
+    monkeypatch.setattr(RemUsing, "_compute_edits", spy_compute_edits)
+    small = edit_work(50)
+    assert small and all(captures < 50 and fixups < 50 for captures, fixups in small)
+    assert edit_work(400) == small
@@ -0,0 +1,138 @@
+import os
+
+import pytest
+from tree_sitter import Language, Parser
+
+from remusing_cpp import batch, index
+from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import EditReason
+from remusing_cpp.index import NAMESPACE, TYPE, USING, SymbolIndex, SymbolRecord, scan_symbols
+
+HEADER = b"""namespace outer::inner {
+class Widget {
+  struct Nested {};
+};
+typedef int Id;
+using Handle = long;
+enum Color {};
+}
+namespace {
+struct Hidden {};
+}
+struct Global;
+using std::string;
+void f() { struct Local {}; }
+"""
+
+
+def test_scan_symbols(language: Language, parser: Parser) -> None:
+    assert scan_symbols(HEADER, parser, language) == [
+        SymbolRecord("outer::inner", "", NAMESPACE, 1),
+        SymbolRecord("Widget", "outer::inner", TYPE, 2),
+        SymbolRecord("Id", "outer::inner", TYPE, 5),
+        SymbolRecord("Handle", "outer::inner", TYPE, 6),
+        SymbolRecord("Color", "outer::inner", TYPE, 7),
+        SymbolRecord("Global", "", TYPE, 12),
+        SymbolRecord("string", "std", USING, 13),
+    ]
+
+
+def test_symbol_index_update(tmp_path, cpp_tree_sitter_repo: str, language_out: str) -> None:
+    a = tmp_path / "a.hh"
+    b = tmp_path / "b.hh"
+    a.write_bytes(HEADER)
+    b.write_bytes(b"namespace other { class Widget; class Gadget; }\n")
+    paths = [str(a), str(b)]
+    db = str(tmp_path / "index.db")
+
+    with SymbolIndex(db) as index:
+        stats = index.update(paths, cpp_tree_sitter_repo, language_out, jobs=2)
+        assert (stats.scanned, stats.unchanged, stats.removed) == (2, 0, 0)
+        # `Widget` is ambiguous and `Global` needs no qualification
+        assert index.namespace_map() == {
+            "Id": "outer::inner",
+            "Handle": "outer::inner",
+            "Color": "outer::inner",
+            "string": "std",
+            "Gadget": "other",
+        }
+        assert [path for path, _ in index.symbols("Widget")] == [str(a), str(b)]
+
+    with SymbolIndex(db) as index:
+        stats = index.update(paths, cpp_tree_sitter_repo, language_out)
+        assert (stats.scanned, stats.unchanged) == (0, 2)
+
+        # Touched but not changed
+        os.utime(a, ns=(0, 0))
+        stats = index.update(paths, cpp_tree_sitter_repo, language_out)
+        assert (stats.scanned, stats.unchanged) == (0, 2)
+
+        b.write_bytes(b"namespace other { class Gizmo; }\n")
+        stats = index.update(paths, cpp_tree_sitter_repo, language_out)
+        assert (stats.scanned, stats.unchanged) == (1, 1)
+        assert index.namespace_map()["Widget"] == "outer::inner"
+        assert "Gadget" not in index.namespace_map()
+
+        a.unlink()
+        stats = index.update([str(b)], cpp_tree_sitter_repo, language_out)
+        assert (stats.scanned, stats.unchanged, stats.removed) == (0, 1, 1)
+        assert index.namespace_map() == {"Gizmo": "other"}
+
+        # Files that cannot be read are counted and not indexed
+        (tmp_path / "dir.hh").mkdir()
+        paths = [str(b), str(tmp_path / "dir.hh"), str(tmp_path / "missing.hh")]
+        stats = index.update(paths, cpp_tree_sitter_repo, language_out)
+        assert (stats.scanned, stats.unchanged, stats.errors) == (0, 1, 2)
+        assert index.namespace_map() == {"Gizmo": "other"}
+
+
+def test_symbol_index_scanner(
+    tmp_path, cpp_tree_sitter_repo: str, language_out: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "a.hh"
+    path.write_bytes(b"namespace ns { class Widget; }\n")
+    monkeypatch.setattr(batch, "_worker_language", None)
+    with SymbolIndex(str(tmp_path / "index.db")) as symbol_index:
+        symbol_index.update([str(path)], cpp_tree_sitter_repo, language_out)
+        assert symbol_index.namespace_map() == {"Widget": "ns"}
+    # Scanning in this process leaves the state of the batch workers alone
+    assert batch._worker_language is None
+
+    # The worker processes of `update` with several jobs
+    monkeypatch.setattr(index, "_worker_scanner", None)
+    index._init_worker(index.ensure_cpp_language(cpp_tree_sitter_repo, language_out))
+    result = index._scan_file((str(path), None))
+    assert result.symbols == [
+        SymbolRecord("ns", "", NAMESPACE, 1),
+        SymbolRecord("Widget", "ns", TYPE, 1),
+    ]
+
+
+def test_index_namespace_map(language: Language, parser: Parser) -> None:
+    src = b"using std::string;\nstring s; Widget w; custom c;\n"
+    remusing = RemUsing(src, parser, language)
+    remusing.index_namespace_map = {"Widget": "outer", "string": "other"}
+    assert remusing.fix() == b"std::string s; outer::Widget w; custom c;\n"
+    assert [edit.reason for edit in remusing.edits()][-1] == EditReason.INDEX_QUALIFICATION
+
+
+def test_index_declarations(language: Language, parser: Parser) -> None:
+    src = b"""namespace ui {
+class Widget { Widget* next; };
+typedef int Id;
+namespace detail { Widget w; }
+}
+template <typename Widget, template <class> class Id> Widget make(Id<Widget> id);
+typedef Widget *WidgetPtr, Id;
+class Widget;
+struct Widget* p;
+namespace other { Widget w; Id i; }
+"""
+    remusing = RemUsing(src, parser, language)
+    remusing.index_namespace_map = {"Widget": "ui", "Id": "ui", "WidgetPtr": "ui"}
+    # Only the uses outside the namespace and the template are qualified
+    assert remusing.fix() == src.replace(b"typedef Widget", b"typedef ui::Widget").replace(
+        b"struct Widget*", b"struct ui::Widget*"
+    ).replace(b"{ Widget w; Id i; }", b"{ ui::Widget w; ui::Id i; }")
+    report = remusing.report()
+    assert report.namespaces == {"ui": 4}
@@ -0,0 +1,113 @@
+import io
+import random
+import re
+from contextlib import redirect_stderr, redirect_stdout
+
+import pytest
+from tree_sitter import Language, Parser
+
+from remusing_cpp._cli import main
+from remusing_cpp.batch import run_batch
+from remusing_cpp.core import RemUsing
+from remusing_cpp.prefilter import Prefilter
+from remusing_cpp.util import open_source
+
+from .test_walker import SOURCES
+
+
+def test_prefilter_words() -> None:
+    prefilter = Prefilter(["set", "setw", "setfill", "using", "ws", "s", "caf\u00e9"])
+    for text, found in [
+        (b"set x;", True),
+        (b"offset = 3;", False),
+        (b"setw(3)", True),
+        (b"settings", False),
+        (b"setfil", False),
+        (b"usingx", False),
+        (b"3set", False),
+        (b"\tusing namespace", True),
+        (b"a.s", True),
+        (b"caf\xc3\xa9 c;", True),
+        (b"caf\xc3\xa9s", False),
+        (b"", False),
+    ]:
+        assert prefilter.might_change(text) == found, text
+    # Identifiers that span the boundary of the scanned chunks
+    src = b"x" * 4095 + b" " + b"y" * 4094 + b" setw;"
+    assert prefilter.might_change(src)
+    assert not prefilter.might_change(src.replace(b" setw", b"setw"))
+
+
+def test_prefilter_words_random() -> None:
+    rng = random.Random(0)
+    alphabet = "ab_"
+    words = {"".join(rng.choices(alphabet, k=rng.randint(1, 4))) for _ in range(20)}
+    prefilter = Prefilter(words)
+    for _ in range(500):
+        text = " ".join(
+            "".join(rng.choices(alphabet, k=rng.randint(1, 5))) for _ in range(rng.randint(0, 4))
+        )
+        expected = any(token in words for token in re.findall(r"\w+", text))
+        assert prefilter.might_change(text.encode()) == expected, text
+
+
+@pytest.mark.parametrize("src", SOURCES)
+def test_prefilter_never_skips_changes(src: bytes, language: Language, parser: Parser) -> None:
+    remusing = RemUsing(src, parser, language)
+    if not Prefilter.for_remusing(remusing).might_change(src):
+        assert remusing.edits() == []
+
+
+def test_prefilter_for_remusing(tmp_path, language: Language, parser: Parser) -> None:
+    remusing = RemUsing(b"", parser, language)
+    remusing.index_namespace_map = {"Widget": "ui"}
+    prefilter = Prefilter.for_remusing(remusing)
+    assert {"using", "string", "Widget"} <= prefilter.words
+
+    path = tmp_path / "a.hh"
+    for src, expected in [
+        (b"int main() { return 0; }\n", False),
+        (b"// using nothing\nint i;\n", True),
+        (b"Widget w;\n", True),
+        (b"std::string s;\n", True),
+        (b"mystring s;\n", False),
+    ]:
+        path.write_bytes(src)
+        with open_source(str(path)) as mapped:
+            assert prefilter.might_change(mapped) == expected, src
+
+
+def test_run_batch_prefilter(tmp_path, cpp_tree_sitter_repo: str, language_out: str) -> None:
+    (tmp_path / "a.hh").write_bytes(b"using namespace std;\nstring s;\n")
+    (tmp_path / "b.hh").write_bytes(b"int i;\n")
+    (tmp_path / "c.hh").write_bytes(b"Widget w;\n")
+    paths = [str(tmp_path / name) for name in ("a.hh", "b.hh", "c.hh")]
+
+    results = run_batch(paths, cpp_tree_sitter_repo, language_out, 2)
+    assert [(r.changed, r.skipped) for r in results] == [
+        (True, False),
+        (False, True),
+        (False, True),
+    ]
+    results = run_batch(paths, cpp_tree_sitter_repo, language_out, 1, {"Widget": "ui"})
+    assert [(r.changed, r.skipped) for r in results] == [
+        (False, False),
+        (False, True),
+        (True, False),
+    ]
+    assert (tmp_path / "c.hh").read_bytes() == b"ui::Widget w;\n"
+    results = run_batch(paths, cpp_tree_sitter_repo, language_out, 1, prefilter=False)
+    assert not any(r.skipped for r in results)
+
+
+def test_cli_prefilter(tmp_path) -> None:
+    (tmp_path / "a.hh").write_bytes(b"int i;\n")
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        assert main(["-i", "-j", "1", str(tmp_path)]) == 0
+    assert "prefilter: 1 file(s) skipped" in err.getvalue()
+
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        assert main(["-i", "-j", "1", "--no-prefilter", str(tmp_path)]) == 0
+    assert "prefilter" not in err.getvalue()
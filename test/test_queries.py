@@ -0,0 +1,27 @@
+from tree_sitter import Language, Parser
+
+from remusing_cpp.core import RemUsing
+from remusing_cpp.queries import QueryCache
+
+
+def test_query_cache(language: Language) -> None:
+    cache = QueryCache()
+    query = cache.get(language, "(type_identifier) @type")
+    assert cache.get(language, "(type_identifier) @type") is query
+    assert cache.get(language, "(identifier) @id") is not query
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+    cache.clear()
+    assert cache.get(language, "(type_identifier) @type") is not query
+    assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+
+
+def test_query_shared_across_instances(language: Language, parser: Parser) -> None:
+    cache = QueryCache()
+    first = RemUsing(b"string s;", parser, language)
+    second = RemUsing(b"vector v;", parser, language)
+    first.query_cache = second.query_cache = cache
+    assert first.fix() == b"std::string s;"
+    assert second.fix() == b"std::vector v;"
+    assert first.compiled_query is second.compiled_query
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
@@ -0,0 +1,75 @@
+import pytest
+from tree_sitter import Language, Parser
+
+from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import EditReason
+from remusing_cpp.report import Category, Finding, LineIndex
+
+from .test_walker import SOURCES
+
+SRC = b"""using namespace std;
+using a::b::c;
+namespace x {
+  string s; c t;
+  vector<other> v;
+}
+"""
+
+
+def test_report(language: Language, parser: Parser) -> None:
+    remusing = RemUsing(SRC, parser, language)
+    report = remusing.report()
+    assert report.counts == {
+        Category.USING_NAMESPACE: 1,
+        Category.USING_DECLARATION: 1,
+        Category.UNQUALIFIED: 3,
+    }
+    assert report.namespaces == {"std": 2, "a::b": 1}
+    assert report.findings == [
+        Finding(Category.USING_NAMESPACE, 1, 1, "using namespace std;", "std"),
+        Finding(Category.USING_DECLARATION, 2, 1, "using a::b::c;", "a::b"),
+        Finding(Category.UNQUALIFIED, 4, 3, "string", "std"),
+        Finding(Category.UNQUALIFIED, 4, 13, "c", "a::b"),
+        Finding(Category.UNQUALIFIED, 5, 3, "vector", "std"),
+    ]
+    # Neither the edits nor the fixed source are computed
+    assert remusing._edits is None
+
+    counts_only = RemUsing(SRC, parser, language).report(locations=False)
+    assert counts_only.counts == report.counts
+    assert counts_only.findings == []
+    assert report.as_json()["counts"] == {
+        "using_namespace": 1,
+        "using_declaration": 1,
+        "unqualified": 3,
+    }
+
+
+@pytest.mark.parametrize("src", SOURCES)
+def test_report_matches_edits(src: bytes, language: Language, parser: Parser) -> None:
+    report = RemUsing(src, parser, language).report(locations=False)
+    reasons = [edit.reason for edit in RemUsing(src, parser, language).edits()]
+    using = report.counts[Category.USING_NAMESPACE] + report.counts[Category.USING_DECLARATION]
+    assert using == reasons.count(EditReason.USING_REMOVAL)
+    assert report.counts[Category.UNQUALIFIED] == len(reasons) - using
+
+
+def test_line_index() -> None:
+    lines = LineIndex(b"ab\n\ncd\n")
+    assert [lines.location(byte) for byte in range(7)] == [
+        (1, 1),
+        (1, 2),
+        (1, 3),
+        (2, 1),
+        (3, 1),
+        (3, 2),
+        (3, 3),
+    ]
+
+
+def test_line_index_byte_range() -> None:
+    lines = LineIndex(b"ab\n\ncd")
+    assert lines.byte_range(1, 1) == (0, 3)
+    assert lines.byte_range(2, 3) == (3, 6)
+    assert lines.byte_range(1, 10) == (0, 6)
+    assert lines.byte_range(5, 6) == (6, 6)
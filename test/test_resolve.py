@@ -0,0 +1,55 @@
+from tree_sitter import Language, Parser
+
+from remusing_cpp.core import RemUsing
+from remusing_cpp.edits import EditReason
+from remusing_cpp.resolve import NamespaceTable
+
+HARDCODED = EditReason.HARDCODED_QUALIFICATION
+INDEX = EditReason.INDEX_QUALIFICATION
+
+
+def test_namespace_table() -> None:
+    table = NamespaceTable.from_maps(
+        {"string": "std", "vector": "std", "empty": ""},
+        {"string": "other", "Widget": "ui", "empty": "ui"},
+    )
+    assert table.get(b"string") == (b"std::", HARDCODED)
+    assert table.get(b"Widget") == (b"ui::", INDEX)
+    # Empty namespaces fall through to the next map
+    assert table.get(b"empty") == (b"ui::", INDEX)
+    assert table.get(b"unknown") is None
+    # Identifiers in the same namespace share their prefix
+    assert table.get(b"vector")[0] is table.get(b"string")[0]
+    assert table.table == {
+        b"string": (b"std::", HARDCODED),
+        b"Widget": (b"ui::", INDEX),
+        b"empty": (b"ui::", INDEX),
+        b"unknown": None,
+        b"vector": (b"std::", HARDCODED),
+    }
+
+
+def test_namespace_table_not_utf8(language: Language, parser: Parser) -> None:
+    table = NamespaceTable.from_maps({"string": "std"}, {"caf\udce9": "men\udcfa"})
+    assert table.get(b"caf\xe9") == (b"men\xfa::", INDEX)
+    assert table.get(b"\xff") is None
+
+    # Latin-1 identifiers are left alone
+    remusing = RemUsing(b"string s;\nna\xefve n;\n", parser, language)
+    remusing.namespace_table = table
+    assert remusing.fix() == b"std::string s;\nna\xefve n;\n"
+
+
+def test_shared_namespace_table(language: Language, parser: Parser) -> None:
+    table = NamespaceTable.from_maps({"string": "std"}, {"Widget": "ui"})
+    src = b"using std::string;\nusing my::vector;\nstring s;\nvector<Widget> v;\nother o;\n"
+    remusing = RemUsing(src, parser, language)
+    remusing.namespace_table = table
+    assert remusing.fix() == b"std::string s;\nmy::vector<ui::Widget> v;\nother o;\n"
+    # The `using` declarations of a source are not part of the shared table
+    assert b"vector" not in table.table
+    assert set(table.table) == {b"Widget", b"other"}
+
+    remusing = RemUsing(b"string s;\nvector<int> v;\n", parser, language)
+    remusing.namespace_table = table
+    assert remusing.fix() == b"std::string s;\nvector<int> v;\n"
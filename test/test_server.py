@@ -0,0 +1,240 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import redirect_stderr, redirect_stdout
+
+import pytest
+
+from remusing_cpp._cli import main
+from remusing_cpp.server import (
+    INVALID_PARAMS,
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    PARSE_ERROR,
+    SERVER_ERROR,
+    FixClient,
+    FixServer,
+    RpcError,
+)
+from remusing_cpp.util import ensure_cpp_language
+
+SRC = b"using namespace std;\nstring s;\n"
+FIXED = b"std::string s;\n"
+
+
+@pytest.fixture
+def server(cpp_tree_sitter_repo: str, language_out: str) -> FixServer:
+    return FixServer(ensure_cpp_language(cpp_tree_sitter_repo, language_out))
+
+
+@pytest.fixture
+def socket_path(server: FixServer, tmp_path):
+    path = str(tmp_path / "remusing.sock")
+    thread = threading.Thread(target=server.serve_unix, args=(path,))
+    thread.start()
+    while not os.path.exists(path):
+        time.sleep(0.01)
+    yield path
+    with FixClient(path) as client:
+        client.call("shutdown")
+    thread.join()
+    assert not os.path.exists(path)
+
+
+def test_serve_stream(server: FixServer) -> None:
+    requests = [
+        {"jsonrpc": "2.0", "id": 1, "method": "fix", "params": {"source": SRC.decode()}},
+        {"jsonrpc": "2.0", "id": 2, "method": "fix", "params": {"source": "", "format": "x"}},
+        {"jsonrpc": "2.0", "id": 3, "method": "nope"},
+        {"jsonrpc": "2.0", "method": "ping"},
+        {"jsonrpc": "2.0", "id": 4, "method": "fix", "params": {"bogus": 1}},
+        {"jsonrpc": "2.0", "id": 5, "method": "shutdown"},
+        {"jsonrpc": "2.0", "id": 6, "method": "ping"},
+    ]
+    rfile = io.BytesIO(b"not json\n" + b"".join(json.dumps(r).encode() + b"\n" for r in requests))
+    wfile = io.BytesIO()
+    server.serve_stream(rfile, wfile)
+    responses = [json.loads(line) for line in wfile.getvalue().splitlines()]
+
+    assert responses[0]["error"]["code"] == PARSE_ERROR
+    assert responses[1] == {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "result": {"changed": True, "output": FIXED.decode()},
+    }
+    assert responses[2]["error"]["code"] == INVALID_PARAMS
+    assert responses[3]["error"]["code"] == METHOD_NOT_FOUND
+    # The notification is not answered
+    assert responses[4]["id"] == 4
+    assert responses[4]["error"]["code"] == INVALID_PARAMS
+    # Nothing is answered after the shutdown
+    assert responses[5] == {"jsonrpc": "2.0", "id": 5, "result": None}
+    assert len(responses) == 6
+
+
+def test_handle_errors(server: FixServer, tmp_path, monkeypatch) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+    path = str(tmp_path / "a.hh")
+
+    def error_code(request) -> int:
+        return server.handle({"jsonrpc": "2.0", "id": 1, **request})["error"]["code"]
+
+    assert server.handle([1])["error"]["code"] == INVALID_REQUEST
+    assert error_code({"method": 1}) == INVALID_REQUEST
+    assert error_code({"method": "fix", "params": [SRC.decode()]}) == INVALID_PARAMS
+    assert error_code({"method": "fix", "params": {"source": "", "path": path}}) == INVALID_PARAMS
+    assert error_code({"method": "fix", "params": {"source": "", "in_place": True}}) == (
+        INVALID_PARAMS
+    )
+    missing = str(tmp_path / "missing.hh")
+    assert error_code({"method": "fix", "params": {"path": missing, "in_place": True}}) == (
+        SERVER_ERROR
+    )
+    assert server.handle_line(b"  \n") is None
+
+    # Unexpected failures are reported and the server keeps running
+    def fail(**params):
+        raise UnicodeDecodeError("utf-8", b"\xe9", 0, 1, "invalid continuation byte")
+
+    monkeypatch.setattr(server, "fix_files", fail)
+    lines = [
+        {"jsonrpc": "2.0", "id": 1, "method": "fix_files", "params": {"paths": [path]}},
+        {"jsonrpc": "2.0", "id": 2, "method": "fix", "params": {"path": path, "in_place": True}},
+        {"jsonrpc": "2.0", "id": 3, "method": "ping"},
+    ]
+    wfile = io.BytesIO()
+    server.serve_stream(io.BytesIO(b"".join(json.dumps(r).encode() + b"\n" for r in lines)), wfile)
+    responses = [json.loads(line) for line in wfile.getvalue().splitlines()]
+    assert responses[0]["error"]["code"] == SERVER_ERROR
+    assert responses[0]["error"]["message"].startswith("UnicodeDecodeError: ")
+    assert responses[1]["result"] == {"changed": True, "output": None}
+    assert responses[2]["result"] == "pong"
+    assert (tmp_path / "a.hh").read_bytes() == FIXED
+
+
+def test_client_timeout(tmp_path) -> None:
+    path = str(tmp_path / "silent.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(path)
+        listener.listen()
+        # The server accepts the connection but never answers
+        with FixClient(path, timeout=0.05) as client, listener.accept()[0], pytest.raises(OSError):
+            client.call("ping")
+        with FixClient(path, timeout=0.05) as client, listener.accept()[0] as conn:
+            conn.shutdown(socket.SHUT_WR)
+            with pytest.raises(ConnectionError, match="closed"):
+                client.call("ping")
+    with pytest.raises(OSError):
+        FixClient(str(tmp_path / "missing.sock"))
+
+
+def test_serve_unix(socket_path: str, tmp_path) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+    (tmp_path / "b.hh").write_bytes(FIXED)
+    with FixClient(socket_path) as client:
+        assert client.call("ping") == "pong"
+        assert (
+            client.fix(b"using namespace std;\nstring s; // \xff\n") == "std::string s; // \udcff\n"
+        )
+        assert json.loads(client.fix(SRC, "json"))[0]["reason"] == "using_removal"
+        assert client.fix(SRC, "diff", "a.hh").startswith("--- a.hh\n+++ a.hh\n")
+        results = client.fix_files([str(tmp_path / "a.hh"), str(tmp_path / "b.hh")])
+        assert [(r.changed, r.error) for r in results] == [(True, None), (False, None)]
+        with pytest.raises(RpcError):
+            client.call("fix", path=str(tmp_path / "missing.hh"))
+        assert client.call("fix", path=str(tmp_path / "b.hh")) == {
+            "changed": False,
+            "output": FIXED.decode(),
+        }
+    assert (tmp_path / "a.hh").read_bytes() == FIXED
+
+
+def test_serve_unix_stale_socket(server: FixServer, tmp_path) -> None:
+    path = tmp_path / "remusing.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(path))
+    server.running = False
+    # A leftover socket file is replaced, and removed again on shutdown
+    server.serve_unix(str(path))
+    assert not path.exists()
+
+
+def test_serve_unix_in_use(
+    socket_path: str, tmp_path, cpp_tree_sitter_repo: str, language_out: str, capsys
+) -> None:
+    other = tmp_path / "other.txt"
+    other.write_text("keep")
+    args = ["serve", "-t", cpp_tree_sitter_repo, "-s", language_out, "--socket"]
+    # Neither other files nor the socket of a running server are removed
+    assert main([*args, str(other)]) == 1
+    assert "Not a socket" in capsys.readouterr().err
+    assert other.read_text() == "keep"
+    assert main([*args, socket_path]) == 1
+    assert "already listening" in capsys.readouterr().err
+    with FixClient(socket_path) as client:
+        assert client.call("ping") == "pong"
+
+
+def test_cli_server(socket_path: str, tmp_path, monkeypatch) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+    (tmp_path / "b.hh").write_bytes(SRC)
+    monkeypatch.setattr("remusing_cpp._cli.SERVER_CHUNK", 1)
+    f = io.StringIO()
+    with redirect_stdout(f):
+        assert main(["--server", socket_path, str(tmp_path / "a.hh")]) == 0
+    assert f.getvalue() == FIXED.decode()
+
+    f = io.StringIO()
+    with redirect_stdout(f):
+        assert main(["--server", socket_path, "-i", str(tmp_path)]) == 0
+    assert f.getvalue().splitlines() == [
+        f"fixed: {tmp_path / 'a.hh'}",
+        f"fixed: {tmp_path / 'b.hh'}",
+        "2 file(s) processed: 2 fixed, 0 unchanged, 0 error(s)",
+    ]
+    assert (tmp_path / "a.hh").read_bytes() == (tmp_path / "b.hh").read_bytes() == FIXED
+
+
+def test_cli_server_unreachable(tmp_path, capsys) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+    assert main(["--server", str(tmp_path / "missing.sock"), str(tmp_path / "a.hh")]) == 0
+    captured = capsys.readouterr()
+    assert captured.out == FIXED.decode()
+    assert "processing locally" in captured.err
+
+
+def test_cli_server_fallback(server: FixServer, socket_path: str, tmp_path, monkeypatch) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+
+    def fail(**params):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(server, "fix", fail)
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        assert main(["--server", socket_path, str(tmp_path / "a.hh")]) == 0
+    assert out.getvalue() == FIXED.decode()
+    assert err.getvalue().startswith("Server failed, processing locally: RuntimeError: broken")
+
+    # The files of a failed request are not fixed locally, the server may still write them
+    (tmp_path / "b.hh").write_bytes(SRC)
+    monkeypatch.setattr(server, "fix_files", fail)
+    monkeypatch.setattr("remusing_cpp._cli.SERVER_CHUNK", 1)
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        assert main(["--server", socket_path, "-i", str(tmp_path)]) == 1
+    assert (
+        out.getvalue().splitlines()[-1] == "2 file(s) processed: 0 fixed, 0 unchanged, 2 error(s)"
+    )
+    assert "Server failed: RuntimeError: broken" in err.getvalue()
+    assert (tmp_path / "b.hh").read_bytes() == SRC
+
+    err = io.StringIO()
+    with redirect_stderr(err):
+        args = ["--server", socket_path, "-i", "--index", "x.db", "--no-prefilter", str(tmp_path)]
+        assert main(args) == 1
+    assert err.getvalue().startswith("Cannot use --index, --no-prefilter with a server")
+    assert (tmp_path / "a.hh").read_bytes() == SRC
@@ -0,0 +1,83 @@
+import io
+import json
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+from tree_sitter import Language, Parser
+
+from remusing_cpp._cli import main
+from remusing_cpp.batch import run_batch
+from remusing_cpp.core import RemUsing
+from remusing_cpp.stats import STAGES, UNRESOLVED, RemUsingStats, merge_stats
+
+SRC = b"""using namespace std;
+using std::vector;
+string s; vector<int> v; Widget w;
+"""
+
+
+def test_remusing_stats(language: Language, parser: Parser) -> None:
+    remusing = RemUsing(SRC, parser, language)
+    remusing.stats = RemUsingStats()
+    fixed = remusing.fix()
+    stats = remusing.stats
+
+    assert list(stats.as_json()["stage_seconds"]) == list(STAGES)
+    assert all(seconds >= 0 for seconds in stats.stage_seconds.values())
+    assert stats.captures[remusing.types_query.TYPE_ALL_CAPTURE] == 3
+    assert stats.captures[remusing.using_query.USING_DECL_CAPTURE] == 1
+    assert stats.fixups == {
+        "using_removal": 2,
+        "decl_qualification": 1,
+        "hardcoded_qualification": 1,
+        UNRESOLVED: 1,
+    }
+    assert (stats.files, stats.bytes_in, stats.bytes_out) == (1, len(SRC), len(fixed))
+
+    # Stages are only counted once
+    remusing.fix()
+    assert stats.files == 1
+
+
+def test_merge_stats() -> None:
+    a = RemUsingStats(1, {"parse": 1.0}, {"type": 2}, {UNRESOLVED: 1}, 10, 12)
+    b = RemUsingStats(2, {"parse": 0.5, "query": 2.0}, {"type": 1}, {"using_removal": 3}, 5, 4)
+    total = merge_stats([a, None, b])
+    assert total == RemUsingStats(
+        3,
+        {"parse": 1.5, "query": 2.0},
+        {"type": 3},
+        {UNRESOLVED: 1, "using_removal": 3},
+        15,
+        16,
+    )
+
+
+def test_run_batch_stats(tmp_path, cpp_tree_sitter_repo: str, language_out: str) -> None:
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.hh"
+        path.write_bytes(SRC)
+        paths.append(str(path))
+    results = run_batch(paths, cpp_tree_sitter_repo, language_out, 2, collect_stats=True)
+    total = merge_stats(result.stats for result in results)
+    assert total.files == 3
+    assert total.fixups["using_removal"] == 6
+    assert total.bytes_in == 3 * len(SRC)
+    assert total.bytes_out == sum(len(Path(path).read_bytes()) for path in paths)
+
+    assert run_batch(paths, cpp_tree_sitter_repo, language_out)[0].stats is None
+
+
+def test_cli_stats(tmp_path) -> None:
+    (tmp_path / "a.hh").write_bytes(SRC)
+    (tmp_path / "b.hh").write_bytes(b"int i;\n")
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        ret = main(["-i", "-j", "1", "--stats", str(tmp_path)])
+    assert ret == 0
+    stats = json.loads(err.getvalue())
+    assert stats["files"] == 2
+    assert stats["skipped"] == 1
+    assert stats["fixups"]["using_removal"] == 2
+    assert "parse" in stats["stage_seconds"]
@@ -0,0 +1,97 @@
+import io
+import os
+import pickle
+from contextlib import redirect_stderr, redirect_stdout
+
+import pytest
+from tree_sitter import Language, Parser
+
+from remusing_cpp._cli import main
+from remusing_cpp.batch import iter_batch
+from remusing_cpp.core import RemUsing
+from remusing_cpp.symbols import (
+    SymbolMapError,
+    compile_symbol_map,
+    default_namespace_map,
+    layered_namespace_map,
+    load_symbol_map,
+    parse_symbol_map,
+)
+
+SRC = b"string s;\nio_context c;\nWidget w;\n"
+
+
+def test_parse_symbol_map() -> None:
+    lines = ["# comment", "", "  ::std::string", "boost::asio::io_context", "other::string"]
+    assert parse_symbol_map(lines) == {"string": "std", "io_context": "boost::asio"}
+    with pytest.raises(SymbolMapError, match="map:2: expected a qualified name"):
+        parse_symbol_map(["std::string", "string"], "map")
+    with pytest.raises(SymbolMapError):
+        parse_symbol_map(["std::basic string"])
+
+
+def test_load_symbol_map(tmp_path) -> None:
+    text = tmp_path / "project.txt"
+    text.write_text("ui::Widget\nmy::string\n")
+    loaded = load_symbol_map(str(text))
+    assert dict(loaded) == {"Widget": "ui", "string": "my"}
+    # Cached per process until the file changes
+    assert load_symbol_map(str(text)) is loaded
+    with pytest.raises(TypeError):
+        loaded["Widget"] = "other"  # type: ignore[index]
+
+    compiled = tmp_path / "project.map"
+    assert compile_symbol_map([str(text), str(text)], str(compiled)) == 2
+    assert dict(load_symbol_map(str(compiled))) == dict(loaded)
+    text.write_text("ui::Widget\n")
+    os.utime(text, ns=(0, 0))
+    assert dict(load_symbol_map(str(text))) == {"Widget": "ui"}
+
+    layered = layered_namespace_map([str(text), str(compiled)])
+    assert (layered["Widget"], layered["string"], layered["vector"]) == ("ui", "my", "std")
+    assert layered_namespace_map() is default_namespace_map()
+
+    (tmp_path / "broken.map").write_bytes(b"\x80\x05 not a pickle")
+    (tmp_path / "old.map").write_bytes(pickle.dumps(("other", 1, {}), protocol=2))
+    for path in ("broken.map", "old.map", "missing.txt"):
+        with pytest.raises(SymbolMapError):
+            load_symbol_map(str(tmp_path / path))
+
+
+def test_symbol_map_edits(tmp_path, language: Language, parser: Parser) -> None:
+    (tmp_path / "project.txt").write_text("ui::Widget\nboost::asio::io_context\n")
+    remusing = RemUsing(SRC, parser, language)
+    remusing.hardcoded_namespace_map = layered_namespace_map([str(tmp_path / "project.txt")])
+    assert remusing.fix() == b"std::string s;\nboost::asio::io_context c;\nui::Widget w;\n"
+
+
+def test_batch_symbol_maps(tmp_path, language_out, cpp_tree_sitter_repo) -> None:
+    symbol_map = tmp_path / "project.txt"
+    symbol_map.write_text("ui::Widget\n")
+    paths = []
+    for name in ("a.hh", "b.hh"):
+        (tmp_path / name).write_bytes(SRC)
+        paths.append(str(tmp_path / name))
+    results = iter_batch(
+        paths, cpp_tree_sitter_repo, language_out, jobs=2, symbol_maps=[str(symbol_map)]
+    )
+    assert [result.changed for result in results] == [True, True]
+    assert (tmp_path / "b.hh").read_bytes() == b"std::string s;\nio_context c;\nui::Widget w;\n"
+
+
+def test_cli_symbol_map(tmp_path) -> None:
+    text = tmp_path / "project.txt"
+    text.write_text("ui::Widget\n")
+    compiled = str(tmp_path / "project.map")
+    with redirect_stdout(io.StringIO()):
+        assert main(["--symbol-map", str(text), "--compile-symbol-map", compiled]) == 0
+    src = tmp_path / "a.hh"
+    src.write_bytes(SRC)
+    assert main(["-i", "-j", "1", "--symbol-map", compiled, str(src)]) == 0
+    assert src.read_bytes() == b"std::string s;\nio_context c;\nui::Widget w;\n"
+
+    err = io.StringIO()
+    with redirect_stderr(err):
+        assert main(["--symbol-map", str(tmp_path / "missing.txt"), str(src)]) == 1
+        assert main(["--compile-symbol-map", compiled]) == 1
+    assert err.getvalue().startswith("symbol map: ")
@@ -0,0 +1,17 @@
+from tree_sitter import Parser
+
+from remusing_cpp.ts_model import HashableTreeNode
+
+
+def test_hashable_tree_node(parser: Parser) -> None:
+    tree = parser.parse(b"string s; string t;")
+    first, second = (
+        HashableTreeNode(declaration.child_by_field_name("type"))
+        for declaration in tree.root_node.children
+    )
+    again = HashableTreeNode(tree.root_node.children[0].child_by_field_name("type"))
+    assert first.data == b"string"
+    assert first.text == "string"
+    assert first == again and hash(first) == hash(again)
+    assert first != second and first < second
+    assert {first, second, again} == {first, second}
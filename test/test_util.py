@@ -0,0 +1,181 @@
+import mmap
+import os
+from contextlib import contextmanager
+
+import pytest
+
+from remusing_cpp import util
+from remusing_cpp.util import (
+    PREBUILT_GRAMMAR,
+    atomic_open,
+    build_cpp_language,
+    build_cpp_parser,
+    cached_grammar_digest,
+    cpp_language_path,
+    ensure_cpp_language,
+    grammar_digest,
+    load_cpp_language,
+    open_source,
+)
+
+
+def _fake_grammar(root, parser_src: bytes) -> str:
+    src = root / "src"
+    (src / "tree_sitter").mkdir(parents=True)
+    (src / "parser.c").write_bytes(parser_src)
+    (src / "scanner.c").write_bytes(b"/* scanner */")
+    (src / "tree_sitter" / "parser.h").write_bytes(b"/* header */")
+    return str(root)
+
+
+def test_grammar_digest(tmp_path):
+    one = _fake_grammar(tmp_path / "one", b"int a;")
+    two = _fake_grammar(tmp_path / "two", b"int b;")
+    assert grammar_digest(one) == grammar_digest(one)
+    assert grammar_digest(one) != grammar_digest(two)
+
+
+def test_cpp_language_path_stamp(tmp_path):
+    repo = _fake_grammar(tmp_path / "repo", b"int a;")
+    out = str(tmp_path / "lang")
+    path = cpp_language_path(repo, out)
+    assert path == f"{out}-{grammar_digest(repo)[:16]}.so"
+    assert os.path.exists(f"{out}.stamp")
+
+    # A stale stamp is ignored once the sources change
+    parser_c = tmp_path / "repo" / "src" / "parser.c"
+    parser_c.write_bytes(b"int changed;")
+    os.utime(parser_c, ns=(0, 0))
+    assert cpp_language_path(repo, out) == f"{out}-{grammar_digest(repo)[:16]}.so"
+    assert cpp_language_path(repo, out) != path
+
+
+def test_ensure_cpp_language_cached(language_out, cpp_tree_sitter_repo):
+    lib_path = ensure_cpp_language(cpp_tree_sitter_repo, language_out)
+    mtime = os.stat(lib_path).st_mtime_ns
+    assert ensure_cpp_language(cpp_tree_sitter_repo, language_out) == lib_path
+    assert os.stat(lib_path).st_mtime_ns == mtime
+    assert (
+        load_cpp_language(lib_path).version
+        == build_cpp_language(cpp_tree_sitter_repo, language_out).version
+    )
+
+
+def test_ensure_cpp_language_build(tmp_path, monkeypatch):
+    from tree_sitter import Language
+
+    repo = _fake_grammar(tmp_path / "repo", b"int a;")
+    out = str(tmp_path / "lang")
+    lib_path = cpp_language_path(repo, out)
+    built = []
+
+    def build_library(path, repos):
+        built.append(path)
+        with open(path, "wb") as f:
+            f.write(b"library")
+        if len(built) == 2:
+            raise RuntimeError("compiler failed")
+
+    monkeypatch.setattr(Language, "build_library", build_library)
+    assert ensure_cpp_language(repo, out) == lib_path
+    assert built == [f"{lib_path}.{os.getpid()}.tmp"]
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["repo", "lang.stamp", os.path.basename(lib_path), os.path.basename(lib_path) + ".lock"]
+    )
+
+    # A failed build leaves nothing behind
+    os.unlink(lib_path)
+    with pytest.raises(RuntimeError):
+        ensure_cpp_language(repo, out)
+    assert not os.path.exists(lib_path) and not os.path.exists(built[-1])
+
+    # Another process built it while this one waited for the lock
+    @contextmanager
+    def file_lock(path):
+        with open(lib_path, "wb") as f:
+            f.write(b"library")
+        yield
+
+    monkeypatch.setattr(util, "_file_lock", file_lock)
+    assert ensure_cpp_language(repo, out) == lib_path
+    assert len(built) == 2
+
+
+def test_prebuilt_grammar(tmp_path):
+    pytest.importorskip("tree_sitter_cpp")
+    out = str(tmp_path / "ts")
+    assert ensure_cpp_language(PREBUILT_GRAMMAR, out) == PREBUILT_GRAMMAR
+    # Nothing is built or stamped
+    assert os.listdir(tmp_path) == []
+    parser, _ = build_cpp_parser(PREBUILT_GRAMMAR, out)
+    tree = parser.parse(b"using namespace std;\nstring s;\n")
+    assert tree.root_node.children[0].type == "using_declaration"
+    digest = cached_grammar_digest(PREBUILT_GRAMMAR, out)
+    assert len(digest) == 64 and digest == cached_grammar_digest(PREBUILT_GRAMMAR, out)
+
+
+def test_open_source(tmp_path):
+    path = tmp_path / "src.cpp"
+    path.write_bytes(b"string s;")
+    with open_source(str(path)) as src:
+        assert isinstance(src, mmap.mmap)
+        assert src[:] == b"string s;"
+    assert src.closed
+
+    path.write_bytes(b"")
+    with open_source(str(path)) as src:
+        assert src == b""
+
+
+def test_atomic_open(tmp_path, monkeypatch):
+    path = tmp_path / "out.cpp"
+    path.write_bytes(b"old")
+    os.chmod(path, 0o640)
+    with atomic_open(str(path)) as f:
+        f.write(b"new")
+        assert path.read_bytes() == b"old"
+    assert path.read_bytes() == b"new"
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+    with pytest.raises(RuntimeError), atomic_open(str(path)) as f:
+        f.write(b"partial")
+        raise RuntimeError
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["out.cpp"]
+
+    # New files get the mode that open gives them under the umask
+    umask = os.umask(0o027)
+    try:
+        assert util._read_umask() == 0o027
+        monkeypatch.setattr(util, "_NEW_FILE_MODE", 0o666 & ~0o027)
+        with atomic_open(str(tmp_path / "new.cpp")) as f:
+            f.write(b"new")
+        with open(tmp_path / "plain.cpp", "wb"):
+            pass
+    finally:
+        os.umask(umask)
+    assert os.stat(tmp_path / "new.cpp").st_mode & 0o777 == 0o640
+    assert os.stat(tmp_path / "plain.cpp").st_mode & 0o777 == 0o640
+
+
+def test_atomic_open_link(tmp_path, monkeypatch):
+    target = tmp_path / "real" / "out.cpp"
+    target.parent.mkdir()
+    target.write_bytes(b"old")
+    link = tmp_path / "link.cpp"
+    link.symlink_to(target)
+    chowned = []
+    monkeypatch.setattr(os, "chown", lambda path, uid, gid: chowned.append((uid, gid)))
+    with atomic_open(str(link)) as f:
+        f.write(b"new")
+    assert link.is_symlink() and target.read_bytes() == b"new"
+    assert chowned == [(os.stat(target).st_uid, os.stat(target).st_gid)]
+
+    def deny(path, uid, gid):
+        raise PermissionError(path)
+
+    # The owner is only kept where the process is allowed to
+    monkeypatch.setattr(os, "chown", deny)
+    with atomic_open(str(link)) as f:
+        f.write(b"newer")
+    assert target.read_bytes() == b"newer"
@@ -0,0 +1,122 @@
+import ast
+from pathlib import Path
+from typing import List
+
+import pytest
+from tree_sitter import Language, Parser
+
+from remusing_cpp.bench import generate_source
+from remusing_cpp.core import WALKER_ENGINE, RemUsing
+from remusing_cpp.walker import TreeWalker
+
+TEST_DIR = Path(__file__).resolve().parent
+
+
+def existing_sources() -> List[bytes]:
+    """
+    Collect the C++ sources used throughout the test suite: the data files,
+    bytes literals and `bytes("...", "utf8")` calls in the test modules. The
+    shadowing examples of this module are left out, since the engines differ
+    on those by design.
+    """
+    sources = [path.read_bytes() for path in sorted((TEST_DIR / "data").iterdir())]
+    for path in sorted(TEST_DIR.glob("test_*.py")):
+        if path.name == Path(__file__).name:
+            continue
+        for node in ast.walk(ast.parse(path.read_text())):
+            if isinstance(node, ast.Constant) and isinstance(node.value, bytes):
+                sources.append(node.value)
+            elif (
+                isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Name)
+                and node.func.id == "bytes"
+                and node.args
+                and isinstance(node.args[0], ast.Constant)
+                and isinstance(node.args[0].value, str)
+            ):
+                sources.append(node.args[0].value.encode("utf8"))
+    return sorted(set(sources))
+
+
+SOURCES = existing_sources() + [
+    generate_source(8192, density, seed) for density in (0.0, 0.5, 1.0) for seed in range(3)
+]
+# Unnamed and qualified declarators, explicit template arguments and a
+# qualified name that is cut off
+SOURCES += [
+    b"using namespace std;\nint ns::count = 0;\nvoid f(string*) { make_pair<int, int>(1, 2); }\n",
+    b"using namespace std;\nstd:: string s;\nvector<int> v = std::\n",
+]
+
+
+def walker_remusing(src: bytes, parser: Parser, language: Language) -> RemUsing:
+    remusing = RemUsing(src, parser, language)
+    remusing.engine = WALKER_ENGINE
+    return remusing
+
+
+@pytest.mark.parametrize("src", SOURCES)
+def test_walker_matches_query(src: bytes, language: Language, parser: Parser) -> None:
+    query_remusing = RemUsing(src, parser, language)
+    query_remusing.query()
+    query_store = query_remusing._capture_store
+    assert query_store is not None and query_remusing._tree is not None
+
+    walker = TreeWalker(
+        query_remusing.types_query, query_remusing.symbols_query, query_remusing.using_query
+    )
+    walker.shadowing = False
+    walker_store = walker.walk(query_remusing._tree, src)
+    for name in set(query_store.names).union(walker_store.names):
+        assert list(query_store.spans(name)) == list(walker_store.spans(name)), name
+
+    assert walker_remusing(src, parser, language).fix() == RemUsing(src, parser, language).fix()
+
+
+def test_existing_sources() -> None:
+    assert len(existing_sources()) > 20
+    assert any(b"using namespace std;" in src for src in existing_sources())
+
+
+def test_walker_parameter_shadowing(language: Language, parser: Parser) -> None:
+    src = b"""using namespace std;
+void f(int hex, const string &endl) { cout << hex << endl; }
+void g(int hex);
+void h() { cout << hex; for (int min : v) { min(1, 2); } min(1, 2); }
+"""
+    expected = b"""void f(int hex, const std::string &endl) { std::cout << hex << endl; }
+void g(int hex);
+void h() { std::cout << std::hex; for (int min : v) { min(1, 2); } std::min(1, 2); }
+"""
+    assert walker_remusing(src, parser, language).fix() == expected
+    assert b"std::cout << std::hex << std::endl" in RemUsing(src, parser, language).fix()
+
+
+def test_walker_local_shadowing(language: Language, parser: Parser) -> None:
+    src = b"""using namespace std;
+namespace mine {
+class string { list<int> l; void m() { cout << l; } };
+string s;
+}
+string t;
+int main() { ostream &cout = get(); cout << hex; auto f = [](int hex) { return hex; }; }
+"""
+    expected = b"""namespace mine {
+class string { std::list<int> l; void m() { std::cout << l; } };
+string s;
+}
+std::string t;
+int main() { std::ostream &cout = get(); cout << std::hex; auto f = [](int hex) { return hex; }; }
+"""
+    assert walker_remusing(src, parser, language).fix() == expected
+
+
+def test_walker_apply_text_edit(language: Language, parser: Parser) -> None:
+    src = b"using namespace std;\nvoid f(int x) { cout << x; }\n"
+    remusing = walker_remusing(src, parser, language)
+    assert remusing.fix() == b"void f(int x) { std::cout << x; }\n"
+    start = src.index(b"int x") + len(b"int ")
+    remusing.apply_text_edit(start, start + 1, b"hex")
+    start = src.index(b"<< x") + len(b"<< ")
+    remusing.apply_text_edit(start + 2, start + 3, b"hex")
+    assert remusing.fix() == b"void f(int hex) { std::cout << hex; }\n"